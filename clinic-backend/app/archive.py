@@ -0,0 +1,72 @@
+# archive.py
+# ย้ายนัดหมายที่ผ่านไปนานกว่า ARCHIVE_AFTER_DAYS จาก appointments ไป appointments_archive
+# ตาราง appointments (ที่การจอง / นับที่นั่ง / รายการปกติใช้) จึงมีเฉพาะข้อมูลช่วงหลังและอนาคต
+# - ย้ายทีละ ARCHIVE_BATCH_SIZE แถวต่อ transaction (INSERT ... SELECT แล้ว DELETE) ไม่ล็อกตารางนาน
+# - ใช้ Core ไม่ผ่าน ORM: ตารางสรุปรายวัน (reports.py) ไม่เปลี่ยน เพราะนับทั้งสองตารางรวมกัน
+# - อ่านประวัติด้วย ?history=true (crud.get_appointments) ค่าเริ่มต้นอ่านเฉพาะ appointments
+# ใช้: python -m app.manage archive-appointments [--days N] (ตั้งเป็น cron)
+import os
+from datetime import date, datetime, timedelta
+from typing import Optional
+from sqlalchemy import DateTime, delete, insert, literal, select, text
+from sqlalchemy.orm import Session
+from . import models
+
+ARCHIVE_AFTER_DAYS = int(os.getenv("ARCHIVE_AFTER_DAYS", "180"))
+ARCHIVE_BATCH_SIZE = int(os.getenv("ARCHIVE_BATCH_SIZE", "1000"))
+
+# ย้ายทุกคอลัมน์ของ appointments (id เดิม)
+COLUMNS = [c.name for c in models.Appointment.__table__.columns]
+
+def reuses_ids(conn) -> bool:
+    """
+    SQLite: ตาราง appointments ที่สร้างก่อนมี AUTOINCREMENT นำ id สูงสุดที่ถูกลบ (ย้ายไปแล้ว) กลับมาใช้
+    นัดใหม่จึงอาจได้ id ซ้ำกับแถวใน appointments_archive (init-db สร้างตารางใหม่ให้)
+    """
+    if conn.dialect.name != "sqlite":
+        return False
+    sql = conn.execute(text("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'appointments'")).scalar()
+    return sql is not None and "AUTOINCREMENT" not in sql.upper()
+
+def cutoff(days: Optional[int] = None) -> date:
+    return date.today() - timedelta(days=ARCHIVE_AFTER_DAYS if days is None else days)
+
+def archive_batch(db: Session, before: date, batch_size: int = ARCHIVE_BATCH_SIZE) -> int:
+    """ย้ายนัดหมายก่อนวันที่ before หนึ่ง batch (หนึ่ง transaction) คืนจำนวนแถวที่ย้าย"""
+    A = models.Appointment.__table__
+    Archive = models.ArchivedAppointment.__table__
+    ids = db.execute(
+        select(A.c.id)
+        .where(A.c.appointment_date < before)
+        .order_by(A.c.appointment_date, A.c.id)
+        .limit(batch_size)
+        .with_for_update(skip_locked=True)  # PostgreSQL: ข้ามแถวที่กำลังถูกแก้อยู่ รอบหน้าค่อยย้าย
+    ).scalars().all()
+    if not ids:
+        db.rollback()
+        return 0
+    archived_at = literal(datetime.utcnow(), DateTime)
+    db.execute(
+        insert(Archive).from_select(
+            COLUMNS + ["archived_at"],
+            select(*(A.c[name] for name in COLUMNS), archived_at).where(A.c.id.in_(ids)),
+        )
+    )
+    db.execute(delete(A).where(A.c.id.in_(ids)))
+    db.commit()
+    return len(ids)
+
+def archive(db: Session, days: Optional[int] = None, batch_size: int = ARCHIVE_BATCH_SIZE, max_batches: Optional[int] = None) -> int:
+    """ย้ายจนหมด (หรือครบ max_batches) คืนจำนวนแถวทั้งหมดที่ย้าย"""
+    if reuses_ids(db.connection()):
+        db.rollback()
+        raise RuntimeError("appointments ยังไม่มี AUTOINCREMENT (SQLite) รัน python -m app.manage init-db ก่อน archive")
+    before = cutoff(days)
+    moved, batches = 0, 0
+    while max_batches is None or batches < max_batches:
+        count = archive_batch(db, before, batch_size)
+        moved += count
+        batches += 1
+        if count < batch_size:
+            break
+    return moved
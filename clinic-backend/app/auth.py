@@ -1,17 +1,35 @@
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from jose import jwt, JWTError
-from app.database import get_db
-from app import crud
+from app.database import SessionLocal, AsyncSessionLocal, async_replica_engine, get_db, get_read_db, get_async_db, get_async_read_db
+from app import crud, schemas, hashing
+from app.cache import MemoryCache, make_cache
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from datetime import datetime, timedelta
+import hashlib
 import os
+import secrets
+import time
 from dotenv import load_dotenv
 
 load_dotenv()
 SECRET_KEY = os.getenv("SECRET_KEY", "dev_secret_key")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
+REFRESH_TOKEN_EXPIRE_DAYS = int(os.getenv("REFRESH_TOKEN_EXPIRE_DAYS", "30"))
+TOKEN_CACHE_MAXSIZE = int(os.getenv("TOKEN_CACHE_MAXSIZE", "10000"))
+USER_CACHE_TTL_SECONDS = int(os.getenv("USER_CACHE_TTL_SECONDS", "60"))
+USER_CACHE_MAXSIZE = int(os.getenv("USER_CACHE_MAXSIZE", "10000"))
+# อีเมลของเจ้าหน้าที่ (คั่นด้วย ,) ใช้กับ route สำหรับเจ้าหน้าที่
+STAFF_EMAILS = {e.strip().lower() for e in os.getenv("STAFF_EMAILS", "").split(",") if e.strip()}
+
+# cache user_id -> snapshot ของ user (schemas.UserResponse ในรูป dict)
+user_cache = make_cache("users", maxsize=USER_CACHE_MAXSIZE, ttl=USER_CACHE_TTL_SECONDS)
+
+# sha256(access token) -> user_id ของ token ที่ตรวจลายเซ็นแล้ว หมดอายุพร้อม exp ของ token
+# เก็บใน process เสมอ (การตรวจ JWT เร็วกว่าไปถาม redis)
+token_cache = MemoryCache(maxsize=TOKEN_CACHE_MAXSIZE, ttl=ACCESS_TOKEN_EXPIRE_MINUTES * 60)
 
 # tokenUrl ต้องตรงกับ /users/login
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/login")
@@ -23,24 +41,113 @@ def create_access_token(data: dict, expires_delta: timedelta | None = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
+def hash_token(token: str) -> str:
+    return hashlib.sha256(token.encode()).hexdigest()
+
+def new_refresh_token():
+    """คืน (token ที่ส่งให้ client, hash ที่เก็บใน DB, วันหมดอายุ)"""
+    token = secrets.token_urlsafe(32)
+    return token, hash_token(token), datetime.utcnow() + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS)
+
 def verify_password(plain_password: str, hashed_password: str) -> bool:
-    from passlib.hash import bcrypt
-    return bcrypt.verify(plain_password, hashed_password)
+    return hashing.verify_sync(plain_password, hashed_password)
 
-def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
-    credentials_exception = HTTPException(
+def _credentials_exception():
+    return HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
+
+def decode_user_id(token: str) -> int:
+    # token เดิมถูกส่งมาซ้ำทุก request: ตรวจลายเซ็นครั้งเดียวแล้วจำไว้จนหมดอายุ
+    key = hash_token(token)
+    cached = token_cache.get(key)
+    if cached is not None:
+        return cached
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         user_id: str = payload.get("sub")
         if user_id is None:
-            raise credentials_exception
-    except JWTError:
-        raise credentials_exception
-    user = crud.get_user_by_id(db, int(user_id))
+            raise _credentials_exception()
+        user_id = int(user_id)
+    except (JWTError, ValueError):
+        raise _credentials_exception()
+    ttl = payload.get("exp", 0) - time.time()
+    if ttl > 0:
+        token_cache.set(key, user_id, ttl=ttl)
+    return user_id
+
+def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+    """คืน ORM object ของ user ใช้กับ route ที่ต้องแก้ไข/ลบ user"""
+    user = crud.get_user_by_id(db, decode_user_id(token))
+    if user is None:
+        raise _credentials_exception()
+    return user
+
+def get_current_user_cached(token: str = Depends(oauth2_scheme), db: Session = Depends(get_read_db)) -> schemas.UserResponse:
+    """
+    คืน snapshot ของ user (อ่านอย่างเดียว) จาก cache
+    ไม่ query ฐานข้อมูลเมื่อ cache มีข้อมูลอยู่แล้ว
+    """
+    user_id = decode_user_id(token)
+    cached = user_cache.get(user_id)
+    if cached is not None:
+        return schemas.UserResponse.model_validate(cached)
+
+    user = crud.get_user_by_id(db, user_id)
+    if user is None and db.info.get("read_only"):
+        # replica อาจยังไม่มี user ที่เพิ่งสมัคร ลองอ่านจาก primary ด้วย session แยก
+        # (session นี้ถูกใช้ต่อทั้ง request: ไม่เปลี่ยนให้ไปอ่าน primary)
+        with SessionLocal() as primary:
+            user = crud.get_user_by_id(primary, user_id)
+    if user is None:
+        raise _credentials_exception()
+    return _cache_snapshot(user)
+
+def _cache_snapshot(user) -> schemas.UserResponse:
+    snapshot = schemas.UserResponse.model_validate(user)
+    user_cache.set(user.id, snapshot.model_dump(mode="json"))
+    return snapshot
+
+# ---------------- Async ----------------
+# ใช้กับ route แบบ async def: session เดียวกับ route (FastAPI ใช้ dependency ซ้ำภายใน request)
+async def get_current_user_async(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_async_db)):
+    """เหมือน get_current_user"""
+    user = await crud.get_user_by_id_async(db, decode_user_id(token))
     if user is None:
-        raise credentials_exception
+        raise _credentials_exception()
     return user
+
+async def get_current_user_cached_async(
+    token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_async_read_db),
+) -> schemas.UserResponse:
+    """เหมือน get_current_user_cached"""
+    user_id = decode_user_id(token)
+    cached = user_cache.get(user_id)
+    if cached is not None:
+        return schemas.UserResponse.model_validate(cached)
+
+    user = await crud.get_user_by_id_async(db, user_id)
+    if user is None and async_replica_engine is not None:
+        # replica อาจยังไม่มี user ที่เพิ่งสมัคร
+        async with AsyncSessionLocal() as primary:
+            user = await crud.get_user_by_id_async(primary, user_id)
+    if user is None:
+        raise _credentials_exception()
+    return _cache_snapshot(user)
+
+def is_staff(user) -> bool:
+    return user.email.lower() in STAFF_EMAILS
+
+def get_current_staff(current_user: schemas.UserResponse = Depends(get_current_user_cached)) -> schemas.UserResponse:
+    if not is_staff(current_user):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="สำหรับเจ้าหน้าที่เท่านั้น")
+    return current_user
+
+async def get_current_staff_async(current_user: schemas.UserResponse = Depends(get_current_user_cached_async)) -> schemas.UserResponse:
+    """เหมือน get_current_staff"""
+    return get_current_staff(current_user)
+
+def invalidate_user(user_id: int):
+    user_cache.delete(user_id)
\ No newline at end of file
@@ -0,0 +1,110 @@
+# availability.py
+# เวลาว่างรายวันของหมอแต่ละคน พร้อม cache ใน process
+# ผู้ป่วยเปิดดูปฏิทินบ่อยกว่าจองมาก จึง cache ผลต่อวันไว้ และล้างเฉพาะวันที่มีการเปลี่ยนแปลง
+import threading
+import time as _time
+from datetime import date, timedelta
+from typing import Dict, List, Optional
+from fastapi import HTTPException
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from . import models, slots, schedules
+
+MAX_RANGE_DAYS = 62
+CACHE_TTL_SECONDS = 30  # กันข้อมูลค้างเมื่อมีหลาย worker (แต่ละ worker มี cache ของตัวเอง)
+MAX_CACHED_DAYS = 1000
+
+# date -> (หมดอายุเมื่อ, version ของตารางหมอ, {doctor_id: {slot: [เวลาว่าง]}})
+_cache: Dict[date, tuple] = {}
+# เพิ่มทุกครั้งที่ล้าง: ผลที่เริ่มโหลดก่อนการล้างจะไม่ถูกเก็บ (อาจอ่านก่อนการจองที่เพิ่ง commit)
+_generations: Dict[date, int] = {}
+_epoch = 0  # เพิ่มเมื่อ clear()
+_lock = threading.Lock()
+
+def invalidate(*days: date):
+    with _lock:
+        for day in days:
+            _cache.pop(day, None)
+            _generations[day] = _generations.get(day, 0) + 1
+        if len(_generations) > MAX_CACHED_DAYS:
+            # วันที่ผ่านไปแล้วไม่มีการจองใหม่ ไม่ต้องจำต่อ
+            yesterday = date.today() - timedelta(days=1)
+            for day in [d for d in _generations if d < yesterday]:
+                del _generations[day]
+
+def clear():
+    global _epoch
+    with _lock:
+        _cache.clear()
+        _epoch += 1
+
+def _load(db: Session, days: List[date], doctors):
+    # query เดียวสำหรับทุกวันที่ยังไม่มีใน cache: นับจำนวนที่จองแล้วต่อ (หมอ, วัน, slot, เวลา)
+    A = models.Appointment
+    rows = db.query(
+        A.doctor_id, A.appointment_date, A.time_slot, A.appointment_time, func.count(A.id).label("booked"),
+    ).filter(
+        A.appointment_date >= min(days),
+        A.appointment_date <= max(days),
+        A.doctor_id.isnot(None),
+    ).group_by(A.doctor_id, A.appointment_date, A.time_slot, A.appointment_time).all()
+    booked = {(r.doctor_id, r.appointment_date, r.time_slot, r.appointment_time): r.booked for r in rows}
+
+    result = {}
+    for day in days:
+        result[day] = {
+            doctor.id: {
+                slot: [
+                    t for t, capacity in doctor.times(day, slot)
+                    if booked.get((doctor.id, day, slot, t), 0) < capacity
+                ]
+                for slot in slots.SLOT_TIMES
+                if doctor.times(day, slot)
+            }
+            for doctor in doctors
+        }
+    return result
+
+def get_availability(db: Session, date_from: date, date_to: date, doctor_id: Optional[int] = None, store: bool = True):
+    """เวลาว่างต่อวันต่อหมอ (เฉพาะหมอที่ออกตรวจในวันนั้น) store=False: อ่าน cache ได้แต่ไม่เก็บผลที่โหลดใหม่"""
+    if date_to < date_from:
+        raise HTTPException(status_code=400, detail="ช่วงวันที่ไม่ถูกต้อง")
+    if (date_to - date_from).days + 1 > MAX_RANGE_DAYS:
+        raise HTTPException(status_code=400, detail=f"ดูได้ไม่เกิน {MAX_RANGE_DAYS} วัน")
+
+    doctors = schedules.all_doctors(db)
+    version = schedules.version(db)
+    days = [date_from + timedelta(days=i) for i in range((date_to - date_from).days + 1)]
+    now = _time.monotonic()
+    found = {}
+    with _lock:
+        for day in days:
+            entry = _cache.get(day)
+            # ตารางหมอเปลี่ยนแล้ว ผลเดิมใช้ไม่ได้
+            if entry and entry[0] > now and entry[1] == version:
+                found[day] = entry[2]
+        missing = [day for day in days if day not in found]
+        # จำ generation ก่อนโหลด
+        epoch = _epoch
+        generations = {day: _generations.get(day, 0) for day in missing}
+
+    if missing:
+        loaded = _load(db, missing, doctors)
+        found.update(loaded)
+        if store:
+            with _lock:
+                for day, value in loaded.items():
+                    # ถูกล้างระหว่างโหลด: ผลนี้อาจเก่ากว่าการจองที่เพิ่ง commit ไม่เก็บ
+                    if _epoch != epoch or _generations.get(day, 0) != generations[day]:
+                        continue
+                    _cache[day] = (now + CACHE_TTL_SECONDS, version, value)
+                # ตัดวันที่เก่าที่สุด (ตามวันที่ ไม่ใช่ลำดับที่เก็บ) ทิ้งเมื่อ cache ใหญ่เกินไป
+                while len(_cache) > MAX_CACHED_DAYS:
+                    _cache.pop(min(_cache))
+
+    return [
+        {"date": day, "doctor": doctor.name, "slots": found[day][doctor.id]}
+        for day in days
+        for doctor in doctors
+        if (doctor_id is None or doctor.id == doctor_id) and found[day].get(doctor.id)
+    ]
@@ -0,0 +1,113 @@
+# cache.py
+# key/value cache แบบมี TTL ที่เปลี่ยน backend ได้
+# - memory:      LRU ใน process (worker เดียว)
+# - redis://...  ใช้ร่วมกันหลาย worker (ต้องติดตั้ง redis)
+# - local-redis  ตัวแทน redis ใน process ไว้ทดสอบ (เก็บแบบ JSON เหมือน redis จริง)
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from dotenv import load_dotenv
+
+load_dotenv()
+
+class MemoryCache:
+    def __init__(self, maxsize: int = 10000, ttl: float = 60):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()  # key -> (หมดอายุเมื่อ, value)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return entry[1]
+
+    def set(self, key, value, ttl: float = None):
+        expires_at = time.monotonic() + (ttl if ttl is not None else self.ttl)
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class RedisCache:
+    """ค่าที่เก็บต้องแปลงเป็น JSON ได้"""
+
+    def __init__(self, client, prefix: str, ttl: float = 60):
+        self.client = client
+        self.prefix = prefix
+        self.ttl = ttl
+
+    def get(self, key):
+        raw = self.client.get(f"{self.prefix}{key}")
+        return json.loads(raw) if raw is not None else None
+
+    def set(self, key, value, ttl: float = None):
+        seconds = max(1, int(ttl if ttl is not None else self.ttl))
+        self.client.set(f"{self.prefix}{key}", json.dumps(value, default=str), ex=seconds)
+
+    def delete(self, key):
+        self.client.delete(f"{self.prefix}{key}")
+
+    def clear(self):
+        for key in self.client.scan_iter(f"{self.prefix}*"):
+            self.client.delete(key)
+
+
+class LocalRedis:
+    """client จำลองที่มีเฉพาะคำสั่งที่ RedisCache ใช้"""
+
+    def __init__(self):
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[0] <= time.monotonic():
+                self._data.pop(key, None)
+                return None
+            return entry[1]
+
+    def set(self, key, value, ex: int = None):
+        expires_at = time.monotonic() + ex if ex else float("inf")
+        with self._lock:
+            self._data[key] = (expires_at, value.encode() if isinstance(value, str) else value)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def scan_iter(self, pattern: str):
+        prefix = pattern.rstrip("*")
+        with self._lock:
+            return [key for key in self._data if key.startswith(prefix)]
+
+
+CACHE_URL = os.getenv("CACHE_URL", "memory")
+_local_redis = LocalRedis()
+
+def make_cache(name: str, maxsize: int = 10000, ttl: float = 60):
+    if CACHE_URL.startswith("redis://") or CACHE_URL.startswith("rediss://"):
+        import redis
+        return RedisCache(redis.Redis.from_url(CACHE_URL), prefix=f"clinic:{name}:", ttl=ttl)
+    if CACHE_URL == "local-redis":
+        return RedisCache(_local_redis, prefix=f"clinic:{name}:", ttl=ttl)
+    return MemoryCache(maxsize=maxsize, ttl=ttl)
\ No newline at end of file
@@ -1,9 +1,17 @@
 # crud.py
-from datetime import datetime, timedelta
+from contextlib import nullcontext
+from datetime import datetime, date, time
+from typing import Optional
 from fastapi import HTTPException, status
+from sqlalchemy import select, tuple_, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from . import models, schemas
+from . import models, schemas, schedules, slots, availability, hashing, idempotency, live, reports, jobs, patient_search  # reports / patient_search: listener ของ ORM
+import base64
 import re
+import secrets
 
 # ---------------- Users ----------------
 def get_user_by_email(db: Session, email: str):
@@ -13,20 +21,64 @@ def get_user_by_id(db: Session, user_id: int):
     return db.query(models.User).filter(models.User.id == user_id).first()
 
 def create_user(db: Session, user: schemas.UserCreate):
-    from passlib.hash import bcrypt
+    db_user = _insert_user(db, _user_values(user.username, user.email, hashing.hash_sync(user.password)))
+    if db_user is None:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="ชื่อผู้ใช้หรืออีเมลนี้มีอยู่แล้ว")
+    return db_user
+
+# INSERT ครั้งเดียวแล้วให้ unique constraint ของ username / email ตัดสิน (ไม่ query ตรวจก่อน จึงไม่มี race)
+USERNAME_MAX_LENGTH = 20  # ตาม schemas.UserCreate
+USERNAME_PROBE_SIZE = 20
 
-    # ตรวจอีเมลซ้ำ
-    existing_user = db.query(models.User).filter(models.User.email == user.email).first()
-    if existing_user:
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Email already registered")
+def _user_values(username: str, email: str, password: Optional[str], **profile):
+    return dict(username=username, email=email, password=password, **profile)
+
+def _insert_user_stmt(db, values: dict):
+    """INSERT ... ON CONFLICT DO NOTHING RETURNING (ไม่ได้แถวกลับมา = ชนกับผู้ใช้ที่มีอยู่) หรือ None ถ้า dialect ไม่รองรับ"""
+    dialect_insert = {"postgresql": postgresql.insert, "sqlite": sqlite.insert}.get(db.get_bind().dialect.name)
+    if dialect_insert is None:
+        return None
+    return dialect_insert(models.User).values(**values).on_conflict_do_nothing().returning(models.User)
 
-    hashed_password = bcrypt.hash(user.password)
-    db_user = models.User(username=user.username, email=user.email, password=hashed_password)
-    db.add(db_user)
+def _insert_user(db: Session, values: dict) -> Optional[models.User]:
+    """คืน User ที่สร้าง หรือ None ถ้า username / email ซ้ำ"""
+    stmt = _insert_user_stmt(db, values)
+    if stmt is None:
+        db_user = models.User(**values)
+        db.add(db_user)
+        try:
+            db.commit()
+        except IntegrityError:
+            db.rollback()
+            return None
+        db.refresh(db_user)
+        return db_user
+    db_user = db.scalars(stmt).first()
+    if db_user is None:
+        db.rollback()
+        return None
+    patient_search.user_saved(db, db_user)  # ไม่ผ่าน unit of work: listener ของ mapper ไม่ทำงาน
     db.commit()
-    db.refresh(db_user)
     return db_user
 
+def _username_candidates(email: str):
+    """
+    username จากส่วนหน้าของอีเมล: ตัวเดิม, ต่อท้าย 1..N-1 แล้วตามด้วยเลขสุ่มอีกชุด
+    ตรวจทั้งชุดด้วย query เดียว (username IN (...)) แทนการลองทีละชื่อ
+    """
+    base = re.sub(r'[^a-zA-Z0-9]', '', email.split('@')[0]) or "user"
+    if len(base) < 3:
+        base += "user"
+    suffixes = [str(n) for n in range(1, USERNAME_PROBE_SIZE)]
+    suffixes += [str(100000 + secrets.randbelow(900000)) for _ in range(5)]
+    return [base[:USERNAME_MAX_LENGTH]] + [base[:USERNAME_MAX_LENGTH - len(s)] + s for s in suffixes]
+
+def _free_username(candidates, taken) -> str:
+    return next((name for name in candidates if name not in taken), candidates[-1])
+
+def _username_probe(candidates):
+    return select(models.User.username).where(models.User.username.in_(candidates))
+
 def update_user(db: Session, user_id: int, user_update: schemas.UserUpdate):
     user = get_user_by_id(db, user_id)
     if not user:
@@ -38,73 +90,147 @@ def update_user(db: Session, user_id: int, user_update: schemas.UserUpdate):
     return user
 
 def delete_user(db: Session, user_id: int):
+    """ลบผู้ใช้ นัดหมายถูกลบตาม (cascade) จึงแจ้งยกเลิกและคืนที่ว่างเหมือนยกเลิกทีละนัด"""
     user = get_user_by_id(db, user_id)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
+    released = []
+    for appointment in user.appointments:
+        jobs.appointment_cancelled(db, appointment)
+        released.append(live.released(appointment.appointment_date, appointment.doctor_name, appointment.time_slot))
     db.delete(user)
     db.commit()
+    availability.invalidate(*{change[0] for change in released})
+    live.publish(*released)
 
 # ---------------- Appointments ----------------
 # ---------------- Create ----------------
 def create_appointment(db: Session, user_id: int, appointment: schemas.AppointmentCreate):
-    # คำนวณเวลาใน slot
-    existing_count = (
-        db.query(models.Appointment)
-        .filter(
-            models.Appointment.appointment_date == appointment.appointment_date,
-            models.Appointment.time_slot == appointment.time_slot
-        ).count()
-    )
-
-    start_time = datetime.strptime("08:00", "%H:%M") if appointment.time_slot == "เช้า" else datetime.strptime("13:00", "%H:%M")
-    appointment_time = (start_time + timedelta(minutes=30 * existing_count)).time()
-
     db_appointment = models.Appointment(
         user_id=user_id,
-        doctor_name="หมอประจำ",
-        appointment_date=appointment.appointment_date,
-        appointment_time=appointment_time,
-        time_slot=appointment.time_slot,
         reason=appointment.reason,
         status="รอการยืนยัน",
         created_at=datetime.utcnow(),
         updated_at=datetime.utcnow()
     )
-    db.add(db_appointment)
+    # จองเวลาในตารางของหมอ (ดู schedules.py / slots.py)
+    schedules.book(db, db_appointment, appointment.appointment_date, appointment.time_slot, appointment.doctor_name)
+    jobs.appointment_booked(db, db_appointment)
+    if "idempotency_record" in db.info:
+        # route จอง Idempotency-Key ไว้แล้ว (idempotency.begin): เก็บคำตอบใน transaction เดียวกัน
+        idempotency.finish(db, schemas.AppointmentOut.model_validate(db_appointment).model_dump(mode="json"))
     db.commit()
     db.refresh(db_appointment)
+    availability.invalidate(db_appointment.appointment_date)
+    live.publish(live.booked(db_appointment))
     return db_appointment
 
 # ---------------- Read ----------------
-def get_appointments(db: Session):
-    return db.query(models.Appointment).all()
+MAX_PAGE_SIZE = 200
+
+# คอลัมน์เดียวกับ schemas.AppointmentOut
+APPOINTMENT_COLUMNS = [
+    "id", "user_id", "doctor_name", "appointment_date", "appointment_time",
+    "time_slot", "reason", "status", "created_at", "updated_at",
+]
+
+def encode_cursor(appointment: models.Appointment) -> str:
+    raw = f"{appointment.appointment_date.isoformat()}|{appointment.appointment_time.isoformat()}|{appointment.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def decode_cursor(cursor: str):
+    try:
+        raw_date, raw_time, raw_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return date.fromisoformat(raw_date), time.fromisoformat(raw_time), int(raw_id)
+    except (ValueError, UnicodeDecodeError):
+        raise HTTPException(status_code=400, detail="cursor ไม่ถูกต้อง")
+
+def get_appointments(
+    db: Session,
+    limit: int = 50,
+    cursor: Optional[str] = None,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    status: Optional[str] = None,
+    doctor_name: Optional[str] = None,
+    user_id: Optional[int] = None,
+    as_dicts: bool = False,
+    history: bool = False,
+):
+    """
+    keyset pagination เรียงตาม (appointment_date, appointment_time, id)
+    คืน (รายการ, next_cursor) โดย next_cursor เป็น None เมื่อถึงหน้าสุดท้าย
+    as_dicts=True: query เฉพาะคอลัมน์ (ไม่สร้าง ORM object) และคืนรายการเป็น dict
+    history=True: รวมนัดหมายที่ย้ายไป appointments_archive แล้ว (ดู archive.py)
+    """
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    after = decode_cursor(cursor) if cursor else None
+
+    def page(A):
+        query = db.query(*[getattr(A, c) for c in APPOINTMENT_COLUMNS]) if as_dicts else db.query(A)
+        if user_id is not None:
+            query = query.filter(A.user_id == user_id)
+        if date_from is not None:
+            query = query.filter(A.appointment_date >= date_from)
+        if date_to is not None:
+            query = query.filter(A.appointment_date <= date_to)
+        if status is not None:
+            query = query.filter(A.status == status)
+        if doctor_name is not None:
+            query = query.filter(A.doctor_name == doctor_name)
+        if after:
+            query = query.filter(tuple_(A.appointment_date, A.appointment_time, A.id) > after)
+        # ดึงเกินมา 1 แถวเพื่อรู้ว่ามีหน้าถัดไปหรือไม่ โดยไม่ต้อง count()
+        return query.order_by(A.appointment_date, A.appointment_time, A.id).limit(limit + 1).all()
+
+    rows = page(models.Appointment)
+    if history:
+        # id ไม่ซ้ำกันระหว่างสองตาราง: รวมสองหน้าแล้วเรียงใหม่
+        rows = sorted(rows + page(models.ArchivedAppointment), key=lambda a: (a.appointment_date, a.appointment_time, a.id))
+        rows = rows[:limit + 1]
+    items = rows[:limit]
+    next_cursor = encode_cursor(items[-1]) if len(rows) > limit else None
+    if as_dicts:
+        items = [row._asdict() for row in items]
+    return items, next_cursor
 
 def get_appointment(db: Session, appointment_id: int):
     return db.query(models.Appointment).filter(models.Appointment.id == appointment_id).first()
 
 # ---------------- Update ----------------
+def _new_doctor(appointment: models.Appointment, doctor_name: Optional[str]) -> Optional[str]:
+    """ชื่อหมอที่ขอเปลี่ยนไป None = หมอเดิม (จองต่อด้วย doctor_id ที่ผูกไว้ ไม่หาใหม่ตามชื่อ)"""
+    return doctor_name if doctor_name and doctor_name != appointment.doctor_name else None
+
+def _moves(appointment: models.Appointment, appointment_date: Optional[date], time_slot: Optional[str], doctor_name: Optional[str]) -> bool:
+    """
+    วัน / ช่วงเวลา / หมอที่ส่งมาต่างจากที่นัดไว้หรือไม่
+    หน้าเว็บส่ง time_slot มาทุกครั้งแม้แก้แค่เหตุผล ถ้าค่าเท่าเดิมต้องไม่จองใหม่ (ไม่ย้ายไปที่นั่งที่ว่างก่อนหน้า)
+    """
+    return (
+        (appointment_date is not None and appointment_date != appointment.appointment_date)
+        or (time_slot is not None and time_slot != appointment.time_slot)
+        or _new_doctor(appointment, doctor_name) is not None
+    )
+
 def update_appointment(db: Session, appointment_id: int, user_id: int, update: schemas.AppointmentUpdate):
     appointment = get_appointment(db, appointment_id)
     if not appointment or appointment.user_id != user_id:
         return None
 
-    if update.appointment_date or update.time_slot:
+    old_date = appointment.appointment_date
+    old_key = (appointment.appointment_date, appointment.doctor_name, appointment.time_slot)
+    if _moves(appointment, update.appointment_date, update.time_slot, update.doctor_name):
         new_date = update.appointment_date or appointment.appointment_date
         new_slot = update.time_slot or appointment.time_slot
 
-        existing_count = db.query(models.Appointment)\
-            .filter(
-                models.Appointment.appointment_date == new_date,
-                models.Appointment.time_slot == new_slot,
-                models.Appointment.id != appointment.id
-            ).count()
-
-        start_time = datetime.strptime("08:00", "%H:%M") if new_slot == "เช้า" else datetime.strptime("13:00", "%H:%M")
-        appointment_time = (start_time + timedelta(minutes=30 * existing_count)).time()
-
-        appointment.appointment_date = new_date
-        appointment.time_slot = new_slot
-        appointment.appointment_time = appointment_time
+        old_time = appointment.appointment_time
+        schedules.book(
+            db, appointment, new_date, new_slot,
+            _new_doctor(appointment, update.doctor_name), doctor_id=appointment.doctor_id,
+        )
+        if (old_date, old_time) != (appointment.appointment_date, appointment.appointment_time):
+            jobs.appointment_booked(db, appointment, event="rescheduled")
 
     if update.reason is not None:
         appointment.reason = update.reason
@@ -112,6 +238,9 @@ def update_appointment(db: Session, appointment_id: int, user_id: int, update: s
     appointment.updated_at = datetime.utcnow()
     db.commit()
     db.refresh(appointment)
+    availability.invalidate(old_date, appointment.appointment_date)
+    if old_key != (appointment.appointment_date, appointment.doctor_name, appointment.time_slot):
+        live.publish(live.released(*old_key), live.booked(appointment))
     return appointment
 
 # ---------------- Delete ----------------
@@ -119,36 +248,274 @@ def delete_appointment(db: Session, appointment_id: int, user_id: int):
     appointment = get_appointment(db, appointment_id)
     if not appointment or appointment.user_id != user_id:
         return None
+    jobs.appointment_cancelled(db, appointment)
     db.delete(appointment)
     db.commit()
+    availability.invalidate(appointment.appointment_date)
+    live.publish(live.released(appointment.appointment_date, appointment.doctor_name, appointment.time_slot))
     return True
 
+# ---------------- Batch ----------------
+def _batch_keys(op: schemas.AppointmentBatchOperation, target: Optional[models.Appointment]):
+    """(doctor_id, วัน, slot) ที่ operation นี้อาจใช้ ไว้โหลดที่นั่งที่ถูกจองทั้งหมดใน query เดียว"""
+    keys = set()
+    if target is not None and target.doctor_id is not None:
+        keys.add((target.doctor_id, target.appointment_date, target.time_slot))
+    if op.op == "cancel":
+        return keys
+    day = op.appointment_date or (target.appointment_date if target else None)
+    slot = op.time_slot or (target.time_slot if target else None)
+    if day is None or slot is None:
+        return keys
+    doctor_name = _new_doctor(target, op.doctor_name) if target is not None else op.doctor_name
+    if target is not None and doctor_name is None:
+        keys.add((target.doctor_id, day, slot))
+        return keys
+    doctor = schedules.find_doctor(name=doctor_name) if doctor_name else None
+    doctors = [doctor] if doctor else ([] if doctor_name else schedules.all_doctors())
+    keys.update((d.id, day, slot) for d in doctors)
+    return keys
+
+def apply_appointment_batch(db: Session, batch: schemas.AppointmentBatch, user_id: int, staff: bool = False):
+    """
+    ทำ create / reschedule / cancel หลายรายการใน transaction เดียว
+    atomic=True ถ้ามีรายการล้มเหลวจะไม่บันทึกอะไรเลย atomic=False บันทึกเฉพาะรายการที่สำเร็จ
+    เจ้าหน้าที่แก้/ยกเลิกนัดของผู้ป่วยคนอื่นได้
+    รอบแรกเลือกที่นั่งจากที่นั่งที่โหลดไว้แล้ว flush นัดใหม่ทั้งหมดครั้งเดียว (ไม่มี savepoint ต่อรายการ)
+    ถ้าชน unique constraint (request อื่นจองที่นั่งเดียวกันหลังโหลด) จึงทำใหม่ทั้ง batch
+    โดยให้แต่ละรายการอยู่ใน savepoint ของตัวเองแบบเดิม
+    """
+    try:
+        results, changes, days = _apply_batch(db, batch, user_id, staff, savepoints=False)
+    except IntegrityError:
+        db.rollback()
+        results, changes, days = _apply_batch(db, batch, user_id, staff, savepoints=True)
+
+    failed = any(not r["ok"] for r in results)
+    if batch.atomic and failed:
+        db.rollback()
+        for r in results:
+            if r["ok"]:
+                r.update(ok=False, appointment=None, detail="ไม่ได้บันทึก เพราะมีรายการอื่นล้มเหลว")
+        return {"committed": False, "results": results}
+
+    db.commit()
+    availability.invalidate(*days)
+    live.publish(*changes)
+    return {"committed": True, "results": results}
+
+def _apply_batch(db: Session, batch: schemas.AppointmentBatch, user_id: int, staff: bool, savepoints: bool):
+    """
+    savepoints=False: รายการที่ล้มเหลว (HTTPException) เกิดก่อนแก้ session จึงไม่ต้อง rollback อะไร
+    นัดใหม่ยังไม่ flush จนจบ batch ส่วน reschedule / cancel flush ทันที
+    เพื่อให้ที่นั่งที่ว่างลงถูกลบ/ย้ายก่อนรายการถัดไปจะ INSERT ลงที่นั่งนั้น
+    """
+    A = models.Appointment
+    ids = {op.id for op in batch.operations if op.op != "create" and op.id is not None}
+    existing = {a.id: a for a in db.query(A).filter(A.id.in_(ids))} if ids else {}
+
+    keys = set()
+    for op in batch.operations:
+        keys |= _batch_keys(op, existing.get(op.id))
+    taken_by_key = slots.taken_seats_many(db, keys)
+
+    now = datetime.utcnow()
+    results, created, changes, days, cancelled = [], [], [], set(), set()
+    for index, op in enumerate(batch.operations):
+        freed = None
+        try:
+            with db.begin_nested() if savepoints else nullcontext():
+                if op.op == "create":
+                    if op.appointment_date is None or op.time_slot is None:
+                        raise HTTPException(status_code=400, detail="ต้องระบุวันและช่วงเวลา")
+                    appointment = A(user_id=user_id, reason=op.reason, status="รอการยืนยัน", created_at=now, updated_at=now)
+                    schedules.book(db, appointment, op.appointment_date, op.time_slot, op.doctor_name, taken_by_key, flush=savepoints)
+                    changes.append(live.booked(appointment))
+                else:
+                    appointment = existing.get(op.id)
+                    if appointment is None or op.id in cancelled or (appointment.user_id != user_id and not staff):
+                        raise HTTPException(status_code=404, detail="ไม่พบการนัดหมาย")
+                    old_key = (appointment.appointment_date, appointment.doctor_name, appointment.time_slot)
+                    old_time = appointment.appointment_time
+                    moves = op.op == "reschedule" and _moves(appointment, op.appointment_date, op.time_slot, op.doctor_name)
+                    if op.op == "cancel" or moves:
+                        # ที่นั่งเดิมว่างลงสำหรับรายการถัดไปใน batch
+                        freed = (taken_by_key.get((appointment.doctor_id, appointment.appointment_date, appointment.time_slot)),
+                                 (appointment.appointment_time, appointment.seat))
+                        if freed[0] is not None:
+                            freed[0].discard(freed[1])
+                    days.add(appointment.appointment_date)
+                    if op.op == "cancel":
+                        jobs.appointment_cancelled(db, appointment)
+                        db.delete(appointment)
+                        db.flush()
+                        cancelled.add(op.id)
+                        changes.append(live.released(*old_key))
+                    else:
+                        if moves:
+                            schedules.book(
+                                db, appointment,
+                                op.appointment_date or appointment.appointment_date,
+                                op.time_slot or appointment.time_slot,
+                                _new_doctor(appointment, op.doctor_name),
+                                taken_by_key,
+                                doctor_id=appointment.doctor_id,
+                            )
+                        if op.reason:
+                            appointment.reason = op.reason
+                        appointment.updated_at = now
+                        if (appointment.appointment_date, appointment.appointment_time) != (old_key[0], old_time):
+                            jobs.appointment_booked(db, appointment, event="rescheduled")
+                        db.flush()
+                        if moves:
+                            changes += [live.released(*old_key), live.booked(appointment)]
+                if op.op != "cancel":
+                    days.add(appointment.appointment_date)
+            if op.op == "create":
+                created.append(appointment)
+            results.append({"index": index, "ok": True, "appointment": appointment if op.op != "cancel" else None})
+        except HTTPException as e:
+            if freed is not None and freed[0] is not None:
+                freed[0].add(freed[1])
+            results.append({"index": index, "ok": False, "detail": e.detail})
+
+    # นัดใหม่ทั้งหมด INSERT ใน flush เดียว (ได้ id สำหรับงานแจ้งเตือนและผลลัพธ์)
+    db.flush()
+    jobs.appointments_booked(db, created)
+    for r in results:
+        if r.get("appointment") is not None:
+            r["appointment"] = schemas.AppointmentOut.model_validate(r["appointment"])
+    return results, changes, days
+
 # ---------------- google ----------------
 
 def create_google_user(db: Session, user: schemas.UserGoogleCreate):
-    # ตรวจสอบว่ามีอีเมลนี้อยู่แล้วหรือไม่
-    existing_user = db.query(models.User).filter(models.User.email == user.email).first()
-    
-    if existing_user:
-        # ถือว่า User นั้นสมัครแล้ว (ไม่ว่าจะด้วย Google หรือ Email/Pass)
-        return existing_user
-    
-    # สร้าง username โดยใช้ส่วนแรกของอีเมล และเพิ่มตัวเลขถ้าซ้ำ (ตัวอย่างง่ายๆ)
-    username_base = user.email.split('@')[0]
-    # NOTE: ใน Production คุณอาจต้องมีตรรกะที่ซับซ้อนกว่านี้
-    clean_username = re.sub(r'[^a-zA-Z0-9]', '', username_base)
-
-    db_user = models.User(
-        # ตรวจสอบว่า username ซ้ำหรือไม่ (ถ้าต้องการให้ Google User มี username ที่ไม่ซ้ำ)
-        # เนื่องจาก username ถูกกำหนดเป็น unique=True ใน models.py คุณต้องแน่ใจว่ามันไม่ซ้ำ
-        # สำหรับตอนนี้ เราจะใช้ username_base ตรงๆ เพราะการชนกันจะถูกจับเมื่อ commit
-        username=clean_username, 
-        email=user.email,
-        password=None, # <--- กำหนดเป็น None ให้ชัดเจน
-        first_name=user.given_name,
-        last_name=user.family_name
+    """สร้างผู้ใช้ Google หรือคืนผู้ใช้เดิมที่มีอีเมลนี้ (สมัครด้วยวิธีไหนก็ได้)"""
+    candidates = _username_candidates(user.email)
+    username = _free_username(candidates, set(db.scalars(_username_probe(candidates))))
+    db_user = _insert_user(db, _google_user_values(user, username))
+    return db_user or _existing_google_user(get_user_by_email(db, user.email))
+
+def _google_user_values(user: schemas.UserGoogleCreate, username: str):
+    return _user_values(username, user.email, None, first_name=user.given_name, last_name=user.family_name)
+
+def _existing_google_user(existing):
+    if existing is None:
+        # ไม่ได้ชนที่อีเมล: username ถูกใช้ไปพร้อมกันพอดี
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="สร้างบัญชีไม่สำเร็จ กรุณาลองใหม่")
+    return existing
+
+# ---------------- Async ----------------
+# เวอร์ชัน async ของฟังก์ชันด้านบน ใช้กับ AsyncSession (database.get_async_db)
+async def get_user_by_email_async(db: AsyncSession, email: str):
+    result = await db.execute(select(models.User).where(models.User.email == email))
+    return result.scalars().first()
+
+async def get_user_by_id_async(db: AsyncSession, user_id: int):
+    return await db.get(models.User, user_id)
+
+async def _insert_user_async(db: AsyncSession, values: dict) -> Optional[models.User]:
+    """เหมือน _insert_user"""
+    stmt = _insert_user_stmt(db, values)
+    if stmt is None:
+        db_user = models.User(**values)
+        db.add(db_user)
+        try:
+            await db.commit()
+        except IntegrityError:
+            await db.rollback()
+            return None
+        await db.refresh(db_user)
+        return db_user
+    db_user = (await db.scalars(stmt)).first()
+    if db_user is None:
+        await db.rollback()
+        return None
+    patient_search.user_saved(db.sync_session, db_user)
+    await db.commit()
+    return db_user
+
+async def create_user_async(db: AsyncSession, user: schemas.UserCreate, hashed_password: str):
+    """hash รหัสผ่านมาก่อนแล้ว (ดู hashing.hash_password) คืน None ถ้า username / email ซ้ำ"""
+    return await _insert_user_async(db, _user_values(user.username, user.email, hashed_password))
+
+async def update_password_async(db: AsyncSession, user: models.User, hashed_password: str):
+    user.password = hashed_password
+    await db.commit()
+
+async def create_google_user_async(db: AsyncSession, user: schemas.UserGoogleCreate):
+    candidates = _username_candidates(user.email)
+    username = _free_username(candidates, set((await db.scalars(_username_probe(candidates))).all()))
+    db_user = await _insert_user_async(db, _google_user_values(user, username))
+    return db_user or _existing_google_user(await get_user_by_email_async(db, user.email))
+
+async def get_appointment_async(db: AsyncSession, appointment_id: int, history: bool = False):
+    appointment = await db.get(models.Appointment, appointment_id)
+    if appointment is None and history:
+        appointment = await db.get(models.ArchivedAppointment, appointment_id)
+    return appointment
+
+# งานเขียนนัดหมายใช้โค้ดเดียวกับฝั่ง sync (slots, jobs, listener ของ reports) ผ่าน run_sync:
+# ทำงานบน connection async ของ request ใน event loop ไม่ต้องใช้ threadpool
+async def create_appointment_async(db: AsyncSession, user_id: int, appointment: schemas.AppointmentCreate):
+    return await db.run_sync(create_appointment, user_id, appointment)
+
+async def get_appointments_async(db: AsyncSession, **filters):
+    return await db.run_sync(get_appointments, **filters)
+
+async def update_appointment_async(db: AsyncSession, appointment_id: int, user_id: int, update: schemas.AppointmentUpdate):
+    return await db.run_sync(update_appointment, appointment_id, user_id, update)
+
+async def delete_appointment_async(db: AsyncSession, appointment_id: int, user_id: int):
+    return await db.run_sync(delete_appointment, appointment_id, user_id)
+
+async def apply_appointment_batch_async(db: AsyncSession, batch: schemas.AppointmentBatch, user_id: int, staff: bool = False):
+    return await db.run_sync(apply_appointment_batch, batch, user_id, staff)
+
+async def delete_user_async(db: AsyncSession, user_id: int):
+    return await db.run_sync(delete_user, user_id)
+
+# ---------------- Refresh tokens ----------------
+def _refresh_token(user_id: int, token_hash: str, family_id: str, expires_at: datetime):
+    return models.RefreshToken(user_id=user_id, token_hash=token_hash, family_id=family_id, expires_at=expires_at)
+
+async def create_refresh_token_async(db: AsyncSession, user_id: int, token_hash: str, family_id: str, expires_at: datetime):
+    db.add(_refresh_token(user_id, token_hash, family_id, expires_at))
+    await db.commit()
+
+async def get_refresh_token_async(db: AsyncSession, token_hash: str):
+    result = await db.execute(select(models.RefreshToken).where(models.RefreshToken.token_hash == token_hash))
+    return result.scalars().first()
+
+async def rotate_refresh_token_async(db: AsyncSession, old, token_hash: str, expires_at: datetime) -> bool:
+    """
+    เพิกถอนใบเดิมแล้วออกใบใหม่ใน family เดียวกัน (transaction เดียว)
+    UPDATE แบบมีเงื่อนไข: ถ้าใช้ token เดียวกันพร้อมกัน จะมีเพียงคำขอเดียวที่ได้ใบใหม่ (คืน False ให้อีกคำขอ)
+    """
+    result = await db.execute(
+        update(models.RefreshToken)
+        .where(models.RefreshToken.id == old.id, models.RefreshToken.revoked_at.is_(None))
+        .values(revoked_at=datetime.utcnow())
     )
-    db.add(db_user)
+    if result.rowcount != 1:
+        await db.rollback()
+        return False
+    db.add(_refresh_token(old.user_id, token_hash, old.family_id, expires_at))
+    await db.commit()
+    return True
+
+async def revoke_refresh_family_async(db: AsyncSession, family_id: str):
+    await db.execute(
+        update(models.RefreshToken)
+        .where(models.RefreshToken.family_id == family_id, models.RefreshToken.revoked_at.is_(None))
+        .values(revoked_at=datetime.utcnow())
+    )
+    await db.commit()
+
+def purge_refresh_tokens(db: Session) -> int:
+    """ลบ refresh token ที่หมดอายุแล้ว (ใบที่ถูกเพิกถอนแต่ยังไม่หมดอายุเก็บไว้ตรวจการนำกลับมาใช้)"""
+    deleted = db.query(models.RefreshToken).filter(
+        models.RefreshToken.expires_at < datetime.utcnow()
+    ).delete(synchronize_session=False)
     db.commit()
-    db.refresh(db_user)
-    return db_user
\ No newline at end of file
+    return deleted
@@ -0,0 +1,76 @@
+# hashing.py
+# hash / ตรวจรหัสผ่านด้วย bcrypt ใน process pool แยก
+# bcrypt ใช้ CPU ~100ms ต่อครั้ง ถ้ารันใน threadpool จะแย่ง GIL กับ request อื่น
+import asyncio
+import os
+from concurrent.futures import ProcessPoolExecutor
+from fastapi import HTTPException
+from passlib.hash import bcrypt
+from dotenv import load_dotenv
+
+load_dotenv()
+
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+# 0 = รันใน process เดียวกัน (ใช้ตอน dev / debug)
+HASH_WORKERS = int(os.getenv("HASH_WORKERS", str(os.cpu_count() or 1)))
+# งานที่รันพร้อมกันได้ และงานที่รอคิวได้สูงสุดก่อนตอบ 503
+HASH_CONCURRENCY = int(os.getenv("HASH_CONCURRENCY", str(max(HASH_WORKERS, 1))))
+HASH_MAX_PENDING = int(os.getenv("HASH_MAX_PENDING", str(max(HASH_WORKERS, 1) * 8)))
+
+_hasher = bcrypt.using(rounds=BCRYPT_ROUNDS)
+_pool = None
+_semaphore = None
+_pending = 0
+
+# ---------------- งานที่รันใน process pool (ต้องเป็นฟังก์ชันระดับ module) ----------------
+def hash_sync(password: str) -> str:
+    return _hasher.hash(password)
+
+def verify_sync(password: str, hashed: str) -> bool:
+    return bcrypt.verify(password, hashed)
+
+def _verify_and_check(password: str, hashed: str):
+    """คืน (ถูกต้อง, ต้อง hash ใหม่เพราะ cost เปลี่ยน)"""
+    if not bcrypt.verify(password, hashed):
+        return False, False
+    return True, _hasher.needs_update(hashed)
+
+# ---------------- async API สำหรับ route ----------------
+def _get_pool():
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=HASH_WORKERS)
+    return _pool
+
+async def _run(fn, *args):
+    global _pending, _semaphore
+    if _pending >= HASH_MAX_PENDING:
+        raise HTTPException(
+            status_code=503,
+            detail="ระบบกำลังมีผู้ใช้งานจำนวนมาก กรุณาลองใหม่อีกครั้ง",
+            headers={"Retry-After": "1"},
+        )
+    if _semaphore is None:
+        _semaphore = asyncio.Semaphore(HASH_CONCURRENCY)
+
+    _pending += 1
+    try:
+        async with _semaphore:
+            if HASH_WORKERS <= 0:
+                return fn(*args)
+            return await asyncio.get_running_loop().run_in_executor(_get_pool(), fn, *args)
+    finally:
+        _pending -= 1
+
+async def hash_password(password: str) -> str:
+    return await _run(hash_sync, password)
+
+async def verify_password(password: str, hashed: str):
+    """คืน (ถูกต้อง, ต้อง hash ใหม่)"""
+    return await _run(_verify_and_check, password, hashed)
+
+def shutdown():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
\ No newline at end of file
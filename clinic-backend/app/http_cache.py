@@ -0,0 +1,62 @@
+# http_cache.py
+# ETag / Last-Modified และการตอบ 304 Not Modified สำหรับ GET
+import hashlib
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Optional
+from fastapi import Request, Response
+
+# cache ได้แต่ต้องถามเซิร์ฟเวอร์ก่อนใช้ทุกครั้ง (ข้อมูลของผู้ใช้แต่ละคน)
+PRIVATE_REVALIDATE = "private, no-cache"
+
+def make_etag(*parts) -> str:
+    digest = hashlib.blake2b("|".join(str(p) for p in parts).encode(), digest_size=12).hexdigest()
+    return f'W/"{digest}"'
+
+def _http_date(value: datetime) -> str:
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)  # เวลาใน DB เป็น UTC
+    return format_datetime(value.replace(microsecond=0), usegmt=True)
+
+def _etag_matches(header: str, etag: str) -> bool:
+    if header.strip() == "*":
+        return True
+    # เทียบแบบ weak: ไม่สน prefix W/
+    wanted = etag.removeprefix("W/")
+    return any(tag.strip().removeprefix("W/") == wanted for tag in header.split(","))
+
+def is_not_modified(request: Request, etag: str, last_modified: Optional[datetime] = None) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        return _etag_matches(if_none_match, etag)
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since and last_modified is not None:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        return parsedate_to_datetime(_http_date(last_modified)) <= since
+    return False
+
+def cache_headers(etag: str, cache_control: str, last_modified: Optional[datetime] = None) -> dict:
+    headers = {"ETag": etag, "Cache-Control": cache_control}
+    if last_modified is not None:
+        headers["Last-Modified"] = _http_date(last_modified)
+    return headers
+
+def conditional(
+    request: Request,
+    response: Response,
+    etag: str,
+    cache_control: str = PRIVATE_REVALIDATE,
+    last_modified: Optional[datetime] = None,
+) -> Optional[Response]:
+    """
+    ใส่ header ให้ response ปกติ และคืน Response 304 ถ้า client มีข้อมูลล่าสุดอยู่แล้ว
+    route ควรคืนค่า 304 นั้นทันทีโดยไม่ต้อง serialize body
+    """
+    headers = cache_headers(etag, cache_control, last_modified)
+    if is_not_modified(request, etag, last_modified):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return None
\ No newline at end of file
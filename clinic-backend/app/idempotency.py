@@ -0,0 +1,102 @@
+# idempotency.py
+# รองรับ header Idempotency-Key: client ที่ retry คำขอเดิม (เช่นเน็ตหลุดตอนจอง)
+# ได้คำตอบเดิมกลับไป โดยไม่จองเวลาใหม่ซ้ำ
+# - เก็บ (user_id, key) -> คำตอบ ในตาราง idempotency_keys ใน transaction เดียวกับการเขียนจริง
+# - คำขอซ้ำที่มาพร้อมกันจะรอกันที่ unique (user_id, key) แล้วได้คำตอบของคำขอแรก
+# - คำตอบที่เคยอ่านจาก DB แล้วเก็บใน cache ต่อ (ไม่ต้อง query อีก)
+import hashlib
+import json
+import os
+from datetime import datetime, timedelta
+from typing import Optional
+from fastapi import HTTPException
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from . import models
+from .cache import make_cache
+
+IDEMPOTENCY_TTL_SECONDS = int(os.getenv("IDEMPOTENCY_TTL_SECONDS", str(24 * 3600)))
+IDEMPOTENCY_CACHE_MAXSIZE = int(os.getenv("IDEMPOTENCY_CACHE_MAXSIZE", "10000"))
+MAX_KEY_LENGTH = 255
+
+# "user_id:key" -> {"hash", "status", "body"}
+response_cache = make_cache("idempotency", maxsize=IDEMPOTENCY_CACHE_MAXSIZE, ttl=IDEMPOTENCY_TTL_SECONDS)
+
+def fingerprint(payload: BaseModel) -> str:
+    return hashlib.blake2b(payload.model_dump_json().encode(), digest_size=16).hexdigest()
+
+def _cutoff() -> datetime:
+    return datetime.utcnow() - timedelta(seconds=IDEMPOTENCY_TTL_SECONDS)
+
+def _replay(entry: dict, request_hash: str) -> JSONResponse:
+    if entry["hash"] != request_hash:
+        raise HTTPException(status_code=422, detail="Idempotency-Key นี้ถูกใช้กับคำขออื่นแล้ว")
+    return JSONResponse(entry["body"], status_code=entry["status"], headers={"Idempotency-Replayed": "true"})
+
+def _lookup(db: Session, user_id: int, key: str) -> Optional[dict]:
+    cached = response_cache.get(f"{user_id}:{key}")
+    if cached is not None:
+        return cached
+    row = db.query(models.IdempotencyKey).filter(
+        models.IdempotencyKey.user_id == user_id,
+        models.IdempotencyKey.key == key,
+        models.IdempotencyKey.created_at >= _cutoff(),
+    ).first()
+    if row is None:
+        return None
+    if row.status_code is None:
+        raise HTTPException(status_code=409, detail="คำขอนี้กำลังดำเนินการอยู่")
+    entry = {"hash": row.request_hash, "status": row.status_code, "body": json.loads(row.response_body)}
+    response_cache.set(f"{user_id}:{key}", entry)
+    return entry
+
+def begin(db: Session, user_id: int, key: Optional[str], payload: BaseModel) -> Optional[JSONResponse]:
+    """
+    คืนคำตอบเดิมถ้า key นี้เคยสำเร็จแล้ว (route ต้องคืนค่านั้นทันที)
+    ถ้ายังไม่เคย จะจอง key ไว้ใน transaction ปัจจุบัน แล้วคืน None ให้ทำงานต่อและเรียก finish() ก่อน commit
+    """
+    if not key:
+        return None
+    if len(key) > MAX_KEY_LENGTH:
+        raise HTTPException(status_code=400, detail="Idempotency-Key ยาวเกินไป")
+    request_hash = fingerprint(payload)
+    entry = _lookup(db, user_id, key)
+    if entry is not None:
+        return _replay(entry, request_hash)
+
+    K = models.IdempotencyKey
+    # key เดิมที่หมดอายุแล้วใช้ใหม่ได้
+    db.query(K).filter(K.user_id == user_id, K.key == key, K.created_at < _cutoff()).delete(synchronize_session=False)
+    record = K(user_id=user_id, key=key, request_hash=request_hash)
+    try:
+        with db.begin_nested():
+            db.add(record)
+            db.flush()
+    except IntegrityError:
+        # คำขอซ้ำที่มาพร้อมกัน commit ไปก่อนแล้ว
+        db.rollback()
+        entry = _lookup(db, user_id, key)
+        if entry is None:
+            raise HTTPException(status_code=409, detail="คำขอนี้กำลังดำเนินการอยู่")
+        return _replay(entry, request_hash)
+    db.info["idempotency_record"] = record
+    return None
+
+def finish(db: Session, body, status_code: int = 200):
+    """บันทึกคำตอบคู่กับ key ที่จองไว้ (ยังไม่ commit) — ไม่มี key ก็ไม่ทำอะไร"""
+    record = db.info.pop("idempotency_record", None)
+    if record is None:
+        return
+    record.status_code = status_code
+    record.response_body = json.dumps(body, ensure_ascii=False)
+    db.flush()
+
+def purge(db: Session) -> int:
+    """ลบ key ที่หมดอายุ"""
+    deleted = db.query(models.IdempotencyKey).filter(
+        models.IdempotencyKey.created_at < _cutoff()
+    ).delete(synchronize_session=False)
+    db.commit()
+    return deleted
@@ -0,0 +1,340 @@
+# jobs.py
+# คิวงานเบื้องหลังเก็บในตาราง jobs (ส่งข้อความยืนยันการจอง / เตือนนัดล่วงหน้า / audit log)
+# - route เรียก enqueue() ใน transaction เดียวกับการจอง แล้วตอบกลับทันที
+#   (จองไม่สำเร็จ = rollback งานไปด้วย ไม่มีการแจ้งเตือนของนัดที่ไม่มีอยู่จริง)
+# - worker เป็น asyncio task: เริ่มจาก lifespan ของ app (JOBS_WORKER_ENABLED)
+#   หรือแยก process ด้วย `python -m app.manage run-worker`
+# - ดึงงานทีละ batch: PostgreSQL ใช้ FOR UPDATE SKIP LOCKED หลาย worker ไม่ได้งานซ้ำกัน
+#   SQLite ไม่มี FOR UPDATE แต่ BEGIN IMMEDIATE (database.py) ทำให้ดึงได้ทีละ worker อยู่แล้ว
+# - งานล้มเหลวลองใหม่แบบ exponential backoff จนครบ max_attempts แล้วเป็น failed
+# - งานที่ค้างเป็น running นานเกิน JOBS_LOCK_TIMEOUT_SECONDS (worker ตาย) ถูกดึงไปทำใหม่
+# ผู้รับข้อความเปลี่ยนได้ด้วย NOTIFIER:
+# - log:     เขียน log อย่างเดียว (ยังไม่มีผู้ให้บริการ SMS / อีเมล)
+# - memory:  เก็บข้อความไว้ใน list สำหรับทดสอบ
+import asyncio
+import json
+import logging
+import os
+import random
+import socket
+from datetime import date, datetime, time, timedelta
+from typing import Optional
+from dotenv import load_dotenv
+from sqlalchemy import and_, delete, event, or_, select, update
+from sqlalchemy.orm import Session
+from . import database, metrics, models
+
+load_dotenv()
+
+logger = logging.getLogger("clinic.jobs")
+audit_logger = logging.getLogger("clinic.audit")
+
+JOBS_WORKER_ENABLED = os.getenv("JOBS_WORKER_ENABLED", "true").lower() in ("1", "true", "yes")
+JOBS_BATCH_SIZE = int(os.getenv("JOBS_BATCH_SIZE", "20"))
+JOBS_POLL_SECONDS = float(os.getenv("JOBS_POLL_SECONDS", "1"))
+JOBS_MAX_ATTEMPTS = int(os.getenv("JOBS_MAX_ATTEMPTS", "5"))
+JOBS_BACKOFF_SECONDS = float(os.getenv("JOBS_BACKOFF_SECONDS", "10"))  # รอบแรก แล้วเพิ่มเป็น 2 เท่า
+JOBS_MAX_BACKOFF_SECONDS = float(os.getenv("JOBS_MAX_BACKOFF_SECONDS", "3600"))
+JOBS_LOCK_TIMEOUT_SECONDS = int(os.getenv("JOBS_LOCK_TIMEOUT_SECONDS", "300"))
+JOBS_RETENTION_DAYS = int(os.getenv("JOBS_RETENTION_DAYS", "7"))
+NOTIFIER = os.getenv("NOTIFIER", "log")
+# เวลาในนัดหมายเป็นเวลาท้องถิ่นของคลินิก ส่วน run_at เป็น UTC
+CLINIC_UTC_OFFSET_HOURS = float(os.getenv("CLINIC_UTC_OFFSET_HOURS", "7"))
+REMINDER_HOURS_BEFORE = float(os.getenv("REMINDER_HOURS_BEFORE", "24"))
+
+jobs_processed = metrics.Counter("clinic_jobs_total", "Background jobs processed", ("kind", "result"))
+
+# ---------------- Notifier ----------------
+class LogNotifier:
+    async def send(self, user_id: int, kind: str, data: dict):
+        logger.info("notify user=%s %s %s", user_id, kind, data)
+
+
+class MemoryNotifier:
+    """เก็บข้อความที่ส่งไว้ใน sent ตั้ง fail_next ให้ล้มเหลวตามจำนวนครั้งเพื่อทดสอบการลองใหม่"""
+
+    def __init__(self):
+        self.sent = []
+        self.fail_next = 0
+
+    async def send(self, user_id: int, kind: str, data: dict):
+        if self.fail_next > 0:
+            self.fail_next -= 1
+            raise RuntimeError("notifier unavailable")
+        self.sent.append((user_id, kind, data))
+
+
+def make_notifier():
+    if NOTIFIER == "memory":
+        return MemoryNotifier()
+    return LogNotifier()
+
+notifier = make_notifier()
+
+# ---------------- Enqueue ----------------
+def enqueue(db: Session, kind: str, payload: dict, run_at: Optional[datetime] = None, max_attempts: Optional[int] = None):
+    """เพิ่มงานใน transaction ของ db (ยังไม่ commit) worker เห็นงานหลัง commit"""
+    job = models.Job(**_job_values(kind, payload, run_at, max_attempts))
+    db.add(job)
+    db.info["jobs_enqueued"] = True
+    return job
+
+def enqueue_many(db: Session, jobs):
+    """เพิ่มหลายงาน (kind, payload, run_at) ใน INSERT เดียว ไม่ต้องการ id กลับ (batch)"""
+    rows = [_job_values(kind, payload, run_at) for kind, payload, run_at in jobs]
+    if rows:
+        # INSERT ของ Table ตรง ๆ (ไม่ผ่าน ORM bulk insert) executemany ครั้งเดียว
+        db.execute(models.Job.__table__.insert(), rows)
+        db.info["jobs_enqueued"] = True
+
+def _job_values(kind: str, payload: dict, run_at: Optional[datetime] = None, max_attempts: Optional[int] = None) -> dict:
+    return {
+        "kind": kind,
+        "payload": json.dumps(payload, ensure_ascii=False, default=str),
+        "run_at": run_at or datetime.utcnow(),
+        "max_attempts": max_attempts or JOBS_MAX_ATTEMPTS,
+    }
+
+def _appointment_payload(appointment) -> dict:
+    return {
+        "appointment_id": appointment.id,
+        "user_id": appointment.user_id,
+        "doctor_name": appointment.doctor_name,
+        "appointment_date": appointment.appointment_date.isoformat(),
+        "appointment_time": appointment.appointment_time.isoformat(),
+        "time_slot": appointment.time_slot,
+    }
+
+def reminder_time(appointment_date: date, appointment_time: time) -> datetime:
+    local = datetime.combine(appointment_date, appointment_time)
+    return local - timedelta(hours=CLINIC_UTC_OFFSET_HOURS + REMINDER_HOURS_BEFORE)
+
+def appointment_booked(db: Session, appointment, event: str = "booked"):
+    """งานหลังจอง / เลื่อนนัด: แจ้งผู้ป่วย + audit ทันที และตั้งเวลาเตือนก่อนวันนัด"""
+    appointments_booked(db, [appointment], event)
+
+def appointments_booked(db: Session, appointments, event: str = "booked"):
+    """appointment_booked ของหลายนัด งานทั้งหมดใน INSERT เดียว"""
+    if any(a.id is None for a in appointments):
+        db.flush()
+    now = datetime.utcnow()
+    entries = []
+    for appointment in appointments:
+        payload = _appointment_payload(appointment)
+        entries.append((f"appointment.{event}", payload, now))
+        remind_at = reminder_time(appointment.appointment_date, appointment.appointment_time)
+        if remind_at > now:
+            # นัดถูกเลื่อน/ยกเลิกทีหลัง: งานเตือนเดิมตรวจแล้วข้ามเอง (ดู _remind)
+            entries.append(("appointment.reminder", payload, remind_at))
+    enqueue_many(db, entries)
+
+def appointment_cancelled(db: Session, appointment):
+    enqueue(db, "appointment.cancelled", _appointment_payload(appointment))
+
+@event.listens_for(Session, "after_commit")
+def _wake_after_commit(session):
+    if session.info.pop("jobs_enqueued", False):
+        worker.wake()
+
+@event.listens_for(Session, "after_rollback")
+def _forget_after_rollback(session):
+    session.info.pop("jobs_enqueued", None)
+
+# ---------------- Handlers ----------------
+HANDLERS = {}
+
+def handler(kind: str):
+    def register(fn):
+        HANDLERS[kind] = fn
+        return fn
+    return register
+
+def _audit(action: str, payload: dict):
+    audit_logger.info("%s appointment=%s user=%s %s %s %s", action, payload["appointment_id"], payload["user_id"],
+                      payload["appointment_date"], payload["appointment_time"], payload["doctor_name"])
+
+@handler("appointment.booked")
+async def _booked(payload: dict):
+    _audit("booked", payload)
+    await notifier.send(payload["user_id"], "booked", payload)
+
+@handler("appointment.rescheduled")
+async def _rescheduled(payload: dict):
+    _audit("rescheduled", payload)
+    await notifier.send(payload["user_id"], "rescheduled", payload)
+
+@handler("appointment.cancelled")
+async def _cancelled(payload: dict):
+    _audit("cancelled", payload)
+    await notifier.send(payload["user_id"], "cancelled", payload)
+
+def _still_booked(payload: dict) -> bool:
+    with database.SessionLocal(info={"read_only": True}) as db:
+        appointment = db.get(models.Appointment, payload["appointment_id"])
+        return (
+            appointment is not None
+            and appointment.appointment_date.isoformat() == payload["appointment_date"]
+            and appointment.appointment_time.isoformat() == payload["appointment_time"]
+        )
+
+@handler("appointment.reminder")
+async def _remind(payload: dict):
+    if not await asyncio.to_thread(_still_booked, payload):
+        return  # ยกเลิกหรือเลื่อนไปแล้ว (การเลื่อนตั้งงานเตือนใหม่ให้เอง)
+    await notifier.send(payload["user_id"], "reminder", payload)
+
+# ---------------- Queue ----------------
+def backoff_seconds(attempts: int) -> float:
+    delay = min(JOBS_MAX_BACKOFF_SECONDS, JOBS_BACKOFF_SECONDS * 2 ** max(0, attempts - 1))
+    return delay * random.uniform(0.5, 1.0)  # กระจายเวลาไม่ให้ลองใหม่พร้อมกันทั้งหมด
+
+def claim(worker_name: str, limit: int):
+    """จองงานที่ถึงเวลาได้สูงสุด limit งาน คืน list ของ (id, kind, payload, attempts, max_attempts)"""
+    T = models.Job.__table__
+    now = datetime.utcnow()
+    stale = now - timedelta(seconds=JOBS_LOCK_TIMEOUT_SECONDS)
+    ready = or_(
+        and_(T.c.status == "pending", T.c.run_at <= now),
+        and_(T.c.status == "running", T.c.locked_at < stale),
+    )
+    candidates = (
+        select(T.c.id).where(ready).order_by(T.c.run_at, T.c.id).limit(limit)
+        .with_for_update(skip_locked=True)
+    )
+    with database.SessionLocal() as db:
+        rows = db.execute(
+            update(T)
+            .where(T.c.id.in_(candidates))
+            .values(status="running", locked_by=worker_name, locked_at=now, attempts=T.c.attempts + 1)
+            .returning(T.c.id, T.c.kind, T.c.payload, T.c.attempts, T.c.max_attempts)
+        ).all()
+        db.commit()
+    return rows
+
+def record(worker_name: str, done, failed):
+    """
+    บันทึกผลของ batch ใน transaction เดียว
+    done: [id]  failed: [(id, attempts, max_attempts, error)]
+    """
+    T = models.Job.__table__
+    now = datetime.utcnow()
+    mine = and_(T.c.status == "running", T.c.locked_by == worker_name)
+    with database.SessionLocal() as db:
+        if done:
+            db.execute(
+                update(T).where(T.c.id.in_(done), mine)
+                .values(status="done", finished_at=now, locked_by=None, locked_at=None)
+            )
+        for job_id, attempts, max_attempts, error in failed:
+            if attempts >= max_attempts:
+                values = {"status": "failed", "finished_at": now}
+            else:
+                values = {"status": "pending", "run_at": now + timedelta(seconds=backoff_seconds(attempts))}
+            db.execute(
+                update(T).where(T.c.id == job_id, mine)
+                .values(locked_by=None, locked_at=None, last_error=error[:2000], **values)
+            )
+        db.commit()
+
+def purge(db: Session) -> int:
+    """ลบงานที่ทำเสร็จแล้วเกิน JOBS_RETENTION_DAYS (งาน failed เก็บไว้ตรวจสอบ)"""
+    T = models.Job.__table__
+    cutoff = datetime.utcnow() - timedelta(days=JOBS_RETENTION_DAYS)
+    deleted = db.execute(delete(T).where(T.c.status == "done", T.c.finished_at < cutoff)).rowcount
+    db.commit()
+    return deleted
+
+# ---------------- Worker ----------------
+class Worker:
+    def __init__(self, batch_size: int = JOBS_BATCH_SIZE, poll_seconds: float = JOBS_POLL_SECONDS):
+        self.name = f"{socket.gethostname()}:{os.getpid()}"
+        self.batch_size = batch_size
+        self.poll_seconds = poll_seconds
+        self._task: Optional[asyncio.Task] = None
+        self._loop = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._stopping = False
+
+    def wake(self):
+        # เรียกได้จากทุก thread (commit ของ route แบบ sync อยู่ใน threadpool)
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    async def _process(self, job):
+        job_id, kind, payload, attempts, max_attempts = job
+        fn = HANDLERS.get(kind)
+        try:
+            if fn is None:
+                raise LookupError(f"unknown job kind: {kind}")
+            await fn(json.loads(payload))
+        except Exception as e:
+            logger.warning("job %s (%s) failed on attempt %d: %r", job_id, kind, attempts, e)
+            if fn is None:
+                attempts = max_attempts  # ลองใหม่ก็ไม่สำเร็จ
+            jobs_processed.inc(kind, "failed" if attempts >= max_attempts else "retry")
+            return job_id, (job_id, attempts, max_attempts, repr(e))
+        jobs_processed.inc(kind, "done")
+        return job_id, None
+
+    async def run_once(self) -> int:
+        """ดึงและทำงานหนึ่ง batch คืนจำนวนงานที่ดึงได้"""
+        claimed = await asyncio.to_thread(claim, self.name, self.batch_size)
+        if not claimed:
+            return 0
+        results = await asyncio.gather(*(self._process(job) for job in claimed))
+        done = [job_id for job_id, failure in results if failure is None]
+        failed = [failure for _, failure in results if failure is not None]
+        await asyncio.to_thread(record, self.name, done, failed)
+        return len(claimed)
+
+    async def _run(self):
+        while not self._stopping:
+            try:
+                claimed = await self.run_once()
+            except Exception:
+                logger.exception("job worker error")
+                claimed = 0
+            if claimed < self.batch_size and not self._stopping:
+                # ว่าง: รอจนมีงานใหม่ถูก commit ใน process นี้ หรือครบรอบ poll (งานจาก process อื่น / งานที่ตั้งเวลาไว้)
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_seconds)
+                except asyncio.TimeoutError:
+                    pass
+
+    def start(self):
+        if self._task is None:
+            self._loop = asyncio.get_running_loop()
+            self._wakeup = asyncio.Event()
+            self._stopping = False
+            self._task = self._loop.create_task(self._run())
+
+    async def stop(self, timeout: float = 10):
+        """ให้ batch ที่กำลังทำจบก่อน (เกิน timeout ยกเลิก งานที่ค้างจะถูกดึงใหม่หลัง lock หมดอายุ)"""
+        if self._task is None:
+            return
+        self._stopping = True
+        self._wakeup.set()
+        try:
+            await asyncio.wait_for(self._task, timeout=timeout)
+        except asyncio.TimeoutError:
+            pass
+        self._task = None
+        self._loop = None
+
+worker = Worker()
+
+async def start():
+    if JOBS_WORKER_ENABLED:
+        worker.start()
+
+async def stop():
+    await worker.stop()
+
+async def run_forever():
+    """สำหรับ `python -m app.manage run-worker`"""
+    worker.start()
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await worker.stop()
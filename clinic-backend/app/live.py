@@ -0,0 +1,266 @@
+# live.py
+# ส่งการเปลี่ยนแปลงจำนวนที่จองต่อ (วัน, หมอ, slot) ให้ client แบบ real-time (Server-Sent Events)
+# route ที่สร้าง/แก้/ลบนัดหมายเรียก publish() หลัง commit
+# broker เปลี่ยนได้ด้วย LIVE_BROKER_URL:
+# - memory:      ส่งภายใน process (worker เดียว)
+# - redis://...  ผ่าน redis pub/sub ทุก worker ได้รับเหมือนกัน (ต้องติดตั้ง redis)
+# - local-redis  ตัวแทน redis pub/sub ใน process ไว้ทดสอบ (ส่งเป็น JSON เหมือน redis จริง)
+# แต่ละ worker รวมการเปลี่ยนแปลงไว้ LIVE_FLUSH_MS แล้วส่งเป็นข้อความเดียว
+# การจองถี่ ๆ จึงไม่ทำให้ต้องเขียนไปทุก socket ทุกครั้ง
+import asyncio
+import json
+import logging
+import os
+import threading
+from datetime import date
+from queue import Queue
+from typing import Dict, Optional, Tuple
+from dotenv import load_dotenv
+from . import metrics
+
+load_dotenv()
+
+logger = logging.getLogger("clinic.live")
+
+LIVE_BROKER_URL = os.getenv("LIVE_BROKER_URL", "memory")
+LIVE_FLUSH_MS = int(os.getenv("LIVE_FLUSH_MS", "250"))
+LIVE_QUEUE_SIZE = int(os.getenv("LIVE_QUEUE_SIZE", "32"))  # ข้อความค้างต่อ client ก่อนตัดการเชื่อมต่อ
+LIVE_KEEPALIVE_SECONDS = 15
+CHANNEL = "clinic:live:availability"
+
+live_subscribers = metrics.Gauge("clinic_live_subscribers", "Connected availability stream clients")
+live_messages = metrics.Counter("clinic_live_messages_total", "Coalesced availability batches broadcast")
+live_dropped = metrics.Counter("clinic_live_dropped_total", "Clients disconnected for falling behind")
+
+Key = Tuple[str, str, str]  # (วันที่ ISO, หมอ, slot)
+
+class Hub:
+    """รวมการเปลี่ยนแปลงจาก broker แล้วกระจายให้ client ที่ต่ออยู่ใน worker นี้"""
+
+    def __init__(self):
+        self._pending: Dict[Key, int] = {}
+        self._pending_lock = threading.Lock()
+        self._subscribers = set()
+        self._task: Optional[asyncio.Task] = None
+
+    def add(self, changes):
+        # เรียกได้จากทุก thread (route แบบ sync / thread ของ redis)
+        if self._task is None:
+            return  # ยังไม่ได้ start (ไม่มีใครรับ)
+        with self._pending_lock:
+            for day, doctor, slot, delta in changes:
+                key = (day, doctor, slot)
+                self._pending[key] = self._pending.get(key, 0) + delta
+
+    def _drain(self):
+        with self._pending_lock:
+            pending, self._pending = self._pending, {}
+        # จองแล้วยกเลิกในรอบเดียวกัน = ไม่มีอะไรเปลี่ยน
+        return [
+            {"date": day, "doctor": doctor, "time_slot": slot, "delta": delta}
+            for (day, doctor, slot), delta in sorted(pending.items())
+            if delta
+        ]
+
+    def subscribe(self, date_from: Optional[date] = None, date_to: Optional[date] = None):
+        queue = asyncio.Queue(maxsize=LIVE_QUEUE_SIZE)
+        subscriber = (queue, date_from.isoformat() if date_from else None, date_to.isoformat() if date_to else None)
+        self._subscribers.add(subscriber)
+        live_subscribers.inc()
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        if subscriber in self._subscribers:
+            self._subscribers.discard(subscriber)
+            live_subscribers.dec()
+
+    def _fan_out(self, changes):
+        for subscriber in list(self._subscribers):
+            queue, date_from, date_to = subscriber
+            wanted = [
+                c for c in changes
+                if (date_from is None or c["date"] >= date_from) and (date_to is None or c["date"] <= date_to)
+            ]
+            if not wanted:
+                continue
+            try:
+                queue.put_nowait(wanted)
+            except asyncio.QueueFull:
+                # client อ่านไม่ทัน: ตัดทิ้ง ให้ต่อใหม่แล้วโหลดเวลาว่างใหม่ทั้งหมด
+                self.unsubscribe(subscriber)
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(None)
+                live_dropped.inc()
+        live_messages.inc()
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(LIVE_FLUSH_MS / 1000)
+            changes = self._drain()
+            if changes:
+                self._fan_out(changes)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+hub = Hub()
+
+# ---------------- Broker ----------------
+class MemoryBroker:
+    def publish(self, changes):
+        hub.add(changes)
+
+    def start(self):
+        pass
+
+    def stop(self):
+        pass
+
+
+class RedisBroker:
+    """publish ไปที่ channel เดียว ทุก worker subscribe แล้วส่งต่อเข้า hub ของตัวเอง"""
+
+    def __init__(self, client):
+        self.client = client
+        self._pubsub = None
+        self._thread = None
+
+    def publish(self, changes):
+        self.client.publish(CHANNEL, json.dumps(changes))
+
+    def _listen(self):
+        for message in self._pubsub.listen():
+            if message.get("type") != "message":
+                continue
+            try:
+                hub.add(json.loads(message["data"]))
+            except (TypeError, ValueError):
+                logger.warning("invalid live message: %r", message["data"])
+
+    def start(self):
+        self._pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+        self._pubsub.subscribe(CHANNEL)
+        self._thread = threading.Thread(target=self._listen, name="live-broker", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._pubsub is not None:
+            self._pubsub.close()
+
+
+class LocalRedis:
+    """client จำลองที่มีเฉพาะคำสั่ง pub/sub ที่ RedisBroker ใช้"""
+
+    def __init__(self):
+        self._queues = []
+        self._lock = threading.Lock()
+
+    def publish(self, channel, data):
+        with self._lock:
+            for queue_channel, queue in self._queues:
+                if queue_channel == channel:
+                    queue.put(data.encode())
+
+    def pubsub(self, ignore_subscribe_messages=True):
+        return _LocalPubSub(self)
+
+
+class _LocalPubSub:
+    def __init__(self, client: LocalRedis):
+        self.client = client
+        self.queue = Queue()
+        self.channel = None
+
+    def subscribe(self, channel):
+        self.channel = channel
+        with self.client._lock:
+            self.client._queues.append((channel, self.queue))
+
+    def listen(self):
+        while True:
+            data = self.queue.get()
+            if data is None:
+                return
+            yield {"type": "message", "channel": self.channel, "data": data}
+
+    def close(self):
+        with self.client._lock:
+            self.client._queues = [q for q in self.client._queues if q[1] is not self.queue]
+        self.queue.put(None)
+
+
+def make_broker():
+    if LIVE_BROKER_URL.startswith("redis://") or LIVE_BROKER_URL.startswith("rediss://"):
+        import redis
+        return RedisBroker(redis.Redis.from_url(LIVE_BROKER_URL))
+    if LIVE_BROKER_URL == "local-redis":
+        return RedisBroker(LocalRedis())
+    return MemoryBroker()
+
+broker = make_broker()
+
+# ---------------- API ----------------
+def publish(*changes):
+    """
+    changes: (appointment_date, doctor_name, time_slot, delta) โดย delta = +1 จอง / -1 ยกเลิก
+    เรียกหลัง commit เท่านั้น
+    """
+    changes = [(d.isoformat(), doctor or "", slot, delta) for d, doctor, slot, delta in changes if d and slot]
+    if not changes:
+        return
+    try:
+        broker.publish(changes)
+    except Exception:
+        # การแจ้งเตือนล้มเหลวต้องไม่ทำให้การจองล้มเหลว
+        logger.exception("live publish failed")
+
+def booked(appointment):
+    return (appointment.appointment_date, appointment.doctor_name, appointment.time_slot, 1)
+
+def released(appointment_date, doctor_name, time_slot):
+    return (appointment_date, doctor_name, time_slot, -1)
+
+async def start():
+    hub.start()
+    broker.start()
+
+async def stop():
+    broker.stop()
+    await hub.stop()
+
+def _event(data) -> str:
+    return f"data: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+async def stream(request, date_from: Optional[date] = None, date_to: Optional[date] = None):
+    """ตัวสร้างข้อความ SSE ของ client หนึ่งคน"""
+    subscriber = hub.subscribe(date_from, date_to)
+    queue = subscriber[0]
+    try:
+        # แจ้งให้ client โหลดเวลาว่างตั้งต้นก่อน แล้วใช้ delta ต่อจากนั้น
+        yield "event: ready\ndata: {}\n\n"
+        while True:
+            try:
+                changes = await asyncio.wait_for(queue.get(), timeout=LIVE_KEEPALIVE_SECONDS)
+            except asyncio.TimeoutError:
+                if await request.is_disconnected():
+                    return
+                yield ": keepalive\n\n"
+                continue
+            if changes is None:
+                # ถูกตัดเพราะอ่านไม่ทัน
+                yield "event: resync\ndata: {}\n\n"
+                return
+            yield _event(changes)
+    finally:
+        hub.unsubscribe(subscriber)
@@ -1,22 +1,46 @@
+from contextlib import asynccontextmanager
+import logging
 from fastapi import FastAPI
-from .database import engine, Base
-import app.models  # ต้อง import models ก่อน create_all
+from fastapi.responses import PlainTextResponse
+from .database import engine, async_engine, replica_engine, async_replica_engine, pool_stats
+from . import metrics, hashing, live, jobs
 from fastapi.middleware.cors import CORSMiddleware
 from dotenv import load_dotenv
 from starlette.middleware.sessions import SessionMiddleware # <--- IMPORT นี้
 import os
 
-from .routes import users, appointments, doctor, google_auth
+from .routes import users, appointments, doctor, google_auth, data_transfer, reports, patients, bootstrap
 
 load_dotenv()
 
+logger = logging.getLogger("clinic")
 
-print("Creating tables...")
-Base.metadata.create_all(bind=engine)
-print("Tables created")
+# import app ต้องไม่แตะฐานข้อมูล: สร้างตารางด้วย `python -m app.manage init-db` ก่อนรัน server
+# (ตั้ง DB_AUTO_CREATE=true เพื่อให้สร้างตอน startup แบบเดิม สำหรับ dev)
+DB_AUTO_CREATE = os.getenv("DB_AUTO_CREATE", "false").lower() in ("1", "true", "yes")
 
-app = FastAPI()  # Instantiate FastAPI app
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if DB_AUTO_CREATE:
+        from .manage import init_db
+        init_db()
+    await live.start()
+    await jobs.start()
+    yield
+    await jobs.stop()
+    await live.stop()
+    hashing.shutdown()
+    await async_engine.dispose()
+    if async_replica_engine is not None:
+        await async_replica_engine.dispose()
+    engine.dispose()
 
+app = FastAPI(lifespan=lifespan)  # Instantiate FastAPI app
+
+
+for _engine in (engine, async_engine, replica_engine, async_replica_engine):
+    if _engine is not None:
+        metrics.instrument_engine(_engine)
 
 app.add_middleware(SessionMiddleware, secret_key=os.getenv("SESSION_SECRET", "super-secret-key-for-session"))
 
@@ -25,6 +49,10 @@ app.include_router(users.router)
 app.include_router(appointments.router)
 app.include_router(doctor.router)
 app.include_router(google_auth.router, prefix="/auth")
+app.include_router(data_transfer.router)
+app.include_router(reports.router)
+app.include_router(patients.router)
+app.include_router(bootstrap.router)
 
 
 
@@ -44,6 +72,14 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# วัดเวลา/จำนวน query ต่อ request (เพิ่มท้ายสุด = ครอบ middleware อื่นทั้งหมด)
+app.add_middleware(metrics.MetricsMiddleware)
+
+@app.get("/metrics", include_in_schema=False)
+def read_metrics():
+    metrics.update_pool_stats(pool_stats())
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
 @app.get("/")
 def read_root():
     return {"message": "Hello FastAPI with PostgreSQL!"}
@@ -0,0 +1,239 @@
+# manage.py
+# คำสั่งจัดการที่รันแยกจาก server
+# ใช้: python -m app.manage init-db
+#     python -m app.manage purge-idempotency
+#     python -m app.manage purge-refresh-tokens
+#     python -m app.manage rebuild-daily-counts [--from YYYY-MM-DD] [--to YYYY-MM-DD]
+#     python -m app.manage check-daily-counts [--from YYYY-MM-DD] [--to YYYY-MM-DD]
+#     python -m app.manage run-worker
+#     python -m app.manage archive-appointments [--days N] [--batch-size N] [--max-batches N]
+#     python -m app.manage purge-jobs
+import argparse
+import asyncio
+import logging
+import sys
+from datetime import date
+from sqlalchemy import inspect, select, text, update
+from sqlalchemy.orm import Session
+from sqlalchemy.schema import CreateTable
+from .database import engine, Base, SessionLocal
+from . import archive, crud, models, schedules, idempotency, reports, jobs, patient_search  # ต้อง import models ก่อน create_all
+
+logger = logging.getLogger("clinic")
+
+# ---------------- Migrations ----------------
+# create_all สร้างได้เฉพาะตารางที่ยังไม่มี การแก้ตารางที่มีอยู่แล้วเขียนเป็น DDL ตรง ๆ ทีละขั้นด้านล่าง
+# ทุกขั้นตรวจก่อนว่ายังต้องทำ (รัน init-db ซ้ำได้) และทั้งหมดอยู่ใน transaction เดียว
+# แก้ models ของตารางเดิมเมื่อไร ต้องเพิ่มขั้นที่นี่ด้วย
+def _columns(conn, table: str):
+    return {c["name"]: c for c in inspect(conn).get_columns(table)}
+
+def _unique_constraints(conn, table: str):
+    return {c["name"] for c in inspect(conn).get_unique_constraints(table)}
+
+def _add_appointment_doctor_columns(conn):
+    """นัดหมายผูกกับหมอ (doctor_id) และลำดับที่นั่งในเวลาเดียวกัน (seat)"""
+    columns = _columns(conn, "appointments")
+    if "doctor_id" not in columns:
+        conn.execute(text("ALTER TABLE appointments ADD COLUMN doctor_id INTEGER REFERENCES doctors (id)"))
+        logger.info("added column appointments.doctor_id")
+    if "seat" not in columns:
+        conn.execute(text("ALTER TABLE appointments ADD COLUMN seat INTEGER DEFAULT 0 NOT NULL"))
+        logger.info("added column appointments.seat")
+
+def _add_user_legacy_id(conn):
+    """id ผู้ป่วยในระบบเก่า (นำเข้า) ใช้แปลง user_id ของนัดหมายที่นำเข้า (unique index สร้างใน _migrate)"""
+    if "legacy_id" not in _columns(conn, "users"):
+        conn.execute(text("ALTER TABLE users ADD COLUMN legacy_id INTEGER"))
+        logger.info("added column users.legacy_id")
+
+def _link_appointment_doctors(db: Session):
+    """นัดหมายเดิมที่มีแค่ชื่อหมอ ผูก doctor_id ตามชื่อ (ต้องทำก่อนตั้ง NOT NULL)"""
+    A = models.Appointment
+    names = db.scalars(select(A.doctor_name).where(A.doctor_id.is_(None)).distinct()).all()
+    for name, doctor_id in schedules.doctor_ids(db, names).items():
+        same_name = A.doctor_name.is_(None) if name is None else A.doctor_name == name
+        db.execute(update(A).where(A.doctor_id.is_(None), same_name).values(doctor_id=doctor_id))
+
+# นัดเดิมที่ หมอ/วัน/เวลา ซ้ำกัน (ก่อนมีที่นั่ง) ได้ seat ต่อกันตามลำดับ id ไม่ชน unique constraint ใหม่
+ASSIGN_DUPLICATE_SEATS = text("""
+    UPDATE appointments SET seat = (
+        SELECT COUNT(*) FROM appointments AS earlier
+        WHERE earlier.doctor_id = appointments.doctor_id
+          AND earlier.appointment_date = appointments.appointment_date
+          AND earlier.appointment_time = appointments.appointment_time
+          AND earlier.id < appointments.id
+    )
+    WHERE EXISTS (
+        SELECT 1 FROM appointments AS other
+        WHERE other.doctor_id = appointments.doctor_id
+          AND other.appointment_date = appointments.appointment_date
+          AND other.appointment_time = appointments.appointment_time
+          AND other.id <> appointments.id
+    )
+""")
+
+def _appointment_constraints_postgresql(conn):
+    """
+    unique (date, time) เดิม -> unique (หมอ, วัน, เวลา, ที่นั่ง) และ doctor_id NOT NULL
+    (NULL ไม่ชนกันใน unique constraint: นัดที่ไม่มีหมอจะหลุดจากการกันจองซ้ำ)
+    """
+    conn.execute(text("ALTER TABLE appointments DROP CONSTRAINT IF EXISTS uq_appointments_date_time"))
+    if _columns(conn, "appointments")["doctor_id"]["nullable"]:
+        conn.execute(text("ALTER TABLE appointments ALTER COLUMN doctor_id SET NOT NULL"))
+        logger.info("appointments.doctor_id is now NOT NULL")
+    if "uq_appointments_doctor_date_time_seat" not in _unique_constraints(conn, "appointments"):
+        conn.execute(ASSIGN_DUPLICATE_SEATS)
+        conn.execute(text(
+            "ALTER TABLE appointments ADD CONSTRAINT uq_appointments_doctor_date_time_seat "
+            "UNIQUE (doctor_id, appointment_date, appointment_time, seat)"
+        ))
+        logger.info("added constraint uq_appointments_doctor_date_time_seat")
+
+def _appointment_constraints_sqlite(conn):
+    """
+    SQLite แก้ constraint / NOT NULL / AUTOINCREMENT ของตารางเดิมไม่ได้: สร้างตารางใหม่ตาม models
+    ตารางที่ไม่มี AUTOINCREMENT นำ id ที่ย้ายไป archive กลับมาใช้ จึงเริ่ม id ต่อจาก archive ด้วย
+    """
+    uniques = _unique_constraints(conn, "appointments")
+    if not (
+        "uq_appointments_date_time" in uniques
+        or "uq_appointments_doctor_date_time_seat" not in uniques
+        or _columns(conn, "appointments")["doctor_id"]["nullable"]
+        or archive.reuses_ids(conn)
+    ):
+        return
+    if "uq_appointments_doctor_date_time_seat" not in uniques:
+        conn.execute(ASSIGN_DUPLICATE_SEATS)
+    _rebuild_sqlite_table(conn, models.Appointment.__table__)
+    conn.execute(text("DELETE FROM sqlite_sequence WHERE name = 'appointments'"))
+    conn.execute(text(
+        "INSERT INTO sqlite_sequence (name, seq) SELECT 'appointments', COALESCE(MAX(id), 0) "
+        "FROM (SELECT id FROM appointments UNION ALL SELECT id FROM appointments_archive)"
+    ))
+
+def _rebuild_sqlite_table(conn, table):
+    """
+    SQLite แก้ตารางเดิม (AUTOINCREMENT / constraint) ด้วย ALTER ไม่ได้:
+    สร้างตารางใหม่ตาม models คัดลอกข้อมูล ลบตารางเดิม แล้วเปลี่ยนชื่อ (ใน transaction เดียว)
+    """
+    rebuilt = f"{table.name}_rebuild"
+    ddl = str(CreateTable(table).compile(dialect=conn.dialect))
+    conn.execute(text(ddl.replace(f"CREATE TABLE {table.name} ", f"CREATE TABLE {rebuilt} ", 1)))
+    columns = ", ".join(column.name for column in table.columns)
+    conn.execute(text(f"INSERT INTO {rebuilt} ({columns}) SELECT {columns} FROM {table.name}"))
+    conn.execute(text(f"DROP TABLE {table.name}"))
+    conn.execute(text(f"ALTER TABLE {rebuilt} RENAME TO {table.name}"))
+    logger.info("rebuilt table %s", table.name)
+
+def _migrate():
+    with SessionLocal() as db:
+        conn = db.connection()
+        _add_appointment_doctor_columns(conn)
+        _add_user_legacy_id(conn)
+        _link_appointment_doctors(db)
+        if conn.dialect.name == "postgresql":
+            _appointment_constraints_postgresql(conn)
+        elif conn.dialect.name == "sqlite":
+            _appointment_constraints_sqlite(conn)
+        # index ใหม่ของตารางเดิม (create_all ไม่เพิ่มให้)
+        for model in (models.Appointment, models.User):
+            for index in model.__table__.indexes:
+                index.create(conn, checkfirst=True)
+        db.commit()
+
+def _seed_doctors():
+    with SessionLocal() as db:
+        if schedules.seed_defaults(db):
+            logger.info("seeded default doctors")
+
+def init_db():
+    """สร้างตารางที่ยังไม่มี เพิ่มคอลัมน์ใหม่ และเพิ่มหมอเริ่มต้น"""
+    backfill_counts = not inspect(engine).has_table(models.DailyAppointmentCount.__tablename__)
+    Base.metadata.create_all(bind=engine)
+    _seed_doctors()  # ก่อน _migrate: นัดหมายเดิมผูกกับหมอเริ่มต้นตามชื่อ
+    _migrate()
+    if engine.dialect.name == "postgresql":
+        with engine.begin() as conn:
+            patient_search.create_pg_index(conn)  # expression index: create_all สร้างให้ไม่ได้
+    if backfill_counts:
+        # ตารางสรุปเพิ่งสร้าง: นับจากนัดหมายที่มีอยู่แล้ว
+        rebuild_daily_counts()
+    logger.info("database schema is up to date")
+
+def purge_idempotency():
+    with SessionLocal() as db:
+        logger.info("deleted %d expired idempotency keys", idempotency.purge(db))
+
+def purge_refresh_tokens():
+    with SessionLocal() as db:
+        logger.info("deleted %d expired refresh tokens", crud.purge_refresh_tokens(db))
+
+def purge_jobs():
+    with SessionLocal() as db:
+        logger.info("deleted %d finished jobs", jobs.purge(db))
+
+def run_worker():
+    """worker แยก process (ตั้ง JOBS_WORKER_ENABLED=false ใน server ถ้าไม่ต้องการให้ server ทำงานเองด้วย)"""
+    logger.info("job worker %s started", jobs.worker.name)
+    try:
+        asyncio.run(jobs.run_forever())
+    except KeyboardInterrupt:
+        pass
+
+def archive_appointments(days=None, batch_size=archive.ARCHIVE_BATCH_SIZE, max_batches=None):
+    with SessionLocal() as db:
+        moved = archive.archive(db, days, batch_size, max_batches)
+    logger.info("archived %d appointments before %s", moved, archive.cutoff(days))
+
+def rebuild_daily_counts(date_from=None, date_to=None):
+    with SessionLocal() as db:
+        logger.info("rebuilt %d daily count rows", reports.rebuild(db, date_from, date_to))
+
+def check_daily_counts(date_from=None, date_to=None) -> bool:
+    with SessionLocal(info={"read_only": True}) as db:
+        mismatches = reports.check(db, date_from, date_to)
+    for key, expected, stored in mismatches[:50]:
+        logger.warning("mismatch %s: appointments=%d summary=%d", key, expected, stored)
+    if mismatches:
+        logger.error("%d daily count rows differ, run rebuild-daily-counts", len(mismatches))
+        return False
+    logger.info("daily counts match appointments")
+    return True
+
+def _add_range_arguments(parser):
+    parser.add_argument("--from", dest="date_from", type=date.fromisoformat, default=None)
+    parser.add_argument("--to", dest="date_to", type=date.fromisoformat, default=None)
+    return parser
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m app.manage")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    commands.add_parser("init-db", help="สร้างตารางในฐานข้อมูล").set_defaults(func=lambda args: init_db())
+    commands.add_parser("purge-idempotency", help="ลบ Idempotency-Key ที่หมดอายุ (ตั้งเป็น cron)").set_defaults(
+        func=lambda args: purge_idempotency()
+    )
+    commands.add_parser("purge-refresh-tokens", help="ลบ refresh token ที่หมดอายุ (ตั้งเป็น cron)").set_defaults(
+        func=lambda args: purge_refresh_tokens()
+    )
+    commands.add_parser("run-worker", help="ทำงานในคิว jobs (แยกจาก server)").set_defaults(func=lambda args: run_worker())
+    commands.add_parser("purge-jobs", help="ลบงานที่ทำเสร็จแล้ว (ตั้งเป็น cron)").set_defaults(func=lambda args: purge_jobs())
+    archive_parser = commands.add_parser("archive-appointments", help="ย้ายนัดหมายเก่าไป appointments_archive (ตั้งเป็น cron)")
+    archive_parser.add_argument("--days", type=int, default=None, help=f"เก่ากว่ากี่วัน (ค่าเริ่มต้น {archive.ARCHIVE_AFTER_DAYS})")
+    archive_parser.add_argument("--batch-size", type=int, default=archive.ARCHIVE_BATCH_SIZE)
+    archive_parser.add_argument("--max-batches", type=int, default=None)
+    archive_parser.set_defaults(func=lambda args: archive_appointments(args.days, args.batch_size, args.max_batches))
+    _add_range_arguments(
+        commands.add_parser("rebuild-daily-counts", help="คำนวณตารางสรุปรายวันใหม่จาก appointments")
+    ).set_defaults(func=lambda args: rebuild_daily_counts(args.date_from, args.date_to))
+    _add_range_arguments(
+        commands.add_parser("check-daily-counts", help="ตรวจว่าตารางสรุปรายวันตรงกับ appointments (ไม่ตรง exit 1)")
+    ).set_defaults(func=lambda args: check_daily_counts(args.date_from, args.date_to) or sys.exit(1))
+
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    args.func(args)
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
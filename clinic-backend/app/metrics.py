@@ -0,0 +1,176 @@
+# metrics.py
+# metric ต่อ request และต่อ SQL query ในรูปแบบ Prometheus (GET /metrics)
+import bisect
+import logging
+import os
+import threading
+import time
+from contextvars import ContextVar
+from sqlalchemy import event
+
+sql_logger = logging.getLogger("clinic.sql")
+
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "200"))
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+REGISTRY = []
+
+def _format_labels(labelnames, values, extra=""):
+    parts = [f'{name}="{str(value)}"' for name, value in zip(labelnames, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labelnames=()):
+        self.name, self.help, self.labelnames = name, help, tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def inc(self, *labels, amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, _format_labels(self.labelnames, k), v) for k, v in sorted(self._values.items())]
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, *labels, amount: float = 1):
+        self.inc(*labels, amount=-amount)
+
+    def set(self, *labels, value: float):
+        with self._lock:
+            self._values[labels] = value
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name, self.help, self.labelnames = name, help, tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._values = {}  # labels -> [counts ต่อ bucket..., sum, count]
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def observe(self, *labels, value: float):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.setdefault(labels, [0] * len(self.buckets) + [0.0, 0])
+            if index < len(self.buckets):
+                entry[index] += 1
+            entry[-2] += value
+            entry[-1] += 1
+
+    def samples(self):
+        out = []
+        with self._lock:
+            for labels, entry in sorted(self._values.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets, entry):
+                    cumulative += count
+                    out.append((f"{self.name}_bucket", _format_labels(self.labelnames, labels, f'le="{bound}"'), cumulative))
+                out.append((f"{self.name}_bucket", _format_labels(self.labelnames, labels, 'le="+Inf"'), entry[-1]))
+                out.append((f"{self.name}_sum", _format_labels(self.labelnames, labels), entry[-2]))
+                out.append((f"{self.name}_count", _format_labels(self.labelnames, labels), entry[-1]))
+        return out
+
+def render() -> str:
+    lines = []
+    for metric in REGISTRY:
+        lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        for name, labels, value in metric.samples():
+            lines.append(f"{name}{labels} {value}")
+    return "\n".join(lines) + "\n"
+
+# ---------------- Metrics ----------------
+http_requests = Counter("clinic_http_requests_total", "HTTP requests", ("method", "route", "status"))
+http_latency = Histogram("clinic_http_request_duration_seconds", "HTTP request latency", ("method", "route"))
+http_in_flight = Gauge("clinic_http_requests_in_flight", "HTTP requests being processed")
+db_queries = Counter("clinic_db_queries_total", "SQL queries executed", ("route",))
+db_query_time = Histogram("clinic_db_query_duration_seconds", "SQL query latency", ("route",))
+db_queries_per_request = Histogram("clinic_db_queries_per_request", "SQL queries per HTTP request", ("route",), buckets=QUERY_COUNT_BUCKETS)
+db_pool = Gauge("clinic_db_pool_connections", "Connection pool state", ("engine", "state"))
+db_slow_queries = Counter("clinic_db_slow_queries_total", f"SQL queries slower than {SLOW_QUERY_MS}ms", ("route",))
+
+def update_pool_stats(stats: dict):
+    for engine_name, values in stats.items():
+        for state, value in values.items():
+            db_pool.set(engine_name, state, value=value)
+
+# ข้อมูลของ request ปัจจุบัน (dict ถูกแชร์ไปยัง threadpool ที่รัน route แบบ sync)
+_request_stats: ContextVar = ContextVar("request_stats", default=None)
+
+def _route_of(scope) -> str:
+    route = scope.get("route")
+    return getattr(route, "path", None) or "unmatched"
+
+class MetricsMiddleware:
+    """ASGI middleware: วัดเวลา/สถานะต่อ route และจำนวน query ต่อ request"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        stats = {"queries": 0, "scope": scope}
+        token = _request_stats.set(stats)
+        status_holder = {"status": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status_holder["status"] = message["status"]
+            await send(message)
+
+        http_in_flight.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            http_in_flight.dec()
+            route = _route_of(scope)
+            http_requests.inc(scope["method"], route, status_holder["status"])
+            http_latency.observe(scope["method"], route, value=elapsed)
+            db_queries_per_request.observe(route, value=stats["queries"])
+            _request_stats.reset(token)
+
+# ---------------- SQLAlchemy ----------------
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["query_start"].pop()
+    stats = _request_stats.get()
+    route = _route_of(stats["scope"]) if stats else "background"
+    if stats:
+        stats["queries"] += 1
+    db_queries.inc(route)
+    db_query_time.observe(route, value=elapsed)
+    if elapsed * 1000 >= SLOW_QUERY_MS:
+        db_slow_queries.inc(route)
+        sql_logger.warning("slow query %.1fms route=%s: %s", elapsed * 1000, route, statement)
+
+def _handle_error(context):
+    # query ที่ error จะไม่เรียก after_cursor_execute
+    starts = context.connection.info.get("query_start") if context.connection is not None else None
+    if starts:
+        starts.pop()
+
+def instrument_engine(engine):
+    """รับได้ทั้ง Engine และ AsyncEngine"""
+    sync_engine = getattr(engine, "sync_engine", engine)
+    if not event.contains(sync_engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(sync_engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(sync_engine, "after_cursor_execute", _after_cursor_execute)
+        event.listen(sync_engine, "handle_error", _handle_error)
\ No newline at end of file
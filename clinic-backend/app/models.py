@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Date, Time
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Date, Time, Index, UniqueConstraint, Boolean, Text
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from .database import Base
@@ -21,14 +21,50 @@ class User(Base):
     allergies = Column(String, nullable=True)
     chronic_conditions = Column(String, nullable=True)
     current_medications = Column(String, nullable=True)
+    # id ในระบบเก่า (นำเข้าผู้ป่วย) ใช้แปลง user_id ของนัดหมายที่นำเข้าตามมา
+    legacy_id = Column(Integer, unique=True, index=True, nullable=True)
 
     appointments = relationship("Appointment", cascade="all, delete-orphan", back_populates="user")
+    archived_appointments = relationship("ArchivedAppointment", cascade="all, delete-orphan")
+
+
+class Doctor(Base):
+    __tablename__ = "doctors"
+
+    id = Column(Integer, primary_key=True, index=True)
+    name = Column(String, unique=True, nullable=False)
+    active = Column(Boolean, default=True, nullable=False)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    schedules = relationship("DoctorSchedule", cascade="all, delete-orphan", back_populates="doctor")
+
+
+class DoctorSchedule(Base):
+    """ตารางออกตรวจประจำสัปดาห์ วันที่ไม่มีแถว = วันหยุดของหมอคนนั้น"""
+    __tablename__ = "doctor_schedules"
+
+    id = Column(Integer, primary_key=True, index=True)
+    doctor_id = Column(Integer, ForeignKey("doctors.id", ondelete="CASCADE"), nullable=False)
+    weekday = Column(Integer, nullable=False)  # 0 = จันทร์ ... 6 = อาทิตย์
+    time_slot = Column(String, nullable=False)  # เช้า / บ่าย
+    start_time = Column(Time, nullable=False)
+    last_time = Column(Time, nullable=False)  # เวลานัดสุดท้าย
+    slot_minutes = Column(Integer, default=30, nullable=False)
+    capacity = Column(Integer, default=1, nullable=False)  # จำนวนผู้ป่วยต่อเวลา
+
+    doctor = relationship("Doctor", back_populates="schedules")
+
+    __table_args__ = (
+        UniqueConstraint("doctor_id", "weekday", "time_slot", name="uq_doctor_schedules_doctor_weekday_slot"),
+    )
 
 
 class Appointment(Base):
     __tablename__ = "appointments"
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"))
+    # หมอไม่ถูกลบ (ตั้ง active=False แทน) ชื่อที่ไม่มีในระบบผูกกับหมอที่ไม่ออกตรวจ (schedules.doctor_ids)
+    doctor_id = Column(Integer, ForeignKey("doctors.id"), nullable=False)
     doctor_name = Column(String)
     appointment_date = Column(Date)
     appointment_time = Column(Time)
@@ -37,5 +73,111 @@ class Appointment(Base):
     status = Column(String, default="รอการยืนยัน")
     created_at = Column(DateTime)
     updated_at = Column(DateTime)
+    seat = Column(Integer, default=0, server_default="0", nullable=False)  # ลำดับที่ในเวลาเดียวกัน (capacity > 1)
+
+    user = relationship("User", back_populates="appointments")
+
+    # index สำหรับ keyset pagination (appointment_date, appointment_time, id) และ filter ที่ใช้บ่อย
+    # ที่นั่งหนึ่งของหมอแต่ละคนถูกจองได้ครั้งเดียว (ใช้เป็นตัวล็อกตอนจองพร้อมกัน ดู slots.py)
+    __table_args__ = (
+        UniqueConstraint("doctor_id", "appointment_date", "appointment_time", "seat", name="uq_appointments_doctor_date_time_seat"),
+        Index("ix_appointments_doctor_id_date_slot", "doctor_id", "appointment_date", "time_slot"),
+        Index("ix_appointments_date_time_id", "appointment_date", "appointment_time", "id"),
+        Index("ix_appointments_user_date_time_id", "user_id", "appointment_date", "appointment_time", "id"),
+        Index("ix_appointments_doctor_date_time_id", "doctor_name", "appointment_date", "appointment_time", "id"),
+        Index("ix_appointments_status_date_time_id", "status", "appointment_date", "appointment_time", "id"),
+        # SQLite: ไม่นำ id ที่ถูกย้ายไป archive กลับมาใช้ใหม่ (PostgreSQL ใช้ sequence อยู่แล้ว)
+        {"sqlite_autoincrement": True},
+    )
+
+class ArchivedAppointment(Base):
+    """
+    นัดหมายที่ผ่านไปนานแล้ว ย้ายออกจาก appointments ด้วย `python -m app.manage archive-appointments` (ดู archive.py)
+    คอลัมน์และ id เหมือนเดิม อ่านได้อย่างเดียว
+    """
+    __tablename__ = "appointments_archive"
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"))
+    doctor_id = Column(Integer, nullable=True)
+    doctor_name = Column(String)
+    appointment_date = Column(Date)
+    appointment_time = Column(Time)
+    time_slot = Column(String)
+    reason = Column(String, nullable=True)
+    status = Column(String)
+    created_at = Column(DateTime)
+    updated_at = Column(DateTime)
+    seat = Column(Integer, default=0, nullable=False)
+    archived_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+    __table_args__ = (
+        Index("ix_appointments_archive_date_time_id", "appointment_date", "appointment_time", "id"),
+        Index("ix_appointments_archive_user_date_time_id", "user_id", "appointment_date", "appointment_time", "id"),
+    )
+
+
+class DailyAppointmentCount(Base):
+    """
+    จำนวนนัดหมายต่อ (วัน, หมอ, ช่วงเวลา, สถานะ) ปรับทุกครั้งที่เขียน appointments (ดู reports.py)
+    หมอ/ช่วงเวลาที่ไม่มีค่าเก็บเป็น "" (NULL ใน primary key ไม่ได้)
+    """
+    __tablename__ = "daily_appointment_counts"
+
+    appointment_date = Column(Date, primary_key=True)
+    doctor_name = Column(String, primary_key=True)
+    time_slot = Column(String, primary_key=True)
+    status = Column(String, primary_key=True)
+    count = Column(Integer, default=0, nullable=False)
+
+
+class Job(Base):
+    """งานเบื้องหลัง (ยืนยันการจอง / เตือนนัด / audit) ดู jobs.py"""
+    __tablename__ = "jobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    kind = Column(String(64), nullable=False)
+    payload = Column(Text, nullable=False)  # JSON
+    status = Column(String(16), default="pending", nullable=False)  # pending / running / done / failed
+    run_at = Column(DateTime, default=datetime.utcnow, nullable=False)  # ทำได้ตั้งแต่เวลานี้ (UTC)
+    attempts = Column(Integer, default=0, nullable=False)
+    max_attempts = Column(Integer, default=5, nullable=False)
+    locked_by = Column(String, nullable=True)
+    locked_at = Column(DateTime, nullable=True)
+    last_error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    finished_at = Column(DateTime, nullable=True)
+
+    __table_args__ = (
+        Index("ix_jobs_status_run_at", "status", "run_at"),  # หางานที่ถึงเวลาทำ
+    )
+
+
+class RefreshToken(Base):
+    """refresh token (เก็บเฉพาะ hash) ใช้ครั้งเดียวแล้วออกใบใหม่ใน family เดิม"""
+    __tablename__ = "refresh_tokens"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True)
+    token_hash = Column(String(64), unique=True, nullable=False)
+    family_id = Column(String(32), nullable=False, index=True)  # ใบที่ออกต่อกันจาก login ครั้งเดียว
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    expires_at = Column(DateTime, nullable=False, index=True)
+    revoked_at = Column(DateTime, nullable=True)
+
+
+class IdempotencyKey(Base):
+    """คำตอบของ request ที่ส่ง Idempotency-Key มา (ต่อผู้ใช้) ใช้ตอบซ้ำเมื่อ client retry"""
+    __tablename__ = "idempotency_keys"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    key = Column(String(255), nullable=False)
+    request_hash = Column(String, nullable=False)  # กัน key เดิมถูกใช้กับ body อื่น
+    status_code = Column(Integer, nullable=True)
+    response_body = Column(Text, nullable=True)  # JSON
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
 
-    user = relationship("User", back_populates="appointments")
\ No newline at end of file
+    __table_args__ = (
+        UniqueConstraint("user_id", "key", name="uq_idempotency_keys_user_key"),
+        Index("ix_idempotency_keys_created_at", "created_at"),  # สำหรับลบรายการที่หมดอายุ
+    )
@@ -0,0 +1,298 @@
+# patient_search.py
+# ค้นหาผู้ป่วยจากชื่อ / นามสกุล / เบอร์โทร / อีเมล / username (ตรงต้นคำ บางส่วน หรือสะกดใกล้เคียง)
+# - PostgreSQL: pg_trgm + GIN index บน search_document() (manage.init_db สร้างให้)
+# - ฐานข้อมูลอื่น (SQLite): trigram index ใน process สร้างจากตาราง users ครั้งแรกที่ค้นหา
+#   แล้วอัปเดตทุกครั้งที่ commit การเพิ่ม/แก้/ลบ User ผ่าน ORM
+#   (แต่ละ worker มี index ของตัวเอง ตั้ง SEARCH_INDEX_TTL_SECONDS ให้สร้างใหม่เป็นระยะถ้ามีหลาย worker)
+import base64
+import heapq
+import math
+import os
+import threading
+import time as _time
+from array import array
+from bisect import bisect_left, insort
+from collections import Counter, defaultdict
+from operator import itemgetter
+from typing import Dict, List, Optional, Set
+from fastapi import HTTPException
+from sqlalchemy import event, func, literal_column, or_, select
+from sqlalchemy.orm import Session, object_session
+from . import models
+
+SEARCH_MIN_SIMILARITY = float(os.getenv("SEARCH_MIN_SIMILARITY", "0.5"))  # สัดส่วน trigram ของคำค้นที่ต้องพบ
+SEARCH_INDEX_TTL_SECONDS = float(os.getenv("SEARCH_INDEX_TTL_SECONDS", "0"))  # 0 = ไม่สร้างใหม่ตามเวลา
+SEARCH_MAX_CANDIDATES = int(os.getenv("SEARCH_MAX_CANDIDATES", "1000"))  # ตรวจเอกสารกี่รายการก่อนหยุดเมื่อได้ครบหน้า
+SEARCH_COMMON_TRIGRAM_DOCS = int(os.getenv("SEARCH_COMMON_TRIGRAM_DOCS", "5000"))  # trigram ที่พบบ่อยกว่านี้ไม่ใช้หาคำสะกดใกล้เคียง
+SCAN_CHUNK = 256
+MIN_QUERY_LENGTH = 3  # สั้นกว่า trigram ใช้ index ไม่ได้
+MAX_QUERY_LENGTH = 100
+MAX_OFFSET = 1000
+
+SEARCH_FIELDS = ("username", "email", "first_name", "last_name", "phone_number")
+PG_TRGM_INDEX = "ix_users_search_trgm"
+
+def normalize(text: str) -> str:
+    return " ".join(text.lower().split())
+
+def document(values) -> str:
+    return normalize(" ".join(v for v in values if v))
+
+def search_document():
+    """
+    นิพจน์เดียวกับ index ของ PostgreSQL (ต้องตรงกันทุกตัวอักษร planner จึงใช้ index ได้)
+    ใช้ || แทน concat_ws เพราะ index ต้องเป็น IMMUTABLE
+    """
+    U = models.User.__table__
+    parts = [f"coalesce({U.name}.{name}, '')" for name in SEARCH_FIELDS]
+    separator = " || ' ' || "
+    return literal_column(f"lower({separator.join(parts)})")
+
+def create_pg_index(conn):
+    conn.exec_driver_sql("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    conn.exec_driver_sql(
+        f"CREATE INDEX IF NOT EXISTS {PG_TRGM_INDEX} ON users USING gin (({search_document().text}) gin_trgm_ops)"
+    )
+
+def trigrams(text: str) -> Set[str]:
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+# ---------------- In-process index ----------------
+class NgramIndex:
+    def __init__(self):
+        self._docs: Dict[int, str] = {}
+        # trigram -> user ids เรียงจากน้อยไปมาก; array ไม่ถูก GC ไล่ตรวจ (list ของ id หลายล้านตัวทำให้ GC หยุดนาน)
+        self._postings: Dict[str, array] = {}
+        self._lock = threading.Lock()
+        self.loaded_at: Optional[float] = None
+
+    def _remove(self, user_id: int):
+        doc = self._docs.pop(user_id, None)
+        if doc is None:
+            return
+        for key in trigrams(doc):
+            ids = self._postings.get(key)
+            if ids is None:
+                continue
+            i = bisect_left(ids, user_id)
+            if i < len(ids) and ids[i] == user_id:
+                del ids[i]
+            if not ids:
+                del self._postings[key]
+
+    def apply(self, changes: Dict[int, Optional[str]]):
+        """changes: user_id -> document (None = ลบ)"""
+        if self.loaded_at is None:
+            return  # ยังไม่ได้สร้าง: โหลดครั้งแรกได้ข้อมูลล่าสุดอยู่แล้ว
+        with self._lock:
+            for user_id, doc in changes.items():
+                self._remove(user_id)
+                if doc is not None:
+                    self._docs[user_id] = doc
+                    for key in trigrams(doc):
+                        ids = self._postings.setdefault(key, array("q"))
+                        if not ids or ids[-1] < user_id:
+                            ids.append(user_id)  # ผู้ใช้ใหม่ได้ id มากสุดเสมอ
+                        else:
+                            insort(ids, user_id)
+
+    def build(self, rows):
+        """rows: (user_id, *SEARCH_FIELDS)"""
+        docs = {}
+        postings = defaultdict(list)
+        for user_id, *values in rows:
+            doc = document(values)
+            docs[user_id] = doc
+            for key in trigrams(doc):
+                postings[key].append(user_id)
+        postings = {key: array("q", sorted(ids)) for key, ids in postings.items()}
+        with self._lock:
+            self._docs, self._postings = docs, postings
+            self.loaded_at = _time.monotonic()
+
+    def load(self, db: Session):
+        U = models.User
+        self.build(db.execute(
+            select(U.id, *(getattr(U, name) for name in SEARCH_FIELDS)).order_by(U.id).execution_options(yield_per=5000)
+        ))
+
+    def ensure_loaded(self, db: Session):
+        expired = (
+            self.loaded_at is not None and SEARCH_INDEX_TTL_SECONDS
+            and _time.monotonic() - self.loaded_at > SEARCH_INDEX_TTL_SECONDS
+        )
+        if self.loaded_at is None or expired:
+            self.load(db)
+
+    def invalidate(self):
+        with self._lock:
+            self._docs, self._postings = {}, {}
+            self.loaded_at = None
+
+    def search(self, query: str, limit: int, offset: int = 0):
+        """
+        คืน (user ids ตามลำดับความตรง, มีหน้าถัดไปหรือไม่)
+        เอกสารที่มีคำค้นต้องอยู่ใน posting ของทุก trigram: เดินเฉพาะ list ที่สั้นที่สุดตามลำดับ id แล้วตรวจกับตัวเอกสาร
+        หยุดเมื่อได้ผลตรงต้นคำครบหน้า หรือเมื่อตรวจเกิน SEARCH_MAX_CANDIDATES และได้ผลครบหน้าแล้ว
+        (คำค้นที่พบเกือบทุกคน เช่น "gmail" ผลตรงต้นคำที่อยู่หลังช่วงที่ตรวจจะไม่ถูกเลื่อนขึ้นมา)
+        """
+        wanted = offset + limit + 1
+        max_candidates = max(SEARCH_MAX_CANDIDATES, wanted)
+        with self._lock:
+            grams = trigrams(query)
+            shortest = min((self._postings.get(g, ()) for g in grams), key=len)
+            # 1) มีคำค้นอยู่ในเอกสาร (ตรวจทีละช่วง: list comprehension เร็วกว่าวนทีละตัวมาก)
+            docs = self._docs
+            word_start, inside = [], []
+            spaced = " " + query  # ต้นคำใดก็ได้ในเอกสาร (เหมือน LIKE '% q%' ของ PostgreSQL)
+            for start in range(0, len(shortest), SCAN_CHUNK):
+                for user_id in [u for u in shortest[start:start + SCAN_CHUNK] if query in docs[u]]:
+                    doc = docs[user_id]
+                    if doc.startswith(query) or spaced in doc:
+                        word_start.append(user_id)
+                    else:
+                        inside.append(user_id)
+                checked = start + SCAN_CHUNK
+                if len(word_start) >= wanted or (checked >= max_candidates and len(word_start) + len(inside) >= wanted):
+                    break
+            ranked = word_start + inside
+            # 2) สะกดใกล้เคียง (ต่อท้ายเมื่อผลข้อ 1 ไม่พอ)
+            if len(ranked) < wanted:
+                ranked += self._similar(grams, set(ranked), wanted - len(ranked), max_candidates)
+        page = ranked[offset:wanted]
+        return page[:limit], len(page) > limit
+
+    def _similar(self, grams: Set[str], exclude: Set[int], count: int, max_candidates: int) -> List[int]:
+        """
+        เอกสารที่มี trigram ของคำค้นอย่างน้อย SEARCH_MIN_SIMILARITY เรียงตามจำนวนที่พบ
+        trigram ที่มีในเอกสารเกิน SEARCH_COMMON_TRIGRAM_DOCS (เช่น "com", "use") ไม่อ่าน posting ทั้ง list:
+        ผู้สมัครมาจาก trigram ที่ไม่ธรรมดา (พบมากก่อน) แล้วนับ trigram ธรรมดาจากตัวเอกสาร
+        ถ้าทุก trigram ธรรมดา ผู้สมัครคือต้น list ที่สั้นที่สุดตามลำดับ id; ตรวจไม่เกิน max_candidates
+        """
+        required = max(1, math.ceil(len(grams) * SEARCH_MIN_SIMILARITY))
+        rare, common = [], []
+        for g in grams:
+            ids = self._postings.get(g, ())
+            if len(ids) > SEARCH_COMMON_TRIGRAM_DOCS:
+                common.append(g)
+            elif ids:
+                rare.append(ids)
+        # จำนวนขั้นต่ำจาก trigram ที่ไม่ธรรมดา และต้องพบร่วมกันอย่างน้อย 2 ตัว (ถ้ามี) ตัดเอกสารที่บังเอิญมีตัวเดียว
+        need = max(required - len(common), min(2, len(rare)))
+        if rare:
+            hits = Counter()
+            for ids in rare:
+                hits.update(ids)
+            # เรียงด้วย sorted (C) เร็วกว่า most_common(n) ที่ใช้ heap ใน Python; ตัดที่ need ในลูปด้านล่าง
+            candidates = sorted(hits.items(), key=itemgetter(1), reverse=True)[:max_candidates]
+        else:
+            shortest = min((self._postings[g] for g in common), key=len, default=())
+            candidates = ((user_id, 0) for user_id in shortest[:max_candidates])
+        scored, best = [], []  # best: heap ของคะแนน count อันดับแรก
+        for user_id, found in candidates:
+            if found < need or (len(best) == count and found + len(common) <= best[0]):
+                break  # เรียงตามจำนวนที่พบ: ที่เหลือทำคะแนนได้ไม่เกินนี้
+            if user_id in exclude:
+                continue
+            if common:
+                doc = self._docs[user_id]
+                found += sum([g in doc for g in common])
+            if found >= required:
+                scored.append((-found, user_id))
+                if len(best) < count:
+                    heapq.heappush(best, found)
+                elif found > best[0]:
+                    heapq.heapreplace(best, found)
+        return [user_id for _, user_id in heapq.nsmallest(count, scored)]
+
+index = NgramIndex()
+
+def user_saved(session: Session, user: models.User):
+    """บันทึกการเปลี่ยนแปลง (ใช้กับ index หลัง commit) ; INSERT ที่ไม่ผ่าน unit of work ต้องเรียกเอง"""
+    session.info.setdefault("patient_search", {})[user.id] = document(getattr(user, name) for name in SEARCH_FIELDS)
+
+@event.listens_for(models.User, "after_insert")
+@event.listens_for(models.User, "after_update")
+def _user_saved(mapper, connection, user):
+    session = object_session(user)
+    if session is not None:
+        user_saved(session, user)
+
+@event.listens_for(models.User, "after_delete")
+def _user_deleted(mapper, connection, user):
+    session = object_session(user)
+    if session is not None:
+        session.info.setdefault("patient_search", {})[user.id] = None
+
+@event.listens_for(Session, "after_commit")
+def _apply_after_commit(session):
+    changes = session.info.pop("patient_search", None)
+    if changes:
+        index.apply(changes)
+
+@event.listens_for(Session, "after_rollback")
+def _discard_after_rollback(session):
+    session.info.pop("patient_search", None)
+
+# ---------------- Search ----------------
+def encode_cursor(offset: int) -> str:
+    return base64.urlsafe_b64encode(str(offset).encode()).decode()
+
+def decode_cursor(cursor: Optional[str]) -> int:
+    if not cursor:
+        return 0
+    try:
+        offset = int(base64.urlsafe_b64decode(cursor.encode()).decode())
+    except (ValueError, UnicodeDecodeError):
+        raise HTTPException(status_code=400, detail="cursor ไม่ถูกต้อง")
+    if not 0 <= offset <= MAX_OFFSET:
+        raise HTTPException(status_code=400, detail="cursor ไม่ถูกต้อง")
+    return offset
+
+def _search_pg(db: Session, query: str, limit: int, offset: int):
+    """
+    1) มีคำค้นในเอกสาร (%q% ใช้ GIN index): จัดลำดับเฉพาะ SEARCH_MAX_CANDIDATES แถวแรกที่ index คืนมา
+       ไม่คำนวณและเรียงทุกแถวที่ตรง (คำอย่าง "gmail" ตรงเกือบทุกคน)
+    2) สะกดใกล้เคียง (%> ใช้ GIN index) เมื่อข้อ 1 ไม่พอหน้า: คำนวณ word_similarity เฉพาะแถวที่ผ่านเกณฑ์ ไม่เกินจำนวนเดียวกัน
+    """
+    U = models.User
+    doc = search_document()
+    wanted = offset + limit + 1
+    max_candidates = max(SEARCH_MAX_CANDIDATES, wanted)
+    pattern = query.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    contains = doc.like(f"%{pattern}%", escape="\\")
+    word_start = or_(doc.like(f"{pattern}%", escape="\\"), doc.like(f"% {pattern}%", escape="\\"))
+
+    matches = select(U.id, word_start.label("word_start")).where(contains).limit(max_candidates).subquery()
+    ids = db.execute(
+        select(matches.c.id).order_by(matches.c.word_start.desc(), matches.c.id).limit(wanted)
+    ).scalars().all()
+    if len(ids) < wanted:
+        # ข้อ 1 ได้ทุกแถวที่มีคำค้นแล้ว (น้อยกว่า max_candidates)
+        similar = (
+            select(U.id, func.word_similarity(query, doc).label("similarity"))
+            .where(doc.op("%>")(query), ~contains)
+            .limit(max_candidates)
+            .subquery()
+        )
+        ids += db.execute(
+            select(similar.c.id).order_by(similar.c.similarity.desc(), similar.c.id).limit(wanted - len(ids))
+        ).scalars().all()
+    page = ids[offset:wanted]
+    return page[:limit], len(page) > limit
+
+def search(db: Session, q: str, limit: int = 20, cursor: Optional[str] = None):
+    """คืน (list ของ User เรียงตามความตรง, next_cursor)"""
+    query = normalize(q)[:MAX_QUERY_LENGTH]
+    if len(query) < MIN_QUERY_LENGTH:
+        raise HTTPException(status_code=400, detail=f"คำค้นหาต้องยาวอย่างน้อย {MIN_QUERY_LENGTH} ตัวอักษร")
+    offset = decode_cursor(cursor)
+    if db.get_bind().dialect.name == "postgresql":
+        ids, has_more = _search_pg(db, query, limit, offset)
+    else:
+        index.ensure_loaded(db)
+        ids, has_more = index.search(query, limit, offset)
+    users = {u.id: u for u in db.query(models.User).filter(models.User.id.in_(ids))} if ids else {}
+    items = [users[user_id] for user_id in ids if user_id in users]
+    next_offset = offset + limit
+    return items, encode_cursor(next_offset) if has_more and next_offset <= MAX_OFFSET else None
@@ -0,0 +1,182 @@
+# ratelimit.py
+# จำกัดจำนวนคำขอด้วย token bucket (ต่อ IP / ต่อบัญชี) และจำกัดงาน auth ที่รันพร้อมกัน
+# /login และ /register ใช้ bcrypt ซึ่งตั้งใจให้ช้า client เดียวก็ทำให้ CPU เต็มได้
+# backend เปลี่ยนได้ด้วย RATE_LIMIT_URL:
+# - memory:      นับใน process (แต่ละ worker นับแยกกัน)
+# - redis://...  นับร่วมกันทุก worker ด้วย Lua script (ต้องติดตั้ง redis)
+# - local-redis  ตัวแทน redis ใน process ไว้ทดสอบ
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from fastapi import HTTPException, Request
+from dotenv import load_dotenv
+from . import metrics
+
+load_dotenv()
+
+RATE_LIMIT_URL = os.getenv("RATE_LIMIT_URL", "memory")
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() in ("1", "true", "yes")
+# อยู่หลัง reverse proxy: ใช้ IP แรกใน X-Forwarded-For
+RATE_LIMIT_TRUST_FORWARDED = os.getenv("RATE_LIMIT_TRUST_FORWARDED", "false").lower() in ("1", "true", "yes")
+RATE_LIMIT_MAX_KEYS = int(os.getenv("RATE_LIMIT_MAX_KEYS", "100000"))
+# request ของ /login และ /register ที่ทำงานพร้อมกันได้ต่อ worker (เกินนี้ตอบ 503 ทันที)
+AUTH_MAX_CONCURRENCY = int(os.getenv("AUTH_MAX_CONCURRENCY", "32"))
+
+ratelimit_hits = metrics.Counter("clinic_ratelimit_requests_total", "Rate limiter decisions", ("limiter", "result"))
+auth_shed = metrics.Counter("clinic_auth_shed_total", "Auth requests rejected by the concurrency cap")
+auth_in_flight = metrics.Gauge("clinic_auth_in_flight", "Auth requests being processed")
+
+def _take(tokens, updated, rate, burst, now, cost, charge):
+    """
+    token bucket: อนุญาตเมื่อเหลืออย่างน้อย cost แล้วหัก charge (0 = ตรวจอย่างเดียว)
+    คืน (tokens, อนุญาตหรือไม่, ต้องรออีกกี่วินาที)
+    """
+    tokens = min(burst, tokens + max(0.0, now - updated) * rate)
+    if tokens >= cost:
+        return max(0.0, tokens - charge), True, 0.0
+    return tokens, False, (cost - tokens) / rate
+
+# ---------------- Backends ----------------
+class MemoryBuckets:
+    def __init__(self, maxsize: int = RATE_LIMIT_MAX_KEYS):
+        self.maxsize = maxsize
+        self._buckets = OrderedDict()  # key -> (tokens, updated)
+        self._lock = threading.Lock()
+
+    def take(self, key: str, rate: float, burst: float, cost: float = 1, charge: float = None):
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (burst, now))
+            tokens, allowed, retry_after = _take(tokens, updated, rate, burst, now, cost, cost if charge is None else charge)
+            self._buckets[key] = (tokens, now)
+            self._buckets.move_to_end(key)
+            while len(self._buckets) > self.maxsize:
+                self._buckets.popitem(last=False)
+        return allowed, retry_after
+
+
+# KEYS[1] = bucket, ARGV = rate, burst, now, cost, charge
+TOKEN_BUCKET_SCRIPT = """
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local rate, burst, now, cost = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3]), tonumber(ARGV[4])
+local charge = tonumber(ARGV[5])
+local tokens = tonumber(state[1]) or burst
+local ts = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - ts) * rate)
+local allowed, retry = 0, 0
+if tokens >= cost then
+  tokens = math.max(0, tokens - charge)
+  allowed = 1
+else
+  retry = (cost - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+return {allowed, tostring(retry)}
+"""
+
+class RedisBuckets:
+    """bucket เก็บใน redis hash ปรับค่าแบบ atomic ด้วย Lua script"""
+
+    def __init__(self, client, prefix: str = "clinic:ratelimit:"):
+        self.client = client
+        self.prefix = prefix
+
+    def take(self, key: str, rate: float, burst: float, cost: float = 1, charge: float = None):
+        charge = cost if charge is None else charge
+        allowed, retry_after = self.client.eval(TOKEN_BUCKET_SCRIPT, 1, f"{self.prefix}{key}", rate, burst, time.time(), cost, charge)
+        return bool(int(allowed)), float(retry_after)
+
+
+class LocalRedis:
+    """client จำลองที่มีเฉพาะ eval ของ TOKEN_BUCKET_SCRIPT (ทำงานเหมือน script ภายใต้ lock)"""
+
+    def __init__(self):
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def eval(self, script, numkeys, key, rate, burst, now, cost, charge):
+        with self._lock:
+            tokens, updated = self._data.get(key, (burst, now))
+            tokens, allowed, retry_after = _take(tokens, updated, rate, burst, now, cost, charge)
+            self._data[key] = (tokens, now)
+        return [1 if allowed else 0, str(retry_after)]
+
+
+def make_backend():
+    if RATE_LIMIT_URL.startswith("redis://") or RATE_LIMIT_URL.startswith("rediss://"):
+        import redis
+        return RedisBuckets(redis.Redis.from_url(RATE_LIMIT_URL))
+    if RATE_LIMIT_URL == "local-redis":
+        return RedisBuckets(LocalRedis())
+    return MemoryBuckets()
+
+backend = make_backend()
+
+# ---------------- Limiters ----------------
+def parse_limit(value: str):
+    """ "จำนวน/วินาที" เช่น "20/60" = ได้ 20 ครั้งติดกัน แล้วเติมคืน 20 ครั้งต่อ 60 วินาที"""
+    count, seconds = value.split("/")
+    return float(count), float(count) / float(seconds)
+
+class Limiter:
+    def __init__(self, name: str, limit: str):
+        self.name = name
+        self.burst, self.rate = parse_limit(limit)
+
+    def check(self, key, cost: float = 1, charge: float = None):
+        """เกินกำหนดตอบ 429 พร้อม Retry-After (charge=0: ตรวจโดยไม่หัก ใช้คู่กับ penalize)"""
+        if not RATE_LIMIT_ENABLED or key is None:
+            return
+        allowed, retry_after = backend.take(f"{self.name}:{key}", self.rate, self.burst, cost, charge)
+        ratelimit_hits.inc(self.name, "allowed" if allowed else "limited")
+        if not allowed:
+            raise HTTPException(
+                status_code=429,
+                detail="มีคำขอมากเกินไป กรุณาลองใหม่ภายหลัง",
+                headers={"Retry-After": str(max(1, math.ceil(retry_after)))},
+            )
+
+    def penalize(self, key, cost: float = 1):
+        """หักโควตาโดยไม่ตอบ 429 (เช่น หลังรหัสผ่านผิด)"""
+        if RATE_LIMIT_ENABLED and key is not None:
+            backend.take(f"{self.name}:{key}", self.rate, self.burst, 0, cost)
+
+login_ip = Limiter("login_ip", os.getenv("LOGIN_IP_LIMIT", "20/60"))
+# นับเฉพาะรหัสผ่านผิด: ถ้านับทุกครั้ง ใครรู้อีเมลก็ล็อกเจ้าของบัญชีได้ตลอด
+login_account = Limiter("login_account", os.getenv("LOGIN_ACCOUNT_LIMIT", "5/60"))
+register_ip = Limiter("register_ip", os.getenv("REGISTER_IP_LIMIT", "5/60"))
+booking_user = Limiter("booking_user", os.getenv("BOOKING_USER_LIMIT", "30/60"))
+
+def client_ip(request: Request):
+    if RATE_LIMIT_TRUST_FORWARDED:
+        forwarded = request.headers.get("x-forwarded-for")
+        if forwarded:
+            return forwarded.split(",")[0].strip()
+    return request.client.host if request.client else None
+
+# ---------------- Admission control ----------------
+_auth_in_flight = 0
+
+async def auth_admission():
+    """
+    dependency ของ route ที่ใช้ bcrypt: ถ้ามีงานค้างเกิน AUTH_MAX_CONCURRENCY ตอบ 503 ทันที
+    ดีกว่าปล่อยให้คิวยาวจน request ทุกตัว timeout
+    """
+    global _auth_in_flight
+    if _auth_in_flight >= AUTH_MAX_CONCURRENCY:
+        auth_shed.inc()
+        raise HTTPException(
+            status_code=503,
+            detail="ระบบกำลังมีผู้ใช้งานจำนวนมาก กรุณาลองใหม่อีกครั้ง",
+            headers={"Retry-After": "1"},
+        )
+    _auth_in_flight += 1
+    auth_in_flight.inc()
+    try:
+        yield
+    finally:
+        _auth_in_flight -= 1
+        auth_in_flight.dec()
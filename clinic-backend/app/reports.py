@@ -0,0 +1,185 @@
+# reports.py
+# สรุปจำนวนนัดหมายรายวันต่อ (วัน, หมอ, ช่วงเวลา, สถานะ) ในตาราง daily_appointment_counts
+# - ทุก flush ที่เพิ่ม/แก้/ลบ Appointment ผ่าน ORM ปรับตัวเลขใน transaction เดียวกัน
+#   (rollback หรือ savepoint ที่ถูกยกเลิก ตัวเลขก็ย้อนกลับด้วย)
+# - INSERT หลายแถวที่ไม่ผ่าน ORM (import) ต้องเรียก add_rows() เอง
+# - นับรวม appointments_archive ด้วย (ย้ายไป archive แล้วตัวเลขไม่เปลี่ยน ดู archive.py)
+# - /reports/daily อ่านจากตารางนี้อย่างเดียว: ต้นทุนขึ้นกับจำนวนวันที่ขอ ไม่ขึ้นกับขนาด appointments
+# - python -m app.manage rebuild-daily-counts / check-daily-counts สำหรับ backfill และตรวจความถูกต้อง
+from collections import Counter
+from datetime import date, timedelta
+from typing import Dict, Optional
+from fastapi import HTTPException
+from sqlalchemy import Date, and_, bindparam, delete, event, func, insert, inspect, select, text, union_all, update
+from sqlalchemy.orm import Session
+from . import models
+
+MAX_RANGE_DAYS = 92
+KEY_COLUMNS = ("appointment_date", "doctor_name", "time_slot", "status")
+DEFAULT_STATUS = models.Appointment.__table__.c.status.default.arg
+TRACKED = (models.Appointment, models.ArchivedAppointment)
+
+Key = tuple  # (appointment_date, doctor_name, time_slot, status)
+
+def _key(appointment_date, doctor_name, time_slot, status) -> Optional[Key]:
+    if appointment_date is None:
+        return None  # ไม่มีวันนัด ไม่นับ
+    return (appointment_date, doctor_name or "", time_slot or "", status or "")
+
+def _current_key(appointment) -> Optional[Key]:
+    status = appointment.status
+    if status is None and "status" not in inspect(appointment).dict:
+        status = DEFAULT_STATUS  # ยังไม่ได้ตั้ง: INSERT จะใช้ค่า default ของคอลัมน์
+    return _key(appointment.appointment_date, appointment.doctor_name, appointment.time_slot, status)
+
+def _key_changed(appointment) -> bool:
+    attrs = inspect(appointment).attrs
+    return any(attrs[name].history.has_changes() for name in KEY_COLUMNS)
+
+# ---------------- Incremental ----------------
+# PostgreSQL และ SQLite ใช้ ON CONFLICT แบบเดียวกัน เขียนเป็น text เพื่อให้ cache การ compile ได้
+# (insert().on_conflict_do_update() ไม่มี cache key จึง compile ใหม่ทุก flush ที่แก้นัดหมาย)
+UPSERT_DIALECTS = ("postgresql", "sqlite")
+_UPSERT = text(
+    "INSERT INTO daily_appointment_counts (appointment_date, doctor_name, time_slot, status, count) "
+    "VALUES (:appointment_date, :doctor_name, :time_slot, :status, :count) "
+    "ON CONFLICT (appointment_date, doctor_name, time_slot, status) "
+    "DO UPDATE SET count = daily_appointment_counts.count + excluded.count"
+).bindparams(bindparam("appointment_date", type_=Date))
+
+def apply(conn, deltas: Dict[Key, int]):
+    """บวก/ลบจำนวนใน daily_appointment_counts (เรียงตาม key กัน deadlock ระหว่าง transaction)"""
+    rows = [dict(zip(KEY_COLUMNS, key), count=delta) for key, delta in sorted(deltas.items()) if key and delta]
+    if not rows:
+        return
+    if conn.dialect.name in UPSERT_DIALECTS:
+        conn.execute(_UPSERT, rows)
+        return
+    T = models.DailyAppointmentCount.__table__
+    for row in rows:
+        match = and_(*(T.c[name] == row[name] for name in KEY_COLUMNS))
+        if conn.execute(update(T).where(match).values(count=T.c.count + row["count"])).rowcount == 0:
+            conn.execute(insert(T).values(**row))
+
+def add_rows(conn, rows):
+    """นับแถวที่ INSERT ตรง ๆ (dict ของคอลัมน์ appointments) ต้องเรียกใน transaction เดียวกับ INSERT"""
+    deltas = Counter()
+    for row in rows:
+        deltas[_key(row.get("appointment_date"), row.get("doctor_name"), row.get("time_slot"), row.get("status", DEFAULT_STATUS))] += 1
+    apply(conn, deltas)
+
+def _stored_keys(conn, objects):
+    """key ของแถวตามที่อยู่ในฐานข้อมูลก่อน flush นี้ {(model, id): key}"""
+    keys = {}
+    for model in TRACKED:
+        ids = [inspect(obj).identity[0] for obj in objects if type(obj) is model]
+        if not ids:
+            continue
+        result = conn.execute(
+            select(model.id, model.appointment_date, model.doctor_name, model.time_slot, model.status).where(model.id.in_(ids))
+        )
+        keys.update({(model, row.id): _key(row.appointment_date, row.doctor_name, row.time_slot, row.status) for row in result})
+    return keys
+
+@event.listens_for(Session, "before_flush")
+def _track_appointments(session, flush_context, instances):
+    deltas = Counter()
+    for obj in session.new:
+        if isinstance(obj, TRACKED):
+            deltas[_current_key(obj)] += 1
+    changed = [obj for obj in session.dirty if isinstance(obj, TRACKED) and _key_changed(obj)]
+    deleted = [obj for obj in session.deleted if isinstance(obj, TRACKED)]
+    if changed or deleted:
+        # ค่าเดิมอ่านจากฐานข้อมูล (history ของ attribute ที่ถูก expire ไปแล้วไม่มีค่าเดิม)
+        old = _stored_keys(session.connection(), changed + deleted)
+        for obj in changed:
+            deltas[old.get((type(obj), obj.id))] -= 1
+            deltas[_current_key(obj)] += 1
+        for obj in deleted:
+            deltas[old.get((type(obj), obj.id))] -= 1
+    deltas.pop(None, None)
+    if any(deltas.values()):
+        apply(session.connection(), deltas)
+
+# ---------------- Rebuild / check ----------------
+def _range_filter(column, date_from: Optional[date], date_to: Optional[date]):
+    conditions = [column.isnot(None)]
+    if date_from is not None:
+        conditions.append(column >= date_from)
+    if date_to is not None:
+        conditions.append(column <= date_to)
+    return and_(*conditions)
+
+def _grouped_query(date_from: Optional[date], date_to: Optional[date]):
+    def keys(model):
+        return select(
+            model.appointment_date.label("appointment_date"),
+            func.coalesce(model.doctor_name, "").label("doctor_name"),
+            func.coalesce(model.time_slot, "").label("time_slot"),
+            func.coalesce(model.status, "").label("status"),
+        ).where(_range_filter(model.appointment_date, date_from, date_to))
+
+    rows = union_all(*(keys(model) for model in TRACKED)).subquery()
+    columns = [rows.c[name] for name in KEY_COLUMNS]
+    return select(*columns, func.count()).group_by(*columns)
+
+def rebuild(db: Session, date_from: Optional[date] = None, date_to: Optional[date] = None) -> int:
+    """คำนวณใหม่จาก appointments + archive ทั้งช่วง (ไม่ระบุ = ทั้งหมด) คืนจำนวนแถวสรุป"""
+    T = models.DailyAppointmentCount.__table__
+    conn = db.connection()
+    if conn.dialect.name == "postgresql":
+        # กันการจอง / archive ที่เข้ามาระหว่างลบและนับใหม่ (SQLite ใช้ BEGIN IMMEDIATE อยู่แล้ว)
+        conn.execute(text("LOCK TABLE appointments, appointments_archive IN SHARE MODE"))
+    conn.execute(delete(T).where(_range_filter(T.c.appointment_date, date_from, date_to)))
+    result = conn.execute(insert(T).from_select(list(KEY_COLUMNS) + ["count"], _grouped_query(date_from, date_to)))
+    db.commit()
+    return result.rowcount
+
+def check(db: Session, date_from: Optional[date] = None, date_to: Optional[date] = None):
+    """เทียบกับการนับจริง คืน list ของ (key, นับจริง, ในตารางสรุป) ที่ไม่ตรงกัน"""
+    T = models.DailyAppointmentCount.__table__
+    expected = {tuple(row[:4]): row[4] for row in db.execute(_grouped_query(date_from, date_to))}
+    stored = {
+        tuple(row[:4]): row[4]
+        for row in db.execute(
+            select(*(T.c[name] for name in KEY_COLUMNS), T.c.count)
+            .where(_range_filter(T.c.appointment_date, date_from, date_to), T.c.count != 0)
+        )
+    }
+    return [
+        (key, expected.get(key, 0), stored.get(key, 0))
+        for key in sorted(expected.keys() | stored.keys())
+        if expected.get(key, 0) != stored.get(key, 0)
+    ]
+
+# ---------------- Read ----------------
+def daily(db: Session, date_from: date, date_to: date, doctor_name: Optional[str] = None):
+    """สรุปรายวัน (ทุกวันในช่วง รวมวันที่ไม่มีนัด) จากตารางสรุปเท่านั้น"""
+    if date_to < date_from:
+        raise HTTPException(status_code=400, detail="ช่วงวันที่ไม่ถูกต้อง")
+    if (date_to - date_from).days + 1 > MAX_RANGE_DAYS:
+        raise HTTPException(status_code=400, detail=f"ดูได้ไม่เกิน {MAX_RANGE_DAYS} วัน")
+    C = models.DailyAppointmentCount
+    query = (
+        select(C.appointment_date, C.doctor_name, C.time_slot, C.status, C.count)
+        .where(C.appointment_date >= date_from, C.appointment_date <= date_to, C.count != 0)
+        .order_by(C.appointment_date, C.doctor_name, C.time_slot, C.status)
+    )
+    if doctor_name is not None:
+        query = query.where(C.doctor_name == doctor_name)
+
+    days = {}
+    day = date_from
+    while day <= date_to:
+        days[day] = {"date": day, "total": 0, "by_status": {}, "slots": {}}
+        day += timedelta(days=1)
+    for appointment_date, doctor, slot, status, count in db.execute(query):
+        summary = days[appointment_date]
+        summary["total"] += count
+        summary["by_status"][status] = summary["by_status"].get(status, 0) + count
+        entry = summary["slots"].setdefault((doctor, slot), {"doctor": doctor, "time_slot": slot, "total": 0, "by_status": {}})
+        entry["total"] += count
+        entry["by_status"][status] = count
+    for summary in days.values():
+        summary["slots"] = list(summary["slots"].values())
+    return list(days.values())
@@ -1,142 +1,176 @@
 # ---------------- ROUTER ----------------
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request, Response
+from fastapi.responses import ORJSONResponse, StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from typing import List
-from datetime import datetime, timedelta
-from .. import schemas, database, auth, models
+from typing import List, Optional
+from datetime import date
+from .. import schemas, database, auth, crud, schedules, availability, http_cache, live, idempotency, ratelimit
 
 router = APIRouter(prefix="/appointments", tags=["Appointments"])
-get_db = database.get_db
-get_current_user = auth.get_current_user
+get_async_db = database.get_async_db
+get_async_read_db = database.get_async_read_db
+get_current_user = auth.get_current_user_cached_async
 
 # ---------------- CREATE ----------------
 @router.post("/", response_model=schemas.AppointmentOut)
-def create_appointment(
+async def create_appointment(
     appointment: schemas.AppointmentCreate,
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: schemas.UserResponse = Depends(get_current_user),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
 ):
-    # จำนวน appointment ในวัน/slot
-    existing_count = db.query(models.Appointment).filter(
-        models.Appointment.appointment_date == appointment.appointment_date,
-        models.Appointment.time_slot == appointment.time_slot
-    ).count()
-
-    # เวลาเริ่ม/สิ้นสุด
-    if appointment.time_slot == "เช้า":
-        start_time = datetime.strptime("08:00", "%H:%M")
-        end_time = datetime.strptime("11:30", "%H:%M")
-    else:
-        start_time = datetime.strptime("13:00", "%H:%M")
-        end_time = datetime.strptime("17:30", "%H:%M")
-
-    # คำนวณเวลานัด
-    new_time = (start_time + timedelta(minutes=30 * existing_count)).time()
-
-    # ตรวจสอบ slot เต็ม
-    if new_time > end_time.time():
-        raise HTTPException(status_code=400, detail=f"{appointment.time_slot}เต็มแล้ว")
-
-    new_appointment = models.Appointment(
-        user_id=current_user.id,
-        doctor_name=appointment.doctor_name,
-        appointment_date=appointment.appointment_date,
-        appointment_time=new_time,
-        time_slot=appointment.time_slot,
-        reason=appointment.reason,
-        status="รอการยืนยัน",
-        created_at=datetime.utcnow(),
-        updated_at=datetime.utcnow(),
-    )
-
-    db.add(new_appointment)
-    db.commit()
-    db.refresh(new_appointment)
-    return new_appointment
+    # retry ด้วย key เดิม: คืนนัดหมายเดิม ไม่จองซ้ำ (ดู idempotency.py)
+    replay = await db.run_sync(idempotency.begin, current_user.id, idempotency_key, appointment)
+    if replay:
+        return replay
+    ratelimit.booking_user.check(current_user.id)
+    # จองเวลาแรกที่ว่างในตารางของหมอ (ไม่เลือกหมอ = หมอคนใดก็ได้ที่ว่าง) แจ้งผู้ป่วย / เตือนนัด ทำใน worker
+    return await crud.create_appointment_async(db, current_user.id, appointment)
+
+
+# ---------------- BATCH ----------------
+@router.post("/batch", response_model=schemas.AppointmentBatchResponse)
+async def batch_appointments(
+    batch: schemas.AppointmentBatch,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: schemas.UserResponse = Depends(get_current_user),
+):
+    """
+    จอง / เลื่อน / ยกเลิกหลายรายการในคำขอเดียว (ยืนยันตัวตนและ commit ครั้งเดียว)
+    ผลของแต่ละรายการอยู่ใน results ตามลำดับที่ส่งมา
+    """
+    ratelimit.booking_user.check(current_user.id)
+    return await crud.apply_appointment_batch_async(db, batch, current_user.id, staff=auth.is_staff(current_user))
 
 
 # ---------------- READ ALL ----------------
-@router.get("/", response_model=List[schemas.AppointmentOut])
-def read_appointments(
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user),
+@router.get("/", response_model=schemas.AppointmentPage)
+async def read_appointments(
+    request: Request,
+    response: Response,
+    limit: int = Query(50, ge=1, le=crud.MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    status: Optional[str] = None,
+    doctor_name: Optional[str] = None,
+    mine: bool = False,
+    fast: bool = False,
+    history: bool = False,
+    db: AsyncSession = Depends(get_async_read_db),
+    current_user: schemas.UserResponse = Depends(get_current_user),
+):
+    """history=true: รวมนัดหมายเก่าที่ถูก archive แล้ว (ค่าเริ่มต้นอ่านเฉพาะตาราง appointments)"""
+    items, next_cursor = await crud.get_appointments_async(
+        db,
+        limit=limit,
+        cursor=cursor,
+        date_from=date_from,
+        date_to=date_to,
+        status=status,
+        doctor_name=doctor_name,
+        user_id=current_user.id if mine else None,
+        as_dicts=fast,
+        history=history,
+    )
+    if fast:
+        return _fast_page(request, items, next_cursor)
+    # ETag จาก (id, updated_at) ของแต่ละรายการ ไม่ต้อง serialize ก่อน
+    etag = http_cache.make_etag(next_cursor, *((a.id, a.updated_at) for a in items))
+    not_modified = http_cache.conditional(request, response, etag)
+    if not_modified:
+        return not_modified
+    return {"items": items, "next_cursor": next_cursor}
+
+def _fast_page(request, items, next_cursor):
+    """
+    ทางเลือกสำหรับหน้ารายการขนาดใหญ่ (?fast=true): query เฉพาะคอลัมน์ แปลง row เป็น dict
+    โดยไม่ผ่าน pydantic (ข้อมูลจาก DB เชื่อถือได้) และ encode ด้วย orjson
+    """
+    etag = http_cache.make_etag(next_cursor, *((a["id"], a["updated_at"]) for a in items))
+    headers = http_cache.cache_headers(etag, http_cache.PRIVATE_REVALIDATE)
+    if http_cache.is_not_modified(request, etag):
+        return Response(status_code=304, headers=headers)
+    return ORJSONResponse({"items": items, "next_cursor": next_cursor}, headers=headers)
+
+# ---------------- AVAILABILITY ----------------
+@router.get("/availability", response_model=List[schemas.DayAvailability])
+async def read_availability(
+    date_from: date = Query(..., alias="from"),
+    date_to: date = Query(..., alias="to"),
+    doctor: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_read_db),
 ):
-    appointments = db.query(models.Appointment).all()
-    return appointments
+    return await db.run_sync(_availability, date_from, date_to, doctor)
+
+def _availability(db: Session, date_from: date, date_to: date, doctor: Optional[str]):
+    doctor_id = schedules.get_doctor(db, name=doctor).id if doctor is not None else None
+    # replica อาจตามหลัง primary: ไม่เก็บผลลง cache ที่ใช้ร่วมกัน
+    store = database.async_replica_engine is None
+    return availability.get_availability(db, date_from, date_to, doctor_id=doctor_id, store=store)
+
+@router.get("/live")
+async def stream_availability(
+    request: Request,
+    date_from: Optional[date] = Query(None, alias="from"),
+    date_to: Optional[date] = Query(None, alias="to"),
+):
+    """
+    Server-Sent Events: ทุกครั้งที่มีการจอง/ยกเลิกจะได้ list ของ
+    {"date", "doctor", "time_slot", "delta"} (รวมการเปลี่ยนแปลงไว้เป็นรอบ ๆ)
+    โหลด /availability ตั้งต้นเมื่อได้ event "ready" และโหลดใหม่เมื่อได้ "resync"
+    """
+    return StreamingResponse(
+        live.stream(request, date_from, date_to),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 # ---------------- READ ONE ----------------
 @router.get("/{appointment_id}", response_model=schemas.AppointmentOut)
-def read_appointment(
+async def read_appointment(
     appointment_id: int,
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user),
+    request: Request,
+    response: Response,
+    history: bool = False,
+    db: AsyncSession = Depends(get_async_read_db),
+    current_user: schemas.UserResponse = Depends(get_current_user),
 ):
-    appointment = db.get(models.Appointment, appointment_id)
+    appointment = await crud.get_appointment_async(db, appointment_id, history=history)
     if not appointment:
         raise HTTPException(status_code=404, detail="ไม่พบการนัดหมาย")
+    not_modified = http_cache.conditional(
+        request,
+        response,
+        http_cache.make_etag(appointment.id, appointment.updated_at),
+        last_modified=appointment.updated_at,
+    )
+    if not_modified:
+        return not_modified
     return appointment
 
 # ---------------- UPDATE ----------------
 @router.put("/{appointment_id}", response_model=schemas.AppointmentOut)
-def update_appointment(
+async def update_appointment(
     appointment_id: int,
     appointment_update: schemas.AppointmentUpdate,
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: schemas.UserResponse = Depends(get_current_user),
 ):
-    appointment = db.get(models.Appointment, appointment_id)
-    if not appointment or appointment.user_id != current_user.id:
+    # เปลี่ยนวัน/slot/หมอ = จองที่นั่งใหม่ในตารางของหมอ (ดู crud.update_appointment)
+    appointment = await crud.update_appointment_async(db, appointment_id, current_user.id, appointment_update)
+    if appointment is None:
         raise HTTPException(status_code=404, detail="ไม่พบการนัดหมาย")
-
-    # อัปเดตวัน/slot
-    if appointment_update.appointment_date or appointment_update.time_slot:
-        new_date = appointment_update.appointment_date or appointment.appointment_date
-        new_slot = appointment_update.time_slot or appointment.time_slot
-
-        # จำนวน appointment ใน slot นั้น (ยกเว้นตัวเอง)
-        existing_count = db.query(models.Appointment).filter(
-            models.Appointment.appointment_date == new_date,
-            models.Appointment.time_slot == new_slot,
-            models.Appointment.id != appointment.id
-        ).count()
-
-        if new_slot == "เช้า":
-            start_time = datetime.strptime("08:00", "%H:%M")
-            end_time = datetime.strptime("11:30", "%H:%M")
-        else:
-            start_time = datetime.strptime("13:00", "%H:%M")
-            end_time = datetime.strptime("17:30", "%H:%M")
-
-        new_time = (start_time + timedelta(minutes=30 * existing_count)).time()
-
-        if new_time > end_time.time():
-            raise HTTPException(status_code=400, detail=f"{new_slot}เต็มแล้ว")
-
-        appointment.appointment_date = new_date
-        appointment.time_slot = new_slot
-        appointment.appointment_time = new_time
-
-    if appointment_update.reason:
-        appointment.reason = appointment_update.reason
-
-    if appointment_update.doctor_name:
-        appointment.doctor_name = appointment_update.doctor_name
-
-    appointment.updated_at = datetime.utcnow()
-    db.commit()
-    db.refresh(appointment)
     return appointment
 
 # ---------------- DELETE ----------------
 @router.delete("/{appointment_id}")
-def delete_appointment(
+async def delete_appointment(
     appointment_id: int,
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: schemas.UserResponse = Depends(get_current_user),
 ):
-    appointment = db.get(models.Appointment, appointment_id)
-    if not appointment or appointment.user_id != current_user.id:
+    if not await crud.delete_appointment_async(db, appointment_id, current_user.id):
         raise HTTPException(status_code=404, detail="ไม่พบการนัดหมาย")
-    db.delete(appointment)
-    db.commit()
     return {"detail": "ลบการนัดหมายเรียบร้อยแล้ว"}
@@ -0,0 +1,49 @@
+# app/routes/bootstrap.py
+# ข้อมูลตั้งต้นของแต่ละหน้ารวมในคำขอเดียว: ตรวจ token ครั้งเดียวและใช้ session เดียว
+# (get_current_user_cached_async กับ route ขอ get_async_read_db เหมือนกัน FastAPI จึงให้ session เดียวกันทั้ง request)
+import os
+from datetime import date, timedelta
+from typing import Optional
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from .. import schemas, database, auth, crud, schedules, availability
+
+router = APIRouter(prefix="/bootstrap", tags=["Bootstrap"])
+
+BOOTSTRAP_AVAILABILITY_DAYS = int(os.getenv("BOOTSTRAP_AVAILABILITY_DAYS", "7"))
+
+@router.get("/appointments-page", response_model=schemas.AppointmentsPageBootstrap)
+async def appointments_page(
+    limit: int = Query(50, ge=1, le=crud.MAX_PAGE_SIZE),
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    mine: bool = False,
+    db: AsyncSession = Depends(database.get_async_read_db),
+    current_user: schemas.UserResponse = Depends(auth.get_current_user_cached_async),
+):
+    """
+    แทน /me + /doctors + /appointments (หน้าแรก) และเวลาว่าง BOOTSTRAP_AVAILABILITY_DAYS วันข้างหน้า
+    รายชื่อหมอและเวลาว่างส่วนใหญ่มาจาก cache ใน process จึงมักมีแค่ query ของรายการนัด
+    """
+    page = await db.run_sync(_appointments_page, limit, date_from, date_to, current_user.id if mine else None)
+    return {"user": current_user, **page}
+
+def _appointments_page(db: Session, limit: int, date_from: Optional[date], date_to: Optional[date], user_id: Optional[int]):
+    items, next_cursor = crud.get_appointments(
+        db,
+        limit=limit,
+        date_from=date_from,
+        date_to=date_to,
+        user_id=user_id,
+    )
+    today = date.today()
+    until = today + timedelta(days=BOOTSTRAP_AVAILABILITY_DAYS - 1)
+    return {
+        "doctors": [d.name for d in schedules.all_doctors(db)],
+        "appointments": {"items": items, "next_cursor": next_cursor},
+        # replica อาจตามหลัง primary: ไม่เก็บผลลง cache ที่ /availability ใช้ร่วมกัน
+        "availability": availability.get_availability(db, today, until, store=database.async_replica_engine is None),
+        "availability_from": today,
+        "availability_to": until,
+    }
@@ -0,0 +1,255 @@
+# app/routes/data_transfer.py
+# export ข้อมูลนัดหมาย/ผู้ป่วยแบบ streaming และ import ข้อมูลจากระบบเก่าทีละ batch
+import csv
+import io
+import json
+import time
+from datetime import date, datetime, time as dt_time
+from fastapi import APIRouter, Depends, File, HTTPException, Query, UploadFile
+from fastapi.responses import StreamingResponse
+from pydantic import ValidationError
+from sqlalchemy import insert, select
+from sqlalchemy.exc import SQLAlchemyError
+from .. import schemas, database, auth, models, availability, crud, schedules, slots, reports, patient_search
+
+router = APIRouter(tags=["Data Transfer"])
+
+EXPORT_BATCH_SIZE = 1000
+IMPORT_BATCH_SIZE = 1000
+MAX_REPORTED_ERRORS = 100
+
+APPOINTMENT_COLUMNS = crud.APPOINTMENT_COLUMNS
+# ไม่ export รหัสผ่าน
+PATIENT_COLUMNS = [
+    "id", "username", "email", "date_joined", "first_name", "last_name",
+    "date_of_birth", "address", "phone_number", "allergies",
+    "chronic_conditions", "current_medications",
+]
+
+EXPORT_FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv; charset=utf-8",
+}
+
+def _to_text(value):
+    if isinstance(value, (date, datetime, dt_time)):
+        return value.isoformat()
+    return value
+
+def _stream_rows(model, columns, fmt: str):
+    """
+    อ่านทีละ EXPORT_BATCH_SIZE แถวต่อจาก id ล่าสุด (keyset) แต่ละหน้าอ่านจนจบแล้วปิด transaction ก่อน yield
+    จึงไม่ค้าง cursor / lock ไว้ระหว่างรอ client ดาวน์โหลด (SQLite: การจองไม่ต้องรอ, replica: ไม่ถือ snapshot นาน)
+    ใช้ session อ่านอย่างเดียวของตัวเอง (replica ถ้ามี) เพราะ generator ทำงานหลัง route คืนค่าไปแล้ว
+    """
+    db = database.SessionLocal(info={"read_only": True})
+    try:
+        stmt = select(*[getattr(model, c) for c in columns]).order_by(model.id).limit(EXPORT_BATCH_SIZE)
+        buffer = io.StringIO()
+        writer = csv.writer(buffer) if fmt == "csv" else None
+        if writer:
+            writer.writerow(columns)
+
+        last_id = None
+        while True:
+            rows = db.execute(stmt if last_id is None else stmt.where(model.id > last_id)).all()
+            db.commit()
+            for row in rows:
+                values = [_to_text(v) for v in row]
+                if writer:
+                    writer.writerow(values)
+                else:
+                    buffer.write(json.dumps(dict(zip(columns, values)), ensure_ascii=False))
+                    buffer.write("\n")
+            if buffer.tell():
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+            if len(rows) < EXPORT_BATCH_SIZE:
+                break
+            last_id = rows[-1].id
+    finally:
+        db.close()
+
+def _export(model, columns, fmt: str, name: str):
+    if fmt not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail="format ต้องเป็น ndjson หรือ csv")
+    return StreamingResponse(
+        _stream_rows(model, columns, fmt),
+        media_type=EXPORT_FORMATS[fmt],
+        headers={"Content-Disposition": f'attachment; filename="{name}.{fmt}"'},
+    )
+
+# ---------------- EXPORT ----------------
+@router.get("/export/appointments")
+def export_appointments(
+    format: str = Query("ndjson"),
+    staff: schemas.UserResponse = Depends(auth.get_current_staff),
+):
+    return _export(models.Appointment, APPOINTMENT_COLUMNS, format, "appointments")
+
+@router.get("/export/patients")
+def export_patients(
+    format: str = Query("ndjson"),
+    staff: schemas.UserResponse = Depends(auth.get_current_staff),
+):
+    return _export(models.User, PATIENT_COLUMNS, format, "patients")
+
+# ---------------- IMPORT ----------------
+def _read_records(upload: UploadFile):
+    """อ่านไฟล์ทีละแถว คืน (เลขแถว, dict)"""
+    text = io.TextIOWrapper(upload.file, encoding="utf-8-sig", newline="")
+    if (upload.filename or "").lower().endswith(".csv"):
+        for line_no, record in enumerate(csv.DictReader(text), start=2):
+            # ช่องว่างใน CSV หมายถึงไม่มีข้อมูล
+            yield line_no, {k: (v if v != "" else None) for k, v in record.items()}
+    else:
+        for line_no, line in enumerate(text, start=1):
+            if line.strip():
+                try:
+                    yield line_no, json.loads(line)
+                except json.JSONDecodeError as e:
+                    yield line_no, e
+
+def _db_error(e: SQLAlchemyError) -> str:
+    return f"{e.__class__.__name__}: {getattr(e, 'orig', None) or e}"
+
+def _import(upload: UploadFile, model, schema, prepare, prepare_batch=None, on_insert=None):
+    """
+    prepare: แปลงทีละแถว (ไม่ใช้ฐานข้อมูล)
+    prepare_batch(db, batch) -> (แถวที่จะ INSERT, [(เลขแถว, เหตุผล)] ที่ปฏิเสธ): ค่าที่ต้องดูจากฐานข้อมูล ทำทีละ batch
+    ต้องสร้าง dict ใหม่ ไม่แก้ batch เดิม (ถูกเรียกซ้ำหลัง rollback)
+    """
+    db = database.SessionLocal()
+    inserted, failed, errors = 0, 0, []
+    started = time.perf_counter()
+
+    def error(line_no, message):
+        if len(errors) < MAX_REPORTED_ERRORS:
+            errors.append({"line": line_no, "error": message})
+
+    def flush(batch):
+        # หนึ่ง batch = หนึ่ง transaction (INSERT หลายแถวในคำสั่งเดียว)
+        # ถ้าล้ม (เช่น แถวเดียวชน unique) ลองใหม่ทีละแถวใน savepoint: เก็บแถวที่ดี รายงานแถวที่เสียทีละแถว
+        nonlocal inserted, failed
+        if not batch:
+            return
+        try:
+            rows, rejected = prepare_batch(db, batch) if prepare_batch else (batch, [])
+            db.execute(insert(model), [values for _, values in rows])
+            saved = rows
+        except SQLAlchemyError:
+            db.rollback()
+            rows, rejected = prepare_batch(db, batch) if prepare_batch else (batch, [])
+            saved = []
+            for line_no, values in rows:
+                try:
+                    with db.begin_nested():
+                        db.execute(insert(model), [values])
+                    saved.append((line_no, values))
+                except SQLAlchemyError as e:
+                    rejected.append((line_no, _db_error(e)))
+        if on_insert is not None and saved:
+            on_insert(db.connection(), [values for _, values in saved])
+        db.commit()
+        inserted += len(saved)
+        failed += len(rejected)
+        for line_no, message in sorted(rejected):
+            error(line_no, message)
+
+    try:
+        batch = []
+        for line_no, record in _read_records(upload):
+            if isinstance(record, Exception):
+                failed += 1
+                error(line_no, str(record))
+                continue
+            try:
+                item = schema.model_validate(record)
+            except ValidationError as e:
+                failed += 1
+                error(line_no, e.errors(include_url=False, include_input=False))
+                continue
+            batch.append((line_no, prepare(item)))
+            if len(batch) >= IMPORT_BATCH_SIZE:
+                flush(batch)
+                batch = []
+        flush(batch)
+    finally:
+        db.close()
+
+    seconds = time.perf_counter() - started
+    return {
+        "inserted": inserted,
+        "failed": failed,
+        "errors": errors,
+        "seconds": round(seconds, 3),
+        "rows_per_sec": round((inserted + failed) / seconds, 1) if seconds else None,
+    }
+
+def _prepare_appointment(item: schemas.AppointmentImport):
+    values = item.model_dump(exclude={"id"})
+    now = datetime.utcnow()
+    values["created_at"] = values["created_at"] or now
+    values["updated_at"] = values["updated_at"] or values["created_at"]
+    return values
+
+def _resolve_appointments(db, batch):
+    """
+    user_id ของระบบเก่า -> id ของผู้ป่วยที่นำเข้าแล้ว (users.legacy_id) ไม่พบ = ปฏิเสธแถวนั้น
+    ผูกหมอตามชื่อ (ชื่อที่ไม่รู้จักได้หมอที่ไม่ออกตรวจ ดู schedules.doctor_ids)
+    และให้ที่นั่งว่างแรกของ หมอ/วัน/เวลา (นัดเวลาเดียวกันในไฟล์หรือที่มีอยู่แล้วไม่ชนกัน)
+    """
+    legacy_ids = {values["user_id"] for _, values in batch} - {None}
+    users = dict(
+        db.query(models.User.legacy_id, models.User.id).filter(models.User.legacy_id.in_(legacy_ids))
+    ) if legacy_ids else {}
+    accepted, rejected = [], []
+    for line_no, values in batch:
+        if values["user_id"] is not None and values["user_id"] not in users:
+            rejected.append((line_no, f"ไม่พบผู้ป่วย user_id={values['user_id']} ของระบบเดิม (นำเข้าผู้ป่วยก่อน)"))
+        else:
+            accepted.append((line_no, values))
+
+    doctors = schedules.doctor_ids(db, (values["doctor_name"] for _, values in accepted))
+    rows = [
+        (line_no, {**values, "user_id": users.get(values["user_id"]), "doctor_id": doctors[values["doctor_name"]]})
+        for line_no, values in accepted
+    ]
+    taken = slots.taken_seats_many(db, {(v["doctor_id"], v["appointment_date"], v["time_slot"]) for _, v in rows})
+    for _, values in rows:
+        seats = taken[(values["doctor_id"], values["appointment_date"], values["time_slot"])]
+        seat = 0
+        while (values["appointment_time"], seat) in seats:
+            seat += 1
+        seats.add((values["appointment_time"], seat))
+        values["seat"] = seat
+    return rows, rejected
+
+def _prepare_patient(item: schemas.PatientImport):
+    values = item.model_dump(exclude={"id"})
+    values["legacy_id"] = item.id
+    values["date_joined"] = values["date_joined"] or datetime.utcnow()
+    return values
+
+@router.post("/import/appointments")
+def import_appointments(
+    file: UploadFile = File(...),
+    staff: schemas.UserResponse = Depends(auth.get_current_staff),
+):
+    """รับไฟล์ .ndjson หรือ .csv (คอลัมน์เดียวกับ export) นำเข้าผู้ป่วยของระบบเดิมก่อน (แปลง user_id)"""
+    # INSERT ตรงไม่ผ่าน ORM: นับเข้าตารางสรุปรายวันเองใน transaction เดียวกัน
+    report = _import(file, models.Appointment, schemas.AppointmentImport, _prepare_appointment,
+                     prepare_batch=_resolve_appointments, on_insert=reports.add_rows)
+    availability.clear()
+    return report
+
+@router.post("/import/patients")
+def import_patients(
+    file: UploadFile = File(...),
+    staff: schemas.UserResponse = Depends(auth.get_current_staff),
+):
+    """รับไฟล์ .ndjson หรือ .csv (คอลัมน์เดียวกับ export) id เดิมเก็บเป็น legacy_id"""
+    report = _import(file, models.User, schemas.PatientImport, _prepare_patient)
+    patient_search.index.invalidate()  # INSERT ตรงไม่ผ่าน ORM: ให้ค้นหาครั้งถัดไปโหลด index ใหม่
+    return report
\ No newline at end of file
@@ -1,18 +1,97 @@
 # app/routes/doctor.py
-from fastapi import APIRouter
+from typing import List
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, selectinload
+from .. import schemas, database, auth, models, http_cache, schedules, slots, availability
 
 router = APIRouter(prefix="/doctors", tags=["Doctors"])
 
-# กำหนด list หมอแบบคงที่
-DOCTORS = [
-    "หมอสมชาย",
-    "หมอสมหญิง",
-    "หมอดำรงค์",
-]
-
 @router.get("/")
-def list_doctors():
+async def list_doctors(request: Request, response: Response, db: AsyncSession = Depends(database.get_async_read_db)):
+    """
+    คืน list ของหมอทั้งหมด (จาก cache ของ schedules ไม่ query ทุกครั้ง)
+    """
+    doctors = await db.run_sync(schedules.all_doctors)
+    etag = http_cache.make_etag(*(d.name for d in doctors))
+    # รายชื่อหมอแก้ได้แล้ว จึง cache สั้นลง
+    not_modified = http_cache.conditional(request, response, etag, cache_control="public, max-age=300")
+    if not_modified:
+        return not_modified
+    return [d.name for d in doctors]
+
+@router.get("/schedules", response_model=List[schemas.DoctorOut])
+async def list_schedules(db: AsyncSession = Depends(database.get_async_read_db)):
+    """คืนหมอพร้อมตารางออกตรวจประจำสัปดาห์"""
+    result = await db.execute(
+        select(models.Doctor)
+        .options(selectinload(models.Doctor.schedules))
+        .where(models.Doctor.active.is_(True))
+        .order_by(models.Doctor.id)
+    )
+    return result.scalars().all()
+
+def _build_schedule(entries: List[schemas.DoctorScheduleEntry]) -> List[models.DoctorSchedule]:
+    for entry in entries:
+        slots.slot_times(entry.time_slot)
+        if entry.last_time < entry.start_time:
+            raise HTTPException(status_code=400, detail="เวลาในตารางไม่ถูกต้อง")
+    return [models.DoctorSchedule(**entry.model_dump()) for entry in entries]
+
+def _schedules_changed(db: Session):
+    schedules.reload(db)
+    availability.clear()
+
+@router.post("/", response_model=schemas.DoctorOut)
+async def create_doctor(
+    doctor: schemas.DoctorCreate,
+    db: AsyncSession = Depends(database.get_async_db),
+    staff: schemas.UserResponse = Depends(auth.get_current_staff_async),
+):
+    return await db.run_sync(_create_doctor, doctor)
+
+def _create_doctor(db: Session, doctor: schemas.DoctorCreate):
+    entries = _build_schedule(doctor.schedules) if doctor.schedules is not None else schedules.default_schedule()
+    new_doctor = models.Doctor(name=doctor.name, schedules=entries)
+    db.add(new_doctor)
+    try:
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        raise HTTPException(status_code=400, detail="มีหมอชื่อนี้แล้ว หรือตารางซ้ำ")
+    db.refresh(new_doctor)
+    _schedules_changed(db)
+    return new_doctor
+
+@router.put("/{doctor_id}/schedule", response_model=schemas.DoctorOut)
+async def replace_schedule(
+    doctor_id: int,
+    entries: List[schemas.DoctorScheduleEntry],
+    db: AsyncSession = Depends(database.get_async_db),
+    staff: schemas.UserResponse = Depends(auth.get_current_staff_async),
+):
     """
-    คืน list ของหมอทั้งหมด
+    แทนที่ตารางออกตรวจทั้งหมดของหมอ
+    นัดหมายที่จองไว้แล้วไม่ถูกย้าย
     """
-    return DOCTORS
+    return await db.run_sync(_replace_schedule, doctor_id, entries)
+
+def _replace_schedule(db: Session, doctor_id: int, entries: List[schemas.DoctorScheduleEntry]):
+    doctor = db.get(models.Doctor, doctor_id)
+    if not doctor:
+        raise HTTPException(status_code=404, detail="ไม่พบหมอ")
+    new_entries = _build_schedule(entries)
+    # ลบแถวเดิมก่อนเพิ่มใหม่ (flush เดียวจะ insert ก่อน delete และชน unique)
+    doctor.schedules.clear()
+    db.flush()
+    doctor.schedules = new_entries
+    try:
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        raise HTTPException(status_code=400, detail="ตารางซ้ำในวันและช่วงเวลาเดียวกัน")
+    db.refresh(doctor)
+    _schedules_changed(db)
+    return doctor
@@ -1,40 +1,50 @@
 # routers/google_auth.py
+import logging
 import os
+from functools import lru_cache
 from fastapi import APIRouter, Depends, HTTPException, status
 from starlette.requests import Request
 from starlette.responses import RedirectResponse
-from authlib.integrations.starlette_client import OAuth
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from .. import crud, schemas, database, auth  # ต้องแน่ใจว่า import ถูกต้อง
 from dotenv import load_dotenv
 
 load_dotenv()
 
+logger = logging.getLogger("clinic.auth")
+
 router = APIRouter(tags=["Google Auth"])
-get_db = database.get_db
+get_async_db = database.get_async_db
 
 # ต้องตั้งค่า OAuth object โดยใช้ Client ID และ Secret
-oauth = OAuth()
-oauth.register(
-    name='google',
-    client_id=os.getenv('GOOGLE_CLIENT_ID'),
-    client_secret=os.getenv('GOOGLE_CLIENT_SECRET'),
-    server_metadata_url='https://accounts.google.com/.well-known/openid-configuration',
-    client_kwargs={'scope': 'openid email profile'},
-)
+# สร้างครั้งแรกที่มีคนกด login ด้วย Google (authlib import ช้า และ metadata ของ Google
+# ถูกโหลดจาก network ตอนใช้งานครั้งแรกแล้ว cache ไว้ใน client)
+@lru_cache(maxsize=1)
+def get_google_client():
+    from authlib.integrations.starlette_client import OAuth
+
+    oauth = OAuth()
+    oauth.register(
+        name='google',
+        client_id=os.getenv('GOOGLE_CLIENT_ID'),
+        client_secret=os.getenv('GOOGLE_CLIENT_SECRET'),
+        server_metadata_url='https://accounts.google.com/.well-known/openid-configuration',
+        client_kwargs={'scope': 'openid email profile'},
+    )
+    return oauth.google
 
 # Endpoint สำหรับเริ่มต้น Login
 @router.get('/google/login')
 async def login_via_google(request: Request):
     redirect_uri = request.url_for('auth_google_callback')
-    return await oauth.google.authorize_redirect(request, redirect_uri)
+    return await get_google_client().authorize_redirect(request, redirect_uri)
 
 #Endpoint สำหรับรับ Callback จาก Google
 @router.get('/google/callback', name='auth_google_callback')
-async def auth_google_callback(request: Request, db: Session = Depends(get_db)):
+async def auth_google_callback(request: Request, db: AsyncSession = Depends(get_async_db)):
     try:
         #แลก Code เป็น Access Token และ User Info
-        token = await oauth.google.authorize_access_token(request)
+        token = await get_google_client().authorize_access_token(request)
         user_info = token.get('userinfo')
         
         if not user_info or 'email' not in user_info:
@@ -44,7 +54,7 @@ async def auth_google_callback(request: Request, db: Session = Depends(get_db)):
         email = user_info['email']
 
         #ค้นหาผู้ใช้ในฐานข้อมูล (ใช้ฟังก์ชันที่คุณมีใน crud.py)
-        user = crud.get_user_by_email(db, email)
+        user = await crud.get_user_by_email_async(db, email)
 
         if not user:
             # ผู้ใช้ใหม่: สร้างบัญชีใหม่
@@ -55,7 +65,7 @@ async def auth_google_callback(request: Request, db: Session = Depends(get_db)):
                 family_name=user_info.get('family_name'),
                 picture=user_info.get('picture')
             )
-            user = crud.create_google_user(db, google_user_data) # สร้างผู้ใช้ใน DB
+            user = await crud.create_google_user_async(db, google_user_data) # สร้างผู้ใช้ใน DB
         
         #สร้าง JWT Token สำหรับผู้ใช้ที่ล็อกอิน
         # ตรวจสอบว่า 'user' มีค่าหรือไม่ ก่อนจะเรียก user.id
@@ -75,7 +85,7 @@ async def auth_google_callback(request: Request, db: Session = Depends(get_db)):
 
     except Exception as e:
         #จัดการ Error และแสดงรายละเอียด
-        print(f"GOOGLE AUTH FAILURE: {e}")
+        logger.exception("GOOGLE AUTH FAILURE: %s", e)
         
         # ตรวจสอบประเภท Error ที่อาจเกิดจาก Authlib 
         # (Invalid token, code already used, invalid credentials)
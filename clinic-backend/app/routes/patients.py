@@ -0,0 +1,19 @@
+# app/routes/patients.py
+from typing import Optional
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy.orm import Session
+from .. import schemas, database, auth, patient_search
+
+router = APIRouter(prefix="/patients", tags=["Patients"])
+
+@router.get("/search", response_model=schemas.PatientSearchPage)
+def search_patients(
+    q: str = Query(..., min_length=1, max_length=patient_search.MAX_QUERY_LENGTH),
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None,
+    db: Session = Depends(database.get_read_db),
+    staff: schemas.UserResponse = Depends(auth.get_current_staff),
+):
+    """ค้นหาผู้ป่วยด้วยชื่อ นามสกุล เบอร์โทร อีเมล หรือ username (ตรงต้นคำก่อน แล้วจึงสะกดใกล้เคียง)"""
+    items, next_cursor = patient_search.search(db, q, limit=limit, cursor=cursor)
+    return {"items": items, "next_cursor": next_cursor}
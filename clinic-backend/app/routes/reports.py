@@ -0,0 +1,19 @@
+# app/routes/reports.py
+from datetime import date
+from typing import List, Optional
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy.ext.asyncio import AsyncSession
+from .. import schemas, database, auth, reports
+
+router = APIRouter(prefix="/reports", tags=["Reports"])
+
+@router.get("/daily", response_model=List[schemas.DailySummary])
+async def daily_report(
+    date_from: date = Query(..., alias="from"),
+    date_to: date = Query(..., alias="to"),
+    doctor: Optional[str] = None,
+    db: AsyncSession = Depends(database.get_async_read_db),
+    staff: schemas.UserResponse = Depends(auth.get_current_staff_async),
+):
+    """จำนวนนัดหมายรายวันแยกตามหมอ ช่วงเวลา และสถานะ (อ่านจากตารางสรุป ไม่ scan appointments)"""
+    return await db.run_sync(reports.daily, date_from, date_to, doctor_name=doctor)
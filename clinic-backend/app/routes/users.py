@@ -1,20 +1,23 @@
 from datetime import datetime, date
-from fastapi import APIRouter, Depends, HTTPException, Body
-from sqlalchemy.orm import Session
-from .. import schemas, crud, database, auth
+from fastapi import APIRouter, Depends, Header, HTTPException, Body, Request, Response
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Optional
+import secrets
+from .. import schemas, crud, database, auth, hashing, http_cache, idempotency, ratelimit
 
 router = APIRouter(tags=["Users"])
-get_db = database.get_db
+get_async_db = database.get_async_db
 
 # ---------------- Register ----------------
-@router.post("/register", response_model=schemas.UserResponse)
-def register_user(user: schemas.UserCreate, db: Session = Depends(get_db)):
-    existing_user = db.query(crud.models.User).filter(
-        (crud.models.User.username == user.username) | (crud.models.User.email == user.email)
-    ).first()
-    if existing_user:
+@router.post("/register", response_model=schemas.UserResponse, dependencies=[Depends(ratelimit.auth_admission)])
+async def register_user(request: Request, user: schemas.UserCreate, db: AsyncSession = Depends(get_async_db)):
+    ratelimit.register_ip.check(ratelimit.client_ip(request))
+    # hash ใน process pool (hashing.py) แล้ว INSERT ครั้งเดียว: ซ้ำหรือไม่ให้ unique constraint ตัดสิน
+    hashed_password = await hashing.hash_password(user.password)
+    db_user = await crud.create_user_async(db, user, hashed_password)
+    if db_user is None:
         raise HTTPException(status_code=400, detail="ชื่อผู้ใช้หรืออีเมลนี้มีอยู่แล้ว")
-    return crud.create_user(db, user)
+    return db_user
 
 # ---------------- Login ----------------
 from pydantic import BaseModel
@@ -22,46 +25,120 @@ class LoginRequest(BaseModel):
     email: str
     password: str
 
-@router.post("/login", response_model=schemas.Token)
-def login(data: LoginRequest, db: Session = Depends(get_db)):
-    user = crud.get_user_by_email(db, data.email)
-    if not user or not auth.verify_password(data.password, user.password):
+@router.post("/login", response_model=schemas.Token, dependencies=[Depends(ratelimit.auth_admission)])
+async def login(request: Request, data: LoginRequest, db: AsyncSession = Depends(get_async_db)):
+    # ตัดก่อนถึง bcrypt: ต่อ IP (ยิงหลายบัญชี) และต่อบัญชี (เดารหัสผ่านจากหลาย IP)
+    # บัญชีถูกหักโควตาเฉพาะตอนรหัสผ่านผิด การ login สำเร็จไม่ทำให้เจ้าของบัญชีถูกล็อก
+    account = data.email.strip().lower()
+    ratelimit.login_ip.check(ratelimit.client_ip(request))
+    ratelimit.login_account.check(account, charge=0)
+    user = await crud.get_user_by_email_async(db, data.email)
+    if not user or not user.password:
+        ratelimit.login_account.penalize(account)
         raise HTTPException(status_code=400, detail="อีเมลหรือรหัสผ่านไม่ถูกต้อง")
-    access_token = auth.create_access_token({"sub": str(user.id)})
-    return {"access_token": access_token, "token_type": "bearer"}
+    valid, needs_rehash = await hashing.verify_password(data.password, user.password)
+    if not valid:
+        ratelimit.login_account.penalize(account)
+        raise HTTPException(status_code=400, detail="อีเมลหรือรหัสผ่านไม่ถูกต้อง")
+    # BCRYPT_ROUNDS เปลี่ยน: hash ใหม่ด้วย cost ปัจจุบัน
+    if needs_rehash:
+        await crud.update_password_async(db, user, await hashing.hash_password(data.password))
+    refresh_token, token_hash, expires_at = auth.new_refresh_token()
+    await crud.create_refresh_token_async(db, user.id, token_hash, secrets.token_hex(16), expires_at)
+    return _token_response(user.id, refresh_token)
+
+def _token_response(user_id: int, refresh_token: str):
+    return {
+        "access_token": auth.create_access_token({"sub": str(user_id)}),
+        "token_type": "bearer",
+        "refresh_token": refresh_token,
+        "expires_in": auth.ACCESS_TOKEN_EXPIRE_MINUTES * 60,
+    }
+
+def _refresh_rejected():
+    return HTTPException(status_code=401, detail="refresh token ไม่ถูกต้องหรือหมดอายุ กรุณาเข้าสู่ระบบใหม่")
+
+# ---------------- Refresh / Logout ----------------
+@router.post("/token/refresh", response_model=schemas.Token)
+async def refresh_access_token(data: schemas.RefreshRequest, db: AsyncSession = Depends(get_async_db)):
+    """
+    แลก refresh token เป็น access token ใหม่ (refresh token ใช้ได้ครั้งเดียว ได้ใบใหม่กลับไปทุกครั้ง)
+    ใบที่ถูกเพิกถอนแล้วถูกนำกลับมาใช้ = อาจถูกขโมย: เพิกถอนทั้ง family ให้ต้อง login ใหม่
+    """
+    current = await crud.get_refresh_token_async(db, auth.hash_token(data.refresh_token))
+    if current is None:
+        raise _refresh_rejected()
+    if current.revoked_at is not None:
+        await crud.revoke_refresh_family_async(db, current.family_id)
+        raise _refresh_rejected()
+    if current.expires_at <= datetime.utcnow():
+        raise _refresh_rejected()
+    refresh_token, token_hash, expires_at = auth.new_refresh_token()
+    if not await crud.rotate_refresh_token_async(db, current, token_hash, expires_at):
+        # คำขออื่นใช้ใบนี้ไปก่อนในจังหวะเดียวกัน
+        await crud.revoke_refresh_family_async(db, current.family_id)
+        raise _refresh_rejected()
+    return _token_response(current.user_id, refresh_token)
+
+@router.post("/logout", response_model=dict)
+async def logout(data: schemas.RefreshRequest, db: AsyncSession = Depends(get_async_db)):
+    """เพิกถอน refresh token ของการ login นี้ (access token ที่ออกไปแล้วหมดอายุเองตาม exp)"""
+    current = await crud.get_refresh_token_async(db, auth.hash_token(data.refresh_token))
+    if current is not None:
+        await crud.revoke_refresh_family_async(db, current.family_id)
+    return {"detail": "Logged out"}
 
 # ---------------- Current User ----------------
 @router.get("/me", response_model=schemas.UserResponse)
-def read_users_me(current_user: crud.models.User = Depends(auth.get_current_user)):
+async def read_users_me(
+    request: Request,
+    response: Response,
+    current_user: schemas.UserResponse = Depends(auth.get_current_user_cached_async),
+):
+    # ETag จากเนื้อหา snapshot (เปลี่ยนเมื่อแก้โปรไฟล์)
+    etag = http_cache.make_etag(*current_user.model_dump().values())
+    not_modified = http_cache.conditional(request, response, etag)
+    if not_modified:
+        return not_modified
     return current_user
 
 @router.put("/me/profile", response_model=schemas.UserResponse)
-def update_profile(
+async def update_profile(
     updated_data: schemas.UserUpdate,
-    db: Session = Depends(get_db),
-    current_user: crud.models.User = Depends(auth.get_current_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: crud.models.User = Depends(auth.get_current_user_async),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
 ):
-    data = updated_data.dict(exclude_unset=True)
+    # current_user มาจาก session เดียวกับ db (get_async_db ตัวเดียวกันใน request)
+    replay = await db.run_sync(idempotency.begin, current_user.id, idempotency_key, updated_data)
+    if replay:
+        return replay
+    data = updated_data.model_dump(exclude_unset=True)
     try:
         for key, value in data.items():
             if hasattr(current_user, key):
                 setattr(current_user, key, value)
-        # ปัญหา: แม้จะมีการเรียก db.commit() แต่ถ้าเกิดความผิดพลาดในส่วนใดส่วนหนึ่ง ข้อมูลอาจไม่ถูกบันทึก
-        db.commit() 
-        db.refresh(current_user)
+        if idempotency_key:
+            await db.flush()
+            body = schemas.UserResponse.model_validate(current_user).model_dump(mode="json")
+            await db.run_sync(idempotency.finish, body)
+        await db.commit()
+        auth.invalidate_user(current_user.id)
+        await db.refresh(current_user)
         return current_user
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=400, detail=f"การแก้ไข ล้มเหลว: {e}")
-    
+
 
 
 @router.delete("/me", response_model=dict)
-def delete_current_user(
-    db: Session = Depends(get_db),
-    current_user: crud.models.User = Depends(auth.get_current_user)
+async def delete_current_user(
+    db: AsyncSession = Depends(get_async_db),
+    current_user: crud.models.User = Depends(auth.get_current_user_async)
 ):
     
-    db.delete(current_user)
-    db.commit()
-    return {"detail": "User deleted successfully"}
\ No newline at end of file
+    user_id = current_user.id
+    await crud.delete_user_async(db, user_id)
+    auth.invalidate_user(user_id)
+    return {"detail": "User deleted successfully"}
@@ -0,0 +1,159 @@
+# schedules.py
+# ตารางออกตรวจของหมอที่ compile แล้วเก็บไว้ใน memory
+# การจอง/ดูเวลาว่างจึงไม่ต้อง query ตารางของหมอทุก request
+# โหลดใหม่เมื่อมีการแก้ไข (reload) และทุก SCHEDULE_CACHE_TTL_SECONDS เผื่อ worker อื่นแก้
+import os
+import threading
+import time as _time
+from datetime import date, datetime, timedelta, time
+from typing import Dict, List, Optional, Tuple
+from fastapi import HTTPException
+from sqlalchemy.orm import Session, selectinload
+from . import models, database, slots
+from .slots import SLOTS, SLOT_MINUTES
+
+SCHEDULE_CACHE_TTL_SECONDS = int(os.getenv("SCHEDULE_CACHE_TTL_SECONDS", "300"))
+
+class CompiledDoctor:
+    def __init__(self, doctor: models.Doctor):
+        self.id = doctor.id
+        self.name = doctor.name
+        # (weekday, time_slot) -> [(เวลา, capacity)]
+        self.slots: Dict[Tuple[int, str], List[Tuple[time, int]]] = {}
+        for s in doctor.schedules:
+            times = []
+            current = datetime.combine(date.min, s.start_time)
+            while current.time() <= s.last_time:
+                times.append((current.time(), s.capacity))
+                current += timedelta(minutes=s.slot_minutes)
+                if current.date() != date.min:
+                    break
+            self.slots[(s.weekday, s.time_slot)] = times
+
+    def times(self, day: date, time_slot: str) -> List[Tuple[time, int]]:
+        return self.slots.get((day.weekday(), time_slot), [])
+
+    def time_slots(self, day: date) -> List[str]:
+        weekday = day.weekday()
+        return [slot for (wd, slot) in self.slots if wd == weekday]
+
+
+_state = {"by_id": {}, "by_name": {}, "loaded_at": None, "version": 0}
+_lock = threading.Lock()
+
+def load(db: Session):
+    doctors = (
+        db.query(models.Doctor)
+        .options(selectinload(models.Doctor.schedules))
+        .filter(models.Doctor.active.is_(True))
+        .order_by(models.Doctor.id)
+        .all()
+    )
+    compiled = [CompiledDoctor(d) for d in doctors]
+    with _lock:
+        _state["by_id"] = {d.id: d for d in compiled}
+        _state["by_name"] = {d.name: d for d in compiled}
+        _state["loaded_at"] = _time.monotonic()
+        _state["version"] += 1
+
+def reload(db: Optional[Session] = None):
+    """เรียกหลังแก้ไขข้อมูลหมอ/ตาราง (หลัง commit)"""
+    if db is not None:
+        return load(db)
+    with database.SessionLocal() as own_db:
+        load(own_db)
+
+def _ensure_loaded(db: Optional[Session]):
+    loaded_at = _state["loaded_at"]
+    if loaded_at is None or _time.monotonic() - loaded_at > SCHEDULE_CACHE_TTL_SECONDS:
+        reload(db)
+
+def all_doctors(db: Optional[Session] = None) -> List[CompiledDoctor]:
+    _ensure_loaded(db)
+    return list(_state["by_id"].values())
+
+def version(db: Optional[Session] = None) -> int:
+    _ensure_loaded(db)
+    return _state["version"]
+
+def find_doctor(db: Optional[Session] = None, doctor_id: Optional[int] = None, name: Optional[str] = None) -> Optional[CompiledDoctor]:
+    _ensure_loaded(db)
+    if doctor_id is not None and doctor_id in _state["by_id"]:
+        return _state["by_id"][doctor_id]
+    if name is not None:
+        return _state["by_name"].get(name)
+    return None
+
+def get_doctor(db: Optional[Session] = None, doctor_id: Optional[int] = None, name: Optional[str] = None) -> CompiledDoctor:
+    doctor = find_doctor(db, doctor_id=doctor_id, name=name)
+    if doctor is None:
+        raise HTTPException(status_code=404, detail="ไม่พบหมอ")
+    return doctor
+
+def _bookable_doctor(db: Session, doctor_id: Optional[int] = None, name: Optional[str] = None) -> CompiledDoctor:
+    """หมอที่รับนัดได้ หมอที่มีในระบบแต่ไม่ออกตรวจแล้ว (active=False ไม่อยู่ใน cache) ตอบ 400"""
+    doctor = find_doctor(db, doctor_id=doctor_id, name=name)
+    if doctor is not None:
+        return doctor
+    D = models.Doctor
+    condition = D.id == doctor_id if doctor_id is not None else D.name == name
+    if db.query(D.id).filter(condition).first() is not None:
+        raise HTTPException(status_code=400, detail="หมอท่านนี้ไม่รับนัดแล้ว")
+    raise HTTPException(status_code=404, detail="ไม่พบหมอ")
+
+def book(db: Session, appointment: models.Appointment, appointment_date: date, time_slot: str, doctor_name: Optional[str] = None, taken_by_key=None, flush: bool = True, doctor_id: Optional[int] = None) -> time:
+    """
+    จองกับหมอที่เลือก (ตามชื่อ หรือ doctor_id ของหมอเดิมเมื่อเลื่อนนัด) หรือหมอคนใดก็ได้ที่ว่างถ้าไม่ได้เลือก (ดู slots.reserve)
+    taken_by_key: ผลของ slots.taken_seats_many ที่โหลดไว้ก่อน (batch)
+    """
+    if doctor_name or doctor_id is not None:
+        doctor = _bookable_doctor(db, doctor_id=None if doctor_name else doctor_id, name=doctor_name)
+        taken = slots.taken_for(db, taken_by_key, doctor.id, appointment_date, time_slot)
+        return slots.reserve(db, appointment, appointment_date, time_slot, doctor, taken=taken, flush=flush)
+    return slots.reserve_any(db, appointment, appointment_date, time_slot, all_doctors(db), taken_by_key, flush=flush)
+
+# ---------------- ค่าเริ่มต้น ----------------
+# หมอชุดเดิมที่เคย hard-code ไว้ ออกตรวจทุกวันตามช่วงเวลาเดิม ครั้งละ 1 คน
+DEFAULT_DOCTORS = [
+    "หมอสมชาย",
+    "หมอสมหญิง",
+    "หมอดำรงค์",
+]
+
+def default_schedule() -> List[models.DoctorSchedule]:
+    return [
+        models.DoctorSchedule(
+            weekday=weekday, time_slot=slot, start_time=start, last_time=last,
+            slot_minutes=SLOT_MINUTES, capacity=1,
+        )
+        for weekday in range(7)
+        for slot, (start, last) in SLOTS.items()
+    ]
+
+def seed_defaults(db: Session) -> int:
+    """เพิ่มหมอเริ่มต้นเมื่อตาราง doctors ยังว่าง คืนจำนวนที่เพิ่ม"""
+    if db.query(models.Doctor.id).first() is not None:
+        return 0
+    for name in DEFAULT_DOCTORS:
+        db.add(models.Doctor(name=name, schedules=default_schedule()))
+    db.commit()
+    return len(DEFAULT_DOCTORS)
+
+# ---------------- หมอของนัดหมายเดิม ----------------
+# นัดหมายเก่า / นำเข้าที่ไม่มีชื่อหมอ ผูกกับหมอชื่อนี้ (doctor_id ของนัดหมายเป็น NULL ไม่ได้)
+UNKNOWN_DOCTOR = "ไม่ระบุหมอ"
+
+def doctor_ids(db: Session, names) -> Dict[Optional[str], int]:
+    """
+    id ของหมอตามชื่อ (รวมหมอที่ไม่ออกตรวจแล้ว) ชื่อที่ยังไม่มีสร้างเป็นหมอ active=False ไม่มีตารางออกตรวจ
+    ใช้ผูกนัดหมายเก่า / นัดที่นำเข้า จองใหม่กับหมอเหล่านี้ไม่ได้ ยังไม่ commit
+    """
+    names = set(names)
+    wanted = {name or UNKNOWN_DOCTOR for name in names}
+    found = dict(db.query(models.Doctor.name, models.Doctor.id).filter(models.Doctor.name.in_(wanted)).all())
+    for name in sorted(wanted - found.keys()):
+        doctor = models.Doctor(name=name, active=False)
+        db.add(doctor)
+        db.flush()
+        found[name] = doctor.id
+    return {name: found[name or UNKNOWN_DOCTOR] for name in names}
@@ -1,6 +1,6 @@
 from datetime import datetime, date, time
-from pydantic import BaseModel, EmailStr, validator
-from typing import Optional, Union
+from pydantic import BaseModel, EmailStr, Field, validator
+from typing import Dict, List, Literal, Optional, Union
 
 # ---------------- User ----------------
 class UserBase(BaseModel):
@@ -84,6 +84,11 @@ class UserResponse(BaseModel):
 
     model_config = {"from_attributes": True}
 
+class PatientImport(UserResponse):
+    # ข้อมูลจากระบบเก่า: id เดิมเก็บเป็น legacy_id (ได้ id ใหม่) และไม่มีรหัสผ่าน
+    id: Optional[int] = None
+    date_joined: Optional[datetime] = None
+
 # ---------------- Appointment ----------------
 class AppointmentBase(BaseModel):
     appointment_date: date
@@ -116,10 +121,102 @@ class AppointmentOut(BaseModel):
 
     model_config = {"from_attributes": True}
 
+class AppointmentImport(AppointmentOut):
+    # ข้อมูลจากระบบเก่า: ไม่ใช้ id เดิม user_id เป็น id ผู้ป่วยในระบบเก่า (แปลงตอนนำเข้า)
+    id: Optional[int] = None
+    status: str = "รอการยืนยัน"
+    created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
+
+class AppointmentBatchOperation(BaseModel):
+    op: Literal["create", "reschedule", "cancel"]
+    id: Optional[int] = None  # สำหรับ reschedule / cancel
+    appointment_date: Optional[date] = None
+    time_slot: Optional[str] = None
+    doctor_name: Optional[str] = None
+    reason: Optional[str] = None
+
+class AppointmentBatch(BaseModel):
+    operations: List[AppointmentBatchOperation] = Field(..., min_length=1, max_length=100)
+    atomic: bool = True  # True = สำเร็จทั้งหมดหรือไม่บันทึกเลย / False = บันทึกเฉพาะรายการที่สำเร็จ
+
+class AppointmentBatchResult(BaseModel):
+    index: int
+    ok: bool
+    appointment: Optional[AppointmentOut] = None
+    detail: Optional[str] = None
+
+class AppointmentBatchResponse(BaseModel):
+    committed: bool
+    results: List[AppointmentBatchResult]
+
+class AppointmentPage(BaseModel):
+    items: List[AppointmentOut]
+    next_cursor: Optional[str] = None  # ส่งกลับมาเพื่อขอหน้าถัดไป
+
+class DayAvailability(BaseModel):
+    date: date
+    doctor: str
+    slots: Dict[str, List[time]]  # slot -> เวลาที่ยังว่าง
+
+class PatientSearchPage(BaseModel):
+    items: List[UserResponse]
+    next_cursor: Optional[str] = None
+
+class AppointmentsPageBootstrap(BaseModel):
+    # ทุกอย่างที่หน้าตารางนัดต้องใช้ตอนเปิดในคำขอเดียว (ดู routes/bootstrap.py)
+    user: UserResponse
+    doctors: List[str]
+    appointments: AppointmentPage
+    availability: List[DayAvailability]
+    availability_from: date
+    availability_to: date
+
+# ---------------- Reports ----------------
+class DailySlotSummary(BaseModel):
+    doctor: str
+    time_slot: str
+    total: int
+    by_status: Dict[str, int]
+
+class DailySummary(BaseModel):
+    date: date
+    total: int
+    by_status: Dict[str, int]
+    slots: List[DailySlotSummary]
+
+# ---------------- Doctor ----------------
+class DoctorScheduleEntry(BaseModel):
+    weekday: int = Field(..., ge=0, le=6)  # 0 = จันทร์ ... 6 = อาทิตย์
+    time_slot: str  # เช้า / บ่าย
+    start_time: time
+    last_time: time
+    slot_minutes: int = Field(30, ge=5, le=240)
+    capacity: int = Field(1, ge=1, le=50)
+
+    model_config = {"from_attributes": True}
+
+class DoctorCreate(BaseModel):
+    name: str
+    schedules: Optional[List[DoctorScheduleEntry]] = None  # ไม่ระบุ = ตารางเริ่มต้น
+
+class DoctorOut(BaseModel):
+    id: int
+    name: str
+    active: bool
+    schedules: List[DoctorScheduleEntry]
+
+    model_config = {"from_attributes": True}
+
 # ---------------- JWT ----------------
 class Token(BaseModel):
     access_token: str
     token_type: str
+    refresh_token: Optional[str] = None
+    expires_in: Optional[int] = None  # อายุ access_token (วินาที)
+
+class RefreshRequest(BaseModel):
+    refresh_token: str
 
 class TokenData(BaseModel):
     username: Optional[str] = None
@@ -0,0 +1,130 @@
+# slots.py
+# ระบบจองเวลาใน slot (เช้า / บ่าย)
+# ที่นั่ง (หมอ, วัน, เวลา, seat) ถูกจองได้ครั้งเดียวด้วย unique constraint ใน appointments
+# จึงไม่ต้อง count() และปลอดภัยเมื่อมีหลาย worker จองพร้อมกัน
+# เวลาของหมอแต่ละคนมาจากตารางออกตรวจ (ดู schedules.py) SLOTS ด้านล่างเป็นค่าเริ่มต้น
+from datetime import datetime, timedelta, date, time
+from typing import Dict, List, Optional, Set, Tuple
+from fastapi import HTTPException
+from sqlalchemy import and_, or_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from . import models
+
+SLOT_MINUTES = 30
+
+# ช่วงเวลา: (เวลาเริ่ม, เวลานัดสุดท้าย)
+SLOTS = {
+    "เช้า": (time(8, 0), time(11, 30)),
+    "บ่าย": (time(13, 0), time(17, 30)),
+}
+
+def _build_times(start: time, last: time) -> List[time]:
+    times = []
+    current = datetime.combine(date.min, start)
+    while current.time() <= last:
+        times.append(current.time())
+        current += timedelta(minutes=SLOT_MINUTES)
+    return times
+
+# คำนวณเวลาทั้งหมดของแต่ละ slot ไว้ล่วงหน้า
+SLOT_TIMES = {name: _build_times(start, last) for name, (start, last) in SLOTS.items()}
+
+def slot_times(time_slot: str) -> List[time]:
+    if time_slot not in SLOT_TIMES:
+        raise HTTPException(status_code=400, detail="ช่วงเวลาไม่ถูกต้อง")
+    return SLOT_TIMES[time_slot]
+
+def taken_seats(db: Session, doctor_id: int, appointment_date: date, time_slot: str, exclude_id: Optional[int] = None):
+    A = models.Appointment
+    query = db.query(A.appointment_time, A.seat).filter(
+        A.doctor_id == doctor_id,
+        A.appointment_date == appointment_date,
+        A.time_slot == time_slot,
+    )
+    if exclude_id is not None:
+        query = query.filter(A.id != exclude_id)
+    return {(row.appointment_time, row.seat) for row in query}
+
+def taken_seats_many(db: Session, keys) -> Dict[Tuple[int, date, str], Set[Tuple[time, int]]]:
+    """ที่นั่งที่ถูกจองของหลาย (doctor_id, วัน, slot) ใน query เดียว (ใช้กับ batch)"""
+    A = models.Appointment
+    result = {key: set() for key in keys}
+    if not result:
+        return result
+    # OR ของเงื่อนไขเท่ากับ ไม่ใช้ tuple IN: SQLite สแกนทั้ง index เมื่อเป็น row value IN
+    rows = db.query(A.doctor_id, A.appointment_date, A.time_slot, A.appointment_time, A.seat).filter(or_(*(
+        and_(A.doctor_id == doctor_id, A.appointment_date == day, A.time_slot == slot)
+        for doctor_id, day, slot in result
+    )))
+    for row in rows:
+        result[(row.doctor_id, row.appointment_date, row.time_slot)].add((row.appointment_time, row.seat))
+    return result
+
+def reserve(db: Session, appointment: models.Appointment, appointment_date: date, time_slot: str, doctor, taken=None, flush: bool = True) -> time:
+    """
+    จองที่นั่งแรกที่ว่างในตารางของหมอ (schedules.CompiledDoctor) ให้ appointment แล้ว flush
+    ถ้าที่นั่งนั้นถูกอีก request จองไปก่อน (IntegrityError) จะลองที่นั่งถัดไป
+    taken: ที่นั่งที่ถูกจองแล้วซึ่งโหลดไว้ก่อน (batch) จะถูกเพิ่มที่นั่งที่จองได้ลงไปด้วย
+    flush=False: ใช้ที่นั่งว่างแรกตาม taken โดยไม่ flush / savepoint
+    (batch flush ทีเดียว ถ้าชนจะได้ IntegrityError ตอนนั้น)
+    ยังไม่ commit — ผู้เรียกต้อง commit เอง
+    """
+    slot_times(time_slot)
+    schedule = doctor.times(appointment_date, time_slot)
+    if not schedule:
+        raise HTTPException(status_code=400, detail="ไม่มีตารางตรวจในช่วงเวลานี้")
+    if taken is None:
+        taken = taken_seats(db, doctor.id, appointment_date, time_slot, exclude_id=appointment.id)
+
+    for candidate, capacity in schedule:
+        for seat in range(capacity):
+            if (candidate, seat) in taken:
+                continue
+            if not flush:
+                _assign(appointment, doctor, appointment_date, time_slot, candidate, seat)
+                db.add(appointment)
+                taken.add((candidate, seat))
+                return candidate
+            try:
+                with db.begin_nested():
+                    _assign(appointment, doctor, appointment_date, time_slot, candidate, seat)
+                    db.add(appointment)
+                    db.flush()
+                taken.add((candidate, seat))
+                return candidate
+            except IntegrityError:
+                # มีคนจองที่นั่งนี้ไปพร้อมกัน ลองที่นั่งถัดไป
+                continue
+
+    raise HTTPException(status_code=400, detail=f"{time_slot}เต็มแล้ว")
+
+def _assign(appointment: models.Appointment, doctor, appointment_date: date, time_slot: str, candidate: time, seat: int):
+    appointment.doctor_id = doctor.id
+    appointment.doctor_name = doctor.name
+    appointment.appointment_date = appointment_date
+    appointment.time_slot = time_slot
+    appointment.appointment_time = candidate
+    appointment.seat = seat
+
+def taken_for(db: Session, taken_by_key, doctor_id: int, appointment_date: date, time_slot: str):
+    """ที่นั่งที่ถูกจองจากผลของ taken_seats_many (None = ให้ reserve query เอง)"""
+    if taken_by_key is None:
+        return None
+    key = (doctor_id, appointment_date, time_slot)
+    if key not in taken_by_key:
+        taken_by_key[key] = taken_seats(db, doctor_id, appointment_date, time_slot)
+    return taken_by_key[key]
+
+def reserve_any(db: Session, appointment: models.Appointment, appointment_date: date, time_slot: str, doctors, taken_by_key=None, flush: bool = True) -> time:
+    """ไม่ได้เลือกหมอ: จองกับหมอคนแรกที่ยังมีที่ว่าง (ความจุรวม = ทุกคนที่ออกตรวจ)"""
+    slot_times(time_slot)
+    for doctor in doctors:
+        if not doctor.times(appointment_date, time_slot):
+            continue
+        try:
+            taken = taken_for(db, taken_by_key, doctor.id, appointment_date, time_slot)
+            return reserve(db, appointment, appointment_date, time_slot, doctor, taken=taken, flush=flush)
+        except HTTPException:
+            continue
+    raise HTTPException(status_code=400, detail=f"{time_slot}เต็มแล้ว")
@@ -0,0 +1,225 @@
+# bench/bench_api.py
+# benchmark เส้นทางหลักของ API ผ่าน ASGI client ใน process เดียวกัน
+# ใช้: python -m bench.bench_api --users 1000 --appointments 50000 --output bench.json
+# ฐานข้อมูลเริ่มต้นเป็น SQLite ไฟล์ชั่วคราว หรือระบุ --database-url postgresql://... (ฐานข้อมูลทดสอบเท่านั้น)
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+
+PASSWORD = "secret1"
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--database-url", default=None)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--appointments", type=int, default=5000)
+    parser.add_argument("--requests", type=int, default=200, help="จำนวน request ต่อ scenario")
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--booking-clients", type=int, default=40, help="จำนวน client ที่แย่งจอง slot เดียวกัน")
+    parser.add_argument("--batch-size", type=int, default=20, help="จำนวนนัดต่อ request ของ batch_appointments (ไม่เกิน 100)")
+    parser.add_argument("--bcrypt-rounds", type=int, default=12)
+    parser.add_argument("--output", default=None, help="ไฟล์ JSON ผลลัพธ์ (ไม่ระบุ = stdout)")
+    return parser.parse_args()
+
+def configure_env(args):
+    # ต้องตั้งก่อน import app
+    url = args.database_url or f"sqlite:///{tempfile.mkdtemp()}/bench.db"
+    os.environ["DATABASE_URL"] = url
+    os.environ["BCRYPT_ROUNDS"] = str(args.bcrypt_rounds)
+    # ทุก request มาจาก IP / บัญชีเดียวกัน
+    os.environ["RATE_LIMIT_ENABLED"] = "false"
+    os.environ["STAFF_EMAILS"] = "bench0@example.com"  # สำหรับ /reports/daily
+    return url
+
+def seed(args):
+    from sqlalchemy import insert
+    from app import database, models, hashing, slots, manage, reports
+
+    manage.init_db()  # ตาราง + หมอเริ่มต้น (หมอสมชาย = id 1)
+    hashed = hashing.hash_sync(PASSWORD)
+    now = datetime.utcnow()
+    db = database.SessionLocal()
+    try:
+        db.execute(insert(models.User), [
+            {"username": f"bench{i}", "email": f"bench{i}@example.com", "password": hashed, "date_joined": now}
+            for i in range(args.users)
+        ])
+        # เติมนัดหมายย้อนหลังจากเมื่อวาน โดยไม่ชนเวลาเดียวกัน
+        times = [(slot, t) for slot, ts in slots.SLOT_TIMES.items() for t in ts]
+        rows = []
+        for i in range(args.appointments):
+            slot, t = times[i % len(times)]
+            rows.append({
+                "user_id": 1 + i % max(args.users, 1),
+                "doctor_id": 1, "doctor_name": "หมอสมชาย",
+                "appointment_date": date.today() - timedelta(days=1 + i // len(times)),
+                "appointment_time": t,
+                "time_slot": slot,
+                "reason": "bench",
+                "status": "รอการยืนยัน",
+                "created_at": now,
+                "updated_at": now,
+            })
+            if len(rows) == 5000:
+                db.execute(insert(models.Appointment), rows)
+                reports.add_rows(db.connection(), rows)
+                rows = []
+        if rows:
+            db.execute(insert(models.Appointment), rows)
+            reports.add_rows(db.connection(), rows)
+        db.commit()
+    finally:
+        db.close()
+
+def summarize(latencies, elapsed, statuses):
+    ordered = sorted(latencies)
+
+    def pct(p):
+        return round(ordered[min(len(ordered) - 1, int(len(ordered) * p))] * 1000, 2)
+
+    return {
+        "requests": len(latencies),
+        "throughput_rps": round(len(latencies) / elapsed, 1) if elapsed else None,
+        "mean_ms": round(statistics.fmean(latencies) * 1000, 2),
+        "p50_ms": pct(0.50),
+        "p95_ms": pct(0.95),
+        "p99_ms": pct(0.99),
+        "status_counts": {str(k): v for k, v in sorted(statuses.items())},
+    }
+
+async def run_scenario(make_request, total: int, concurrency: int):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, statuses = [], {}
+
+    async def one(i):
+        async with semaphore:
+            start = time.perf_counter()
+            response = await make_request(i)
+            latencies.append(time.perf_counter() - start)
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(total)))
+    return summarize(latencies, time.perf_counter() - started, statuses)
+
+async def run(args):
+    import httpx
+    from app import database, hashing
+    from app.main import app
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        tokens = []
+        for i in range(min(args.users, args.concurrency)):
+            r = await client.post("/login", json={"email": f"bench{i}@example.com", "password": PASSWORD})
+            tokens.append(r.json()["access_token"])
+
+        def headers(i):
+            return {"Authorization": f"Bearer {tokens[i % len(tokens)]}"}
+
+        # วันที่ในอนาคตสำหรับการจอง ให้แต่ละ request ได้วันที่ไม่เต็ม
+        capacity = 10
+        first_day = date.today() + timedelta(days=30)
+
+        def batch_operations(i):
+            # ไม่เลือกหมอ: วันละ 30 ที่ (หมอเริ่มต้น 3 คน x 10 เวลาช่วงบ่าย)
+            first = i * args.batch_size
+            return [{
+                "op": "create",
+                "appointment_date": (first_day + timedelta(days=1000 + (first + j) // 30)).isoformat(),
+                "time_slot": "บ่าย",
+                "reason": "bench",
+            } for j in range(args.batch_size)]
+
+        scenarios = {
+            "login": lambda i: client.post("/login", json={"email": f"bench{i % args.users}@example.com", "password": PASSWORD}),
+            "me": lambda i: client.get("/me", headers=headers(i)),
+            "create_appointment": lambda i: client.post("/appointments/", headers=headers(i), json={
+                "appointment_date": (first_day + timedelta(days=i // capacity)).isoformat(),
+                "time_slot": "บ่าย",
+                "reason": "bench",
+                "doctor_name": "หมอสมชาย",
+            }),
+            # --batch-size นัดต่อ request (เทียบกับ create_appointment ทีละรายการ ดู batch_speedup)
+            "batch_appointments": lambda i: client.post("/appointments/batch", headers=headers(i), json={
+                "operations": batch_operations(i),
+            }),
+            "list_appointments": lambda i: client.get("/appointments/", headers=headers(i), params={"limit": 50}),
+            "doctors": lambda i: client.get("/doctors/"),
+            # อ่านจากตารางสรุปอย่างเดียว ไม่ควรช้าลงตาม --appointments (tokens[0] = bench0 = เจ้าหน้าที่)
+            "daily_report": lambda i: client.get("/reports/daily", headers=headers(0), params={
+                "from": (date.today() - timedelta(days=31)).isoformat(),
+                "to": date.today().isoformat(),
+            }),
+        }
+
+        results = {}
+        for name, make_request in scenarios.items():
+            results[name] = await run_scenario(make_request, args.requests, args.concurrency)
+        # นัดต่อวินาทีของ batch เทียบกับจองทีละนัด
+        results["batch_speedup"] = round(
+            results["batch_appointments"]["throughput_rps"] * args.batch_size / results["create_appointment"]["throughput_rps"], 1
+        )
+
+        # client หลายคนแย่งจอง slot เดียวกันพร้อมกัน: เวลาที่ได้ต้องไม่ซ้ำ
+        race_day = (first_day - timedelta(days=1)).isoformat()
+        booked = []
+
+        async def book(i):
+            r = await client.post("/appointments/", headers=headers(i), json={
+                "appointment_date": race_day, "time_slot": "เช้า", "reason": "race", "doctor_name": "หมอสมชาย",
+            })
+            if r.status_code == 200:
+                booked.append(r.json()["appointment_time"])
+            return r
+
+        race = await run_scenario(book, args.booking_clients, args.booking_clients)
+        race["booked"] = len(booked)
+        race["duplicate_times"] = len(booked) - len(set(booked))
+        results["concurrent_booking"] = race
+
+    # ปิด connection ของ async engine (thread ของ aiosqlite) และ process pool
+    await database.async_engine.dispose()
+    hashing.shutdown()
+    return results
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def main():
+    args = parse_args()
+    url = configure_env(args)
+    seed(args)
+    results = asyncio.run(run(args))
+    report = {
+        "commit": git_commit(),
+        "timestamp": datetime.utcnow().isoformat(),
+        "config": {
+            "database": url.split("://")[0],
+            "users": args.users,
+            "appointments": args.appointments,
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "batch_size": args.batch_size,
+            "bcrypt_rounds": args.bcrypt_rounds,
+        },
+        "results": results,
+    }
+    output = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output)
+    else:
+        print(output)
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
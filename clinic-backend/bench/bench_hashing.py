@@ -0,0 +1,36 @@
+# bench/bench_hashing.py
+# วัด throughput ของการตรวจรหัสผ่าน (bcrypt) เมื่อเพิ่มจำนวน process
+# ใช้: python -m bench.bench_hashing --requests 64 --rounds 12
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from passlib.hash import bcrypt
+
+def _verify(args):
+    password, hashed = args
+    return bcrypt.verify(password, hashed)
+
+def run(workers: int, requests: int, hashed: str) -> float:
+    jobs = [("secret1", hashed)] * requests
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        list(pool.map(_verify, jobs[:workers]))  # warm up
+        start = time.perf_counter()
+        list(pool.map(_verify, jobs))
+        return requests / (time.perf_counter() - start)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=64)
+    parser.add_argument("--rounds", type=int, default=int(os.getenv("BCRYPT_ROUNDS", "12")))
+    args = parser.parse_args()
+
+    hashed = bcrypt.using(rounds=args.rounds).hash("secret1")
+    cores = os.cpu_count() or 1
+    workers = sorted({1, 2, 4, 8, cores} & set(range(1, cores + 1)))
+    results = [{"workers": w, "logins_per_sec": round(run(w, args.requests, hashed), 1)} for w in workers]
+    print(json.dumps({"benchmark": "bcrypt_verify", "rounds": args.rounds, "cores": cores, "results": results}, indent=2))
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
@@ -0,0 +1,87 @@
+# bench/bench_search.py
+# วัด latency ของการค้นหาผู้ป่วยด้วย trigram index ใน process (patient_search.NgramIndex) ที่จำนวนผู้ใช้มาก
+# เป้าหมาย: p99 ของทุกคำค้นไม่เกิน --target-ms (ค่าเริ่มต้น 5 ms) ที่ 200k ผู้ใช้
+# ใช้: python -m bench.bench_search --users 200000 --repeat 200
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+os.environ.setdefault("DATABASE_URL", "sqlite://")  # สร้าง index จากข้อมูลสุ่มโดยตรง ไม่ใช้ฐานข้อมูล
+
+FIRST_NAMES = [
+    "somchai", "somying", "somsak", "somporn", "kittipong", "kanya", "malee", "narong", "prasert", "suda",
+    "wichai", "anong", "chaiwat", "pimchanok", "thanawat", "siriporn", "arthit", "nattaya", "boonmee", "ratana",
+]
+LAST_NAMES = [
+    "srisuk", "wongsawat", "chaiyaporn", "saelim", "thongdee", "rattanakul", "boonyarat", "kaewmanee",
+    "phromma", "sukjai", "jantarasri", "meesuk", "inthanon", "pongpanich", "sombat", "charoenphon",
+]
+DOMAINS = ["gmail.com", "hotmail.com", "yahoo.com", "outlook.com", "icloud.com"]
+
+# คำค้นที่ใช้กันจริง: ตรงต้นคำ, อยู่ในเอกสารเกือบทุกคน, สะกดผิด, เบอร์โทร
+QUERIES = [
+    "gmail", "com", "somchia", "somchai", "srisuk", "kittipong won", "0812", "user12345", "user1 somchai", "xqzv",
+]
+
+def users(count: int, seed: int):
+    rng = random.Random(seed)
+    for user_id in range(1, count + 1):
+        first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+        username = f"user{user_id}"
+        yield (
+            user_id, username, f"{first}.{last}{rng.randint(1, 999)}@{rng.choice(DOMAINS)}",
+            first, last, f"08{rng.randint(0, 99999999):08d}",
+        )
+
+def percentile(ordered, p):
+    return round(ordered[min(len(ordered) - 1, int(len(ordered) * p))] * 1000, 3)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=200_000)
+    parser.add_argument("--repeat", type=int, default=200, help="จำนวนครั้งต่อคำค้น")
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--target-ms", type=float, default=5.0, help="p99 ที่ต้องไม่เกิน")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    from app import patient_search
+
+    index = patient_search.NgramIndex()
+    started = time.perf_counter()
+    index.build(users(args.users, args.seed))
+    build_seconds = time.perf_counter() - started
+
+    results = []
+    for query in QUERIES:
+        query = patient_search.normalize(query)
+        latencies = []
+        for _ in range(args.repeat):
+            started = time.perf_counter()
+            ids, _ = index.search(query, args.limit)
+            latencies.append(time.perf_counter() - started)
+        ordered = sorted(latencies)
+        results.append({
+            "query": query,
+            "results": len(ids),
+            "p50_ms": percentile(ordered, 0.50),
+            "p99_ms": percentile(ordered, 0.99),
+        })
+
+    worst = max(r["p99_ms"] for r in results)
+    print(json.dumps({
+        "benchmark": "patient_search",
+        "users": args.users,
+        "build_seconds": round(build_seconds, 2),
+        "target_p99_ms": args.target_ms,
+        "worst_p99_ms": worst,
+        "within_target": worst <= args.target_ms,
+        "results": results,
+    }, indent=2, ensure_ascii=False))
+    return 0 if worst <= args.target_ms else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
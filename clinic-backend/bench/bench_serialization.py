@@ -0,0 +1,105 @@
+# bench/bench_serialization.py
+# เปรียบเทียบ GET /appointments/ ทั้ง request (ผ่าน ASGI client ใน process เดียวกัน)
+#   orm:  ORM object -> pydantic AppointmentOut (from_attributes) -> json   (ค่าเริ่มต้น)
+#   fast: query เฉพาะคอลัมน์ -> dict -> orjson                              (?fast=true)
+# ขนาดหน้าไม่เกิน crud.MAX_PAGE_SIZE (200) เท่าที่ client ขอได้จริง
+# ใช้: python -m bench.bench_serialization --sizes 20 50 100 200 --requests 200
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+
+PASSWORD = "secret1"
+
+def seed(rows: int):
+    from sqlalchemy import insert
+    from app import database, models, slots, manage, hashing
+
+    manage.init_db()  # ตาราง + หมอเริ่มต้น (หมอสมชาย = id 1)
+    times = [(slot, t) for slot, ts in slots.SLOT_TIMES.items() for t in ts]
+    now = datetime.utcnow()
+    db = database.SessionLocal()
+    try:
+        db.execute(insert(models.User), [{
+            "username": "bench", "email": "bench@example.com", "password": hashing.hash_sync(PASSWORD), "date_joined": now,
+        }])
+        batch = []
+        for i in range(rows):
+            slot, t = times[i % len(times)]
+            batch.append({
+                "user_id": 1, "doctor_id": 1, "doctor_name": "หมอสมชาย",
+                "appointment_date": date(2020, 1, 1) + timedelta(days=i // len(times)),
+                "appointment_time": t, "time_slot": slot, "reason": "bench",
+                "status": "รอการยืนยัน", "created_at": now, "updated_at": now,
+            })
+            if len(batch) == 10000:
+                db.execute(insert(models.Appointment), batch)
+                batch = []
+        if batch:
+            db.execute(insert(models.Appointment), batch)
+        db.commit()
+    finally:
+        db.close()
+
+def summarize(latencies, body_bytes):
+    ordered = sorted(latencies)
+    return {
+        "p50_ms": round(statistics.median(ordered) * 1000, 2),
+        "p95_ms": round(ordered[int(len(ordered) * 0.95) - 1] * 1000, 2),
+        "bytes": body_bytes,
+    }
+
+async def run(args):
+    import httpx
+    from app import database, hashing, crud
+    from app.main import app
+
+    transport = httpx.ASGITransport(app=app)
+    results = []
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        r = await client.post("/login", json={"email": "bench@example.com", "password": PASSWORD})
+        headers = {"Authorization": f"Bearer {r.json()['access_token']}"}
+
+        async def measure(size, fast):
+            params = {"limit": size, "fast": "true"} if fast else {"limit": size}
+            latencies, body = [], b""
+            for _ in range(args.requests):
+                start = time.perf_counter()
+                response = await client.get("/appointments/", headers=headers, params=params)
+                latencies.append(time.perf_counter() - start)
+                body = response.content
+                assert response.status_code == 200 and len(response.json()["items"]) == size
+            return summarize(latencies, len(body))
+
+        for size in args.sizes:
+            size = min(size, crud.MAX_PAGE_SIZE)
+            await measure(size, False)  # warm up (cache ของ user / statement)
+            orm = await measure(size, False)
+            fast = await measure(size, True)
+            results.append({"rows": size, "orm": orm, "fast": fast, "speedup_p50": round(orm["p50_ms"] / fast["p50_ms"], 2)})
+
+    await database.async_engine.dispose()
+    hashing.shutdown()
+    return results
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[20, 50, 100, 200])
+    parser.add_argument("--requests", type=int, default=200, help="จำนวน request ต่อขนาดหน้าต่อแบบ")
+    parser.add_argument("--appointments", type=int, default=5000)
+    args = parser.parse_args()
+
+    os.environ.setdefault("DATABASE_URL", f"sqlite:///{tempfile.mkdtemp()}/serialization.db")
+    os.environ.setdefault("BCRYPT_ROUNDS", "4")
+    os.environ["RATE_LIMIT_ENABLED"] = "false"
+    seed(args.appointments)
+
+    results = asyncio.run(run(args))
+    print(json.dumps({"benchmark": "appointment_list_endpoint", "requests": args.requests, "results": results}, indent=2))
+
+if __name__ == "__main__":
+    main()
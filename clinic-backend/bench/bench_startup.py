@@ -0,0 +1,57 @@
+# bench/bench_startup.py
+# วัดเวลาที่ worker ใหม่ใช้ตั้งแต่เริ่ม process จนตอบ request แรกได้ (cold start)
+# ใช้: python -m bench.bench_startup --runs 5
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+# เป้าหมาย: import app + lifespan + request แรก ต้องไม่เกินค่านี้
+COLD_START_TARGET_SECONDS = 1.0
+
+CHILD = """
+import asyncio, json, time
+start = time.perf_counter()
+from app.main import app
+imported = time.perf_counter()
+
+async def first_request():
+    import httpx
+    async with app.router.lifespan_context(app):
+        ready = time.perf_counter()
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            r = await client.get("/doctors/")
+            assert r.status_code == 200, r.status_code
+        return ready, time.perf_counter()
+
+ready, served = asyncio.run(first_request())
+print(json.dumps({"import": imported - start, "ready": ready - start, "first_request": served - start}))
+"""
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    env = dict(os.environ)
+    env.setdefault("DATABASE_URL", f"sqlite:///{tempfile.mkdtemp()}/startup.db")
+    runs = []
+    for _ in range(args.runs):
+        out = subprocess.check_output([sys.executable, "-c", CHILD], env=env, text=True)
+        runs.append(json.loads(out.strip().splitlines()[-1]))
+
+    summary = {key: round(statistics.median(r[key] for r in runs), 3) for key in runs[0]}
+    print(json.dumps({
+        "benchmark": "cold_start",
+        "runs": args.runs,
+        "median_seconds": summary,
+        "target_seconds": COLD_START_TARGET_SECONDS,
+        "within_target": summary["first_request"] <= COLD_START_TARGET_SECONDS,
+    }, indent=2))
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
@@ -0,0 +1,57 @@
+# tests/conftest.py
+# ฐานข้อมูลทดสอบ: TEST_DATABASE_URL (เช่น postgresql://.../clinic_test) หรือ SQLite ไฟล์ชั่วคราว
+# ต้องตั้ง env ก่อน import app (engine ถูกสร้างตอน import)
+# ใช้: cd clinic-backend && python -m pytest -q
+import os
+import tempfile
+
+os.environ["DATABASE_URL"] = os.getenv("TEST_DATABASE_URL") or f"sqlite:///{tempfile.mkdtemp()}/test.db"
+os.environ.pop("DATABASE_REPLICA_URL", None)
+os.environ["BCRYPT_ROUNDS"] = "4"
+os.environ["RATE_LIMIT_ENABLED"] = "false"
+os.environ["NOTIFIER"] = "memory"
+os.environ["JOBS_WORKER_ENABLED"] = "false"
+
+import asyncio
+import pytest
+
+@pytest.fixture(scope="session", autouse=True)
+def _shutdown():
+    yield
+    from app import database, hashing
+    # ปิด thread ของ aiosqlite และ process pool ของ bcrypt ไม่ให้ค้างตอนจบ
+    asyncio.run(database.async_engine.dispose())
+    hashing.shutdown()
+
+@pytest.fixture(autouse=True)
+def fresh_db():
+    """ทุก test เริ่มจากฐานข้อมูลว่าง (มีหมอเริ่มต้น) และ cache ใน process ว่าง"""
+    from app import database, manage, schedules, availability, auth, patient_search
+    database.Base.metadata.drop_all(bind=database.engine)
+    manage.init_db()
+    schedules.reload()
+    availability.clear()
+    auth.user_cache.clear()
+    auth.token_cache.clear()
+    patient_search.index.invalidate()
+    yield
+
+@pytest.fixture
+def db():
+    from app import database
+    session = database.SessionLocal()
+    yield session
+    session.close()
+
+@pytest.fixture
+def make_user():
+    """สร้างผู้ใช้ด้วย session ของตัวเอง (SQLite: session ที่เขียนถือ write lock จนจบ transaction)"""
+    from app import database, models
+
+    def make(username="patient", email=None, **fields):
+        with database.SessionLocal(expire_on_commit=False) as session:
+            user = models.User(username=username, email=email or f"{username}@example.com", **fields)
+            session.add(user)
+            session.commit()
+        return user
+    return make
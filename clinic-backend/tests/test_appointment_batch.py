@@ -0,0 +1,90 @@
+# tests/test_appointment_batch.py
+# /appointments/batch ระดับ crud: flush ครั้งเดียว, ย้อนไปใช้ savepoint เมื่อชน, ตารางสรุปรายวันตรงกับการนับจริง
+import json
+from datetime import date
+from sqlalchemy import func
+from app import crud, database, models, reports, schemas, slots
+
+DAY = date(2031, 3, 4)
+DOCTOR = "หมอสมชาย"
+
+def _batch(*operations, atomic=True):
+    return schemas.AppointmentBatch(operations=list(operations), atomic=atomic)
+
+def _create(**fields):
+    return {"op": "create", "appointment_date": DAY, "time_slot": "เช้า", "doctor_name": DOCTOR, **fields}
+
+def _times():
+    with database.SessionLocal() as check:
+        return sorted(a.appointment_time for a in check.query(models.Appointment))
+
+def test_batch_creates_distinct_seats_and_jobs(db, make_user):
+    user = make_user()
+    outcome = crud.apply_appointment_batch(db, _batch(*[_create()] * 3), user.id)
+
+    assert outcome["committed"] is True
+    booked = [r["appointment"] for r in outcome["results"]]
+    assert [a.appointment_time for a in booked] == slots.SLOT_TIMES["เช้า"][:3]
+    assert len({a.id for a in booked}) == 3
+    with database.SessionLocal() as check:
+        payloads = [json.loads(p) for p, in check.query(models.Job.payload).filter(models.Job.kind == "appointment.booked")]
+        assert sorted(p["appointment_id"] for p in payloads) == sorted(a.id for a in booked)
+        assert reports.check(check) == []
+
+def test_cancel_then_create_reuses_the_freed_seat(db, make_user):
+    user = make_user()
+    first = crud.apply_appointment_batch(db, _batch(_create()), user.id)["results"][0]["appointment"]
+
+    outcome = crud.apply_appointment_batch(db, _batch({"op": "cancel", "id": first.id}, _create()), user.id)
+
+    assert outcome["committed"] is True
+    assert outcome["results"][1]["appointment"].appointment_time == first.appointment_time
+    assert _times() == [first.appointment_time]
+
+def test_reschedule_to_the_same_slot_keeps_the_seat(db, make_user):
+    user = make_user()
+    first, second = [r["appointment"] for r in crud.apply_appointment_batch(db, _batch(_create(), _create()), user.id)["results"]]
+
+    outcome = crud.apply_appointment_batch(db, _batch(
+        {"op": "cancel", "id": first.id},
+        {"op": "reschedule", "id": second.id, "time_slot": "เช้า", "reason": "ตรวจซ้ำ"},
+    ), user.id)
+
+    assert outcome["results"][1]["appointment"].appointment_time == second.appointment_time
+    with database.SessionLocal() as check:
+        assert check.query(models.Job).filter(models.Job.kind == "appointment.rescheduled").count() == 0
+
+def test_seat_taken_after_loading_falls_back_to_savepoints(db, make_user, monkeypatch):
+    user = make_user()
+    first_time = slots.SLOT_TIMES["เช้า"][0]
+    crud.apply_appointment_batch(db, _batch(_create()), user.id)
+    # ที่นั่งที่โหลดไว้ไม่เห็นนัดที่มีอยู่แล้ว (เหมือน request อื่น commit หลังโหลด): flush รอบแรกชน unique constraint
+    monkeypatch.setattr(slots, "taken_seats_many", lambda db, keys: {key: set() for key in keys})
+
+    outcome = crud.apply_appointment_batch(db, _batch(_create(), _create()), user.id)
+
+    assert outcome["committed"] is True
+    assert [r["appointment"].appointment_time for r in outcome["results"]] == slots.SLOT_TIMES["เช้า"][1:3]
+    assert _times() == [first_time] + slots.SLOT_TIMES["เช้า"][1:3]
+    with database.SessionLocal() as check:
+        assert check.query(func.count(models.Job.id)).filter(models.Job.kind == "appointment.booked").scalar() == 3
+        assert reports.check(check) == []
+
+def test_non_atomic_batch_keeps_successful_items(db, make_user):
+    user = make_user()
+    outcome = crud.apply_appointment_batch(
+        db, _batch(_create(), {"op": "cancel", "id": 999}, _create(time_slot="บ่าย"), atomic=False), user.id,
+    )
+
+    assert outcome["committed"] is True
+    assert [r["ok"] for r in outcome["results"]] == [True, False, True]
+    assert _times() == [slots.SLOT_TIMES["เช้า"][0], slots.SLOT_TIMES["บ่าย"][0]]
+
+def test_atomic_batch_saves_nothing_on_failure(db, make_user):
+    user = make_user()
+    outcome = crud.apply_appointment_batch(db, _batch(_create(), {"op": "cancel", "id": 999}), user.id)
+
+    assert outcome["committed"] is False
+    assert _times() == []
+    with database.SessionLocal() as check:
+        assert check.query(func.count(models.Job.id)).scalar() == 0
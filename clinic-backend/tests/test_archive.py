@@ -0,0 +1,63 @@
+# tests/test_archive.py
+# ย้ายนัดเก่าไป appointments_archive: id ของนัดใหม่ต้องไม่ซ้ำกับแถวที่ย้ายไปแล้ว
+from datetime import date, datetime, time, timedelta
+import pytest
+from sqlalchemy import insert, inspect, text
+from sqlalchemy.schema import CreateTable
+from app import archive, database, manage, models
+
+sqlite_only = pytest.mark.skipif(database.engine.dialect.name != "sqlite", reason="SQLite เท่านั้น")
+
+OLD_DAY = date.today() - timedelta(days=archive.ARCHIVE_AFTER_DAYS + 10)
+
+def _add(session, appointment_date, appointment_time, **fields):
+    now = datetime.utcnow()
+    return session.execute(insert(models.Appointment).values(
+        user_id=1, doctor_id=1, doctor_name="หมอสมชาย", appointment_date=appointment_date,
+        appointment_time=appointment_time, time_slot="เช้า", status="รอการยืนยัน",
+        created_at=now, updated_at=now, **fields,
+    )).inserted_primary_key[0]
+
+def _ids(table):
+    with database.engine.connect() as conn:
+        return [row[0] for row in conn.execute(text(f"SELECT id FROM {table} ORDER BY id"))]
+
+def test_archived_ids_are_not_reused(db):
+    old = _add(db, OLD_DAY, time(8, 0))
+    db.commit()
+    assert archive.archive(db) == 1
+
+    new = _add(db, date.today(), time(8, 0))
+    db.commit()
+
+    assert _ids("appointments_archive") == [old]
+    assert new > old
+
+@sqlite_only
+def test_init_db_rebuilds_appointments_without_autoincrement(db):
+    # ตาราง appointments แบบเดิม (สร้างก่อนมี sqlite_autoincrement)
+    table = models.Appointment.__table__
+    ddl = str(CreateTable(table).compile(dialect=database.engine.dialect)).replace(" AUTOINCREMENT", "")
+    with database.engine.begin() as conn:
+        conn.execute(text("DROP TABLE appointments"))
+        conn.execute(text(ddl))
+    keep = _add(db, date.today(), time(9, 0))
+    old = _add(db, OLD_DAY, time(8, 0))
+    db.commit()
+
+    with pytest.raises(RuntimeError):
+        archive.archive(db)
+
+    manage.init_db()
+    with database.engine.connect() as conn:
+        assert not archive.reuses_ids(conn)
+        indexes = {index["name"] for index in inspect(conn).get_indexes("appointments")}
+    assert {index.name for index in table.indexes} <= indexes
+    assert _ids("appointments") == [keep, old]
+
+    # id สูงสุดถูกย้ายไปแล้ว: นัดใหม่ต้องได้ id ถัดไป ไม่ใช่ id เดิม
+    assert archive.archive(db) == 1
+    new = _add(db, date.today(), time(10, 0))
+    db.commit()
+    assert _ids("appointments_archive") == [old]
+    assert new > old
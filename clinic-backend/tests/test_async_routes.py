@@ -0,0 +1,138 @@
+# tests/test_async_routes.py
+# route นัดหมาย / ผู้ใช้แบบ async def ผ่าน HTTP (AsyncSession ทั้ง request ไม่มี session sync ปน)
+import asyncio
+from datetime import date
+import httpx
+import pytest
+from app import database, models, slots
+from app.main import app
+
+DAY = date(2031, 3, 3)
+DOCTOR = "หมอสมชาย"
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+def _client():
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test")
+
+async def _login(client, username="patient"):
+    email = f"{username}@example.com"
+    response = await client.post("/register", json={"username": username, "email": email, "password": "secret123"})
+    assert response.status_code == 200, response.text
+    response = await client.post("/login", json={"email": email, "password": "secret123"})
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+def _booking(**fields):
+    return {"appointment_date": DAY.isoformat(), "time_slot": "เช้า", "doctor_name": DOCTOR, **fields}
+
+@pytest.fixture(autouse=True)
+def no_sync_sessions(monkeypatch):
+    """route ที่แปลงแล้วต้องไม่เปิด session sync"""
+    def fail(*args, **kwargs):
+        raise AssertionError("sync session opened")
+    monkeypatch.setattr(database, "SessionLocal", fail)
+
+def test_appointment_lifecycle():
+    async def scenario():
+        async with _client() as client:
+            headers = await _login(client)
+            key = {**headers, "Idempotency-Key": "book-1"}
+
+            created = await client.post("/appointments/", json=_booking(), headers=key)
+            replayed = await client.post("/appointments/", json=_booking(), headers=key)
+            assert created.status_code == 200, created.text
+            assert replayed.json()["id"] == created.json()["id"]
+            assert replayed.headers["Idempotency-Replayed"] == "true"
+            appointment_id = created.json()["id"]
+
+            page = await client.get("/appointments/", params={"mine": True}, headers=headers)
+            fast = await client.get("/appointments/", params={"mine": True, "fast": True}, headers=headers)
+            assert [a["id"] for a in page.json()["items"]] == [appointment_id]
+            assert fast.json()["items"] == page.json()["items"]
+
+            moved = await client.put(f"/appointments/{appointment_id}", json={"time_slot": "บ่าย"}, headers=headers)
+            assert moved.json()["appointment_time"] == slots.SLOT_TIMES["บ่าย"][0].isoformat()
+            read = await client.get(f"/appointments/{appointment_id}", headers=headers)
+            assert read.json()["time_slot"] == "บ่าย"
+
+            assert (await client.delete(f"/appointments/{appointment_id}", headers=headers)).status_code == 200
+            assert (await client.delete(f"/appointments/{appointment_id}", headers=headers)).status_code == 404
+            assert (await client.put(f"/appointments/{appointment_id}", json={}, headers=headers)).status_code == 404
+    run(scenario())
+
+def test_concurrent_async_bookings_get_distinct_seats():
+    async def scenario():
+        async with _client() as client:
+            headers = await _login(client)
+            responses = await asyncio.gather(*[
+                client.post("/appointments/", json=_booking(), headers=headers) for _ in range(5)
+            ])
+            assert [r.status_code for r in responses] == [200] * 5
+            times = sorted(r.json()["appointment_time"] for r in responses)
+            assert times == [t.isoformat() for t in slots.SLOT_TIMES["เช้า"][:5]]
+
+            batch = await client.post("/appointments/batch", json={"operations": [
+                {"op": "create", **_booking()}, {"op": "cancel", "id": responses[0].json()["id"]},
+            ]}, headers=headers)
+            assert batch.json()["committed"] is True
+    run(scenario())
+
+def test_profile_and_account():
+    async def scenario():
+        async with _client() as client:
+            headers = await _login(client)
+            me = await client.get("/me", headers=headers)
+            assert me.json()["username"] == "patient"
+
+            updated = await client.put("/me/profile", json={"first_name": "สมชาย"}, headers=headers)
+            assert updated.json()["first_name"] == "สมชาย"
+            assert (await client.get("/me", headers=headers)).json()["first_name"] == "สมชาย"
+
+            await client.post("/appointments/", json=_booking(), headers=headers)
+            assert (await client.delete("/me", headers=headers)).status_code == 200
+            assert (await client.get("/me", headers=headers)).status_code == 401
+    run(scenario())
+
+    async def remaining():
+        async with database.AsyncSessionLocal() as check:
+            return (await check.execute(models.Appointment.__table__.select())).all()
+    assert run(remaining()) == []
+
+def test_read_routes_and_staff_doctor_routes(monkeypatch):
+    from app import auth
+    monkeypatch.setattr(auth, "STAFF_EMAILS", {"staff@example.com"})
+
+    async def scenario():
+        async with _client() as client:
+            headers = await _login(client)
+            staff = await _login(client, "staff")
+            await client.post("/appointments/", json=_booking(), headers=headers)
+
+            free = await client.get("/appointments/availability", params={
+                "from": DAY.isoformat(), "to": DAY.isoformat(), "doctor": DOCTOR,
+            }, headers=headers)
+            assert free.status_code == 200, free.text
+            assert slots.SLOT_TIMES["เช้า"][0].isoformat() not in free.json()[0]["slots"]["เช้า"]
+
+            page = await client.get("/bootstrap/appointments-page", params={"mine": True}, headers=headers)
+            assert page.status_code == 200, page.text
+            assert page.json()["user"]["username"] == "patient"
+
+            report = await client.get("/reports/daily", params={
+                "from": DAY.isoformat(), "to": DAY.isoformat(),
+            }, headers=staff)
+            assert report.status_code == 200, report.text
+            assert (await client.get("/reports/daily", headers=headers)).status_code == 403
+
+            created = await client.post("/doctors/", json={"name": "หมอใหม่"}, headers=staff)
+            assert created.status_code == 200, created.text
+            entry = {"weekday": DAY.weekday(), "time_slot": "เช้า", "start_time": "09:00", "last_time": "10:00"}
+            replaced = await client.put(f"/doctors/{created.json()['id']}/schedule", json=[entry], headers=staff)
+            assert replaced.status_code == 200, replaced.text
+            assert len(replaced.json()["schedules"]) == 1
+
+            assert "หมอใหม่" in (await client.get("/doctors/")).json()
+            listed = {d["name"]: d for d in (await client.get("/doctors/schedules")).json()}
+            assert len(listed["หมอใหม่"]["schedules"]) == 1
+    run(scenario())
@@ -0,0 +1,15 @@
+# tests/test_availability.py
+# cache เวลาว่างรายวัน: เกินขนาดแล้วตัดวันที่เก่าที่สุดทิ้ง
+from datetime import date, timedelta
+from app import availability
+
+DAY = date(2031, 3, 3)
+
+def test_full_cache_evicts_the_earliest_dates(db, monkeypatch):
+    monkeypatch.setattr(availability, "MAX_CACHED_DAYS", 3)
+
+    # โหลดวันหลังก่อน: ลำดับที่เก็บไม่ตรงกับลำดับวันที่
+    availability.get_availability(db, DAY + timedelta(days=2), DAY + timedelta(days=3))
+    availability.get_availability(db, DAY, DAY + timedelta(days=1))
+
+    assert sorted(availability._cache) == [DAY + timedelta(days=i) for i in (1, 2, 3)]
@@ -0,0 +1,133 @@
+# tests/test_booking_concurrency.py
+# การจองพร้อมกันหลาย thread (หลาย connection) ต้องไม่ได้ที่นั่งซ้ำ
+import threading
+from collections import Counter
+from datetime import date, datetime
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import func
+from app import crud, database, models, schedules, schemas, slots
+
+DAY = date(2031, 3, 3)
+DOCTOR = "หมอสมชาย"
+
+def _seats(db):
+    A = models.Appointment
+    return db.query(A.doctor_id, A.appointment_date, A.appointment_time, A.seat).all()
+
+def _book_concurrently(user_id, clients, doctor_name=DOCTOR):
+    barrier = threading.Barrier(clients)
+    booked, full, errors = [], [], []
+
+    def book():
+        db = database.SessionLocal()
+        try:
+            barrier.wait()
+            appointment = crud.create_appointment(
+                db, user_id, schemas.AppointmentCreate(appointment_date=DAY, time_slot="เช้า", doctor_name=doctor_name),
+            )
+            booked.append(appointment.appointment_time)
+        except HTTPException as e:
+            full.append(e.detail)
+        except Exception as e:  # ข้อผิดพลาดอื่น (เช่น IntegrityError หลุดออกมา) ทำให้ test ล้ม
+            errors.append(e)
+        finally:
+            db.close()
+
+    threads = [threading.Thread(target=book) for _ in range(clients)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return booked, full, errors
+
+def test_concurrent_bookings_never_share_a_seat(db, make_user):
+    user = make_user()
+    capacity = sum(c for _, c in schedules.get_doctor(db, name=DOCTOR).times(DAY, "เช้า"))
+    clients = capacity + 12
+
+    booked, full, errors = _book_concurrently(user.id, clients)
+
+    assert errors == []
+    assert len(booked) == capacity
+    assert full == ["เช้าเต็มแล้ว"] * (clients - capacity)
+    seats = _seats(db)
+    assert len(seats) == capacity
+    assert [key for key, n in Counter(seats).items() if n > 1] == []
+
+def test_concurrent_bookings_without_doctor_spread_over_doctors(db, make_user):
+    user = make_user()
+    capacity = sum(c for d in schedules.all_doctors(db) for _, c in d.times(DAY, "เช้า"))
+
+    booked, full, errors = _book_concurrently(user.id, capacity + 5, doctor_name=None)
+
+    assert errors == []
+    assert len(booked) == capacity and len(full) == 5
+    seats = _seats(db)
+    assert len(seats) == len(set(seats)) == capacity
+
+def _competing_booking(time_):
+    """อีก connection จองที่นั่งแรกไปแล้ว (commit)"""
+    other = database.SessionLocal()
+    try:
+        doctor = schedules.get_doctor(other, name=DOCTOR)
+        other.add(models.Appointment(
+            user_id=1, doctor_id=doctor.id, doctor_name=DOCTOR, appointment_date=DAY,
+            time_slot="เช้า", appointment_time=time_, seat=0, status="รอการยืนยัน",
+        ))
+        other.commit()
+    finally:
+        other.close()
+
+def test_seat_conflict_rolls_back_only_the_savepoint(db, make_user):
+    user = make_user()
+    first_time = slots.SLOT_TIMES["เช้า"][0]
+    _competing_booking(first_time)
+
+    # งานอื่นใน transaction เดียวกันที่ flush ไปก่อนการจอง
+    db.add(models.Job(kind="test", payload="{}", run_at=datetime.utcnow()))
+    db.flush()
+    appointment = models.Appointment(user_id=user.id, status="รอการยืนยัน")
+    doctor = schedules.get_doctor(db, name=DOCTOR)
+    # taken ว่าง = ยังไม่เห็นการจองของอีก connection: ที่นั่งแรกชน unique constraint แล้วลองที่นั่งถัดไป
+    booked_time = slots.reserve(db, appointment, DAY, "เช้า", doctor, taken=set())
+
+    assert booked_time == slots.SLOT_TIMES["เช้า"][1]
+    # savepoint ที่ล้มเหลวไม่ทำให้ transaction นอก commit หรือ rollback ไปด้วย
+    db.rollback()
+    with database.SessionLocal() as check:
+        assert check.query(func.count(models.Job.id)).scalar() == 0
+        assert [a.appointment_time for a in check.query(models.Appointment)] == [first_time]
+
+def test_seat_conflict_retry_commits_with_the_outer_transaction(db, make_user):
+    user = make_user()
+    first_time = slots.SLOT_TIMES["เช้า"][0]
+    _competing_booking(first_time)
+
+    db.add(models.Job(kind="test", payload="{}", run_at=datetime.utcnow()))
+    appointment = models.Appointment(user_id=user.id, status="รอการยืนยัน")
+    slots.reserve(db, appointment, DAY, "เช้า", schedules.get_doctor(db, name=DOCTOR), taken=set())
+    db.commit()
+
+    with database.SessionLocal() as check:
+        assert check.query(func.count(models.Job.id)).scalar() == 1
+        assert sorted(a.appointment_time for a in check.query(models.Appointment)) == slots.SLOT_TIMES["เช้า"][:2]
+
+def test_full_slot_is_rejected(db, make_user):
+    user = make_user()
+    capacity = sum(c for _, c in schedules.get_doctor(db, name=DOCTOR).times(DAY, "เช้า"))
+    for _ in range(capacity):
+        crud.create_appointment(db, user.id, schemas.AppointmentCreate(appointment_date=DAY, time_slot="เช้า", doctor_name=DOCTOR))
+    with pytest.raises(HTTPException) as e:
+        crud.create_appointment(db, user.id, schemas.AppointmentCreate(appointment_date=DAY, time_slot="เช้า", doctor_name=DOCTOR))
+    assert e.value.status_code == 400
+
+def test_rollback_after_reserve_discards_the_seat(db, make_user):
+    # SAVEPOINT แรกของ transaction: driver sqlite3 เดิม commit ทันทีตอน release ถ้าไม่ได้ BEGIN ไว้ก่อน
+    user = make_user()
+    appointment = models.Appointment(user_id=user.id, status="รอการยืนยัน")
+    slots.reserve(db, appointment, DAY, "เช้า", schedules.get_doctor(db, name=DOCTOR))
+
+    db.rollback()
+    with database.SessionLocal() as check:
+        assert check.query(func.count(models.Appointment.id)).scalar() == 0
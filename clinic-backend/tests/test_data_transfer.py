@@ -0,0 +1,107 @@
+# tests/test_data_transfer.py
+# import จากระบบเก่า: แปลง user_id ผ่าน legacy_id, แถวเสียไม่ทำให้ทั้ง batch ล้ม, ที่นั่งไม่ชนกัน
+# นัดที่ผูกกับหมอที่ไม่ออกตรวจแล้วยังแก้เหตุผลได้ แต่เลื่อนไม่ได้, export ไม่กันการเขียนระหว่างดาวน์โหลด
+import io
+import json
+from datetime import date
+import pytest
+from fastapi import HTTPException, UploadFile
+from app import crud, database, models, reports, schedules, schemas, slots
+from app.routes import data_transfer
+
+DAY = date(2031, 3, 3)
+FIRST = slots.SLOT_TIMES["เช้า"][0]
+
+def _upload(records, filename="data.ndjson"):
+    data = "".join(json.dumps(r, ensure_ascii=False) + "\n" for r in records).encode("utf-8")
+    return UploadFile(io.BytesIO(data), filename=filename)
+
+def _patient(legacy_id, username):
+    return {"id": legacy_id, "username": username, "email": f"{username}@example.com"}
+
+def _appointment(user_id, doctor_name="หมอสมชาย", appointment_time=FIRST, **fields):
+    return {
+        "id": 1, "user_id": user_id, "doctor_name": doctor_name, "appointment_date": DAY.isoformat(),
+        "appointment_time": appointment_time.isoformat(), "time_slot": "เช้า", "status": "รอการยืนยัน", **fields,
+    }
+
+def _import_patients(*records):
+    return data_transfer.import_patients(file=_upload(records), staff=None)
+
+def _import_appointments(*records):
+    return data_transfer.import_appointments(file=_upload(records), staff=None)
+
+def _appointments():
+    with database.SessionLocal() as check:
+        return check.query(models.Appointment).order_by(models.Appointment.id).all()
+
+def test_appointment_user_ids_are_translated_from_legacy_ids(make_user):
+    make_user("staff")  # ผู้ใช้เดิมในระบบใหม่: id ใหม่ของผู้ป่วยที่นำเข้าไม่ตรงกับ id เดิม
+    assert _import_patients(_patient(500, "somchai"), _patient(501, "somying"))["inserted"] == 2
+    with database.SessionLocal() as check:
+        ids = {u.legacy_id: u.id for u in check.query(models.User).filter(models.User.legacy_id.isnot(None))}
+
+    report = _import_appointments(_appointment(501), _appointment(999, appointment_time=slots.SLOT_TIMES["เช้า"][1]))
+
+    assert (report["inserted"], report["failed"]) == (1, 1)
+    assert report["errors"][0]["line"] == 2 and "999" in report["errors"][0]["error"]
+    assert [a.user_id for a in _appointments()] == [ids[501]]
+
+def test_bad_row_rejects_only_itself(make_user):
+    make_user("somchai", email="somchai@example.com")
+
+    report = _import_patients(_patient(1, "a"), _patient(2, "somchai"), _patient(3, "b"))
+
+    assert (report["inserted"], report["failed"]) == (2, 1)
+    assert [e["line"] for e in report["errors"]] == [2]
+    assert "IntegrityError" in report["errors"][0]["error"]
+    with database.SessionLocal() as check:
+        assert sorted(u.legacy_id for u in check.query(models.User) if u.legacy_id) == [1, 3]
+
+def test_same_time_rows_get_separate_seats(make_user):
+    _import_patients(_patient(7, "somchai"))
+
+    report = _import_appointments(_appointment(7), _appointment(7), _appointment(7, doctor_name="หมอที่ลาออกแล้ว"))
+    assert report["inserted"] == 3
+    # นำเข้าซ้ำ: ต่อที่นั่งจากแถวที่มีอยู่แล้ว
+    assert _import_appointments(_appointment(7))["inserted"] == 1
+
+    rows = _appointments()
+    doctors = {a.doctor_name: a.doctor_id for a in rows}
+    assert [(a.doctor_name, a.seat) for a in rows] == [
+        ("หมอสมชาย", 0), ("หมอสมชาย", 1), ("หมอที่ลาออกแล้ว", 0), ("หมอสมชาย", 2),
+    ]
+    assert doctors["หมอสมชาย"] == schedules.find_doctor(name="หมอสมชาย").id
+    with database.SessionLocal() as check:
+        assert check.get(models.Doctor, doctors["หมอที่ลาออกแล้ว"]).active is False
+        assert reports.check(check) == []
+
+def test_appointment_of_inactive_doctor_keeps_its_doctor_when_edited(db):
+    _import_patients(_patient(7, "somchai"))
+    _import_appointments(_appointment(7, doctor_name="หมอที่ลาออกแล้ว"))
+    [imported] = _appointments()
+
+    # หน้าเว็บส่ง time_slot เดิมมาด้วย: แก้เหตุผลได้ ไม่ต้องหาหมอตามชื่อ
+    edited = crud.update_appointment(db, imported.id, imported.user_id, schemas.AppointmentUpdate(time_slot="เช้า", reason="ตรวจซ้ำ"))
+    assert (edited.doctor_id, edited.reason) == (imported.doctor_id, "ตรวจซ้ำ")
+
+    with pytest.raises(HTTPException) as moved:
+        crud.update_appointment(db, imported.id, imported.user_id, schemas.AppointmentUpdate(time_slot="บ่าย"))
+    assert (moved.value.status_code, moved.value.detail) == (400, "หมอท่านนี้ไม่รับนัดแล้ว")
+    db.rollback()
+
+    # เปลี่ยนไปหาหมอที่ออกตรวจอยู่ได้
+    switched = crud.update_appointment(db, imported.id, imported.user_id, schemas.AppointmentUpdate(doctor_name="หมอสมชาย"))
+    assert switched.doctor_id == schedules.find_doctor(name="หมอสมชาย").id
+
+def test_export_does_not_block_writes_while_streaming(make_user, monkeypatch):
+    for name in ("a", "b", "c"):
+        make_user(name)
+    monkeypatch.setattr(data_transfer, "EXPORT_BATCH_SIZE", 2)
+    stream = data_transfer._stream_rows(models.User, data_transfer.PATIENT_COLUMNS, "ndjson")
+
+    first = next(stream)
+    make_user("d")  # client ยังดาวน์โหลดไม่จบ: การเขียนไม่ต้องรอ lock
+    rest = "".join(stream)
+
+    assert [json.loads(line)["username"] for line in (first + rest).splitlines()] == ["a", "b", "c", "d"]
@@ -0,0 +1,143 @@
+# tests/test_jobs.py
+# Worker.run_once กับ NOTIFIER=memory: ดึงงาน, ลองใหม่แบบ backoff, ดึงงานที่ lock หมดอายุ, ข้ามการเตือนของนัดที่เลื่อนแล้ว
+# แก้นัดโดยไม่เปลี่ยนวัน / ช่วงเวลา / หมอ ไม่สร้างงานใหม่
+import asyncio
+import json
+from datetime import date, datetime, timedelta
+import pytest
+from sqlalchemy import update
+from app import crud, database, jobs, models, schemas, slots
+
+DAY = date.today() + timedelta(days=30)  # การเตือน (24 ชม. ก่อนนัด) ยังไม่ถึงเวลา
+DOCTOR = "หมอสมชาย"
+
+@pytest.fixture(autouse=True)
+def notifier(monkeypatch):
+    memory = jobs.MemoryNotifier()
+    monkeypatch.setattr(jobs, "notifier", memory)
+    return memory
+
+def run_once(db):
+    # จบ transaction ของ test ก่อน (SQLite: worker ต้องได้ write lock)
+    db.commit()
+    return asyncio.run(jobs.Worker().run_once())
+
+def _jobs(kind):
+    with database.SessionLocal() as check:
+        return check.query(models.Job).filter(models.Job.kind == kind).order_by(models.Job.id).all()
+
+def _set_jobs(kind, **values):
+    with database.SessionLocal() as session:
+        session.execute(update(models.Job).where(models.Job.kind == kind).values(**values))
+        session.commit()
+
+def _book(db, user_id, **fields):
+    appointment = crud.create_appointment(db, user_id, schemas.AppointmentCreate(
+        appointment_date=DAY, time_slot="เช้า", doctor_name=DOCTOR, **fields,
+    ))
+    appointment_id = appointment.id
+    db.commit()  # refresh หลัง commit เปิด transaction ใหม่ไว้
+    return appointment_id
+
+def test_run_once_claims_due_jobs_only(db, make_user, notifier):
+    user = make_user()
+    appointment_id = _book(db, user.id)
+
+    assert run_once(db) == 1
+    assert [(user_id, kind) for user_id, kind, _ in notifier.sent] == [(user.id, "booked")]
+    assert notifier.sent[0][2]["appointment_id"] == appointment_id
+    [booked] = _jobs("appointment.booked")
+    assert (booked.status, booked.attempts, booked.locked_by) == ("done", 1, None)
+    [reminder] = _jobs("appointment.reminder")
+    assert reminder.status == "pending" and reminder.run_at > datetime.utcnow()
+    assert run_once(db) == 0
+
+def test_failed_job_is_retried_after_backoff(db, make_user, notifier):
+    user = make_user()
+    _book(db, user.id)
+    notifier.fail_next = 1
+    started = datetime.utcnow()
+
+    assert run_once(db) == 1
+    [job] = _jobs("appointment.booked")
+    assert (job.status, job.attempts, job.locked_by) == ("pending", 1, None)
+    assert "notifier unavailable" in job.last_error
+    delay = (job.run_at - started).total_seconds()
+    assert jobs.JOBS_BACKOFF_SECONDS * 0.5 - 1 <= delay <= jobs.JOBS_BACKOFF_SECONDS + 1
+    assert run_once(db) == 0  # ยังไม่ถึงเวลาลองใหม่
+
+    _set_jobs("appointment.booked", run_at=datetime.utcnow() - timedelta(seconds=1))
+    assert run_once(db) == 1
+    [job] = _jobs("appointment.booked")
+    assert (job.status, job.attempts) == ("done", 2)
+    assert [kind for _, kind, _ in notifier.sent] == ["booked"]
+
+def test_job_fails_after_max_attempts(db, notifier):
+    jobs.enqueue(db, "appointment.cancelled", {
+        "appointment_id": 1, "user_id": 1, "doctor_name": DOCTOR,
+        "appointment_date": DAY.isoformat(), "appointment_time": "08:00:00", "time_slot": "เช้า",
+    }, max_attempts=1)
+    notifier.fail_next = 1
+
+    assert run_once(db) == 1
+    [job] = _jobs("appointment.cancelled")
+    assert (job.status, job.attempts) == ("failed", 1)
+    assert job.finished_at is not None
+    assert run_once(db) == 0
+
+def test_stale_lock_is_reclaimed(db, make_user, notifier):
+    user = make_user()
+    _book(db, user.id)
+    # worker อื่นดึงไปแล้ว: lock ยังไม่หมดอายุ ไม่ดึงซ้ำ
+    _set_jobs("appointment.booked", status="running", locked_by="dead:1", locked_at=datetime.utcnow(), attempts=1)
+    assert run_once(db) == 0
+
+    # worker นั้นตายไป: lock เกิน JOBS_LOCK_TIMEOUT_SECONDS ดึงมาทำใหม่
+    _set_jobs("appointment.booked", locked_at=datetime.utcnow() - timedelta(seconds=jobs.JOBS_LOCK_TIMEOUT_SECONDS + 1))
+    assert run_once(db) == 1
+    [job] = _jobs("appointment.booked")
+    assert (job.status, job.attempts, job.locked_by) == ("done", 2, None)
+    assert [kind for _, kind, _ in notifier.sent] == ["booked"]
+
+def test_reminder_of_rescheduled_appointment_is_skipped(db, make_user, notifier):
+    user = make_user()
+    appointment_id = _book(db, user.id)
+    crud.update_appointment(db, appointment_id, user.id, schemas.AppointmentUpdate(time_slot="บ่าย"))
+    run_once(db)  # booked + rescheduled
+    notifier.sent.clear()
+
+    _set_jobs("appointment.reminder", run_at=datetime.utcnow() - timedelta(seconds=1))
+    assert run_once(db) == 2
+    assert [json.loads(job.payload)["time_slot"] for job in _jobs("appointment.reminder")] == ["เช้า", "บ่าย"]
+    assert all(job.status == "done" for job in _jobs("appointment.reminder"))
+    # เตือนเฉพาะเวลาใหม่ งานเตือนของเวลาเดิมจบโดยไม่ส่ง
+    assert [(kind, data["time_slot"]) for _, kind, data in notifier.sent] == [("reminder", "บ่าย")]
+
+def test_reason_only_edit_keeps_the_time_and_queues_nothing(db, make_user):
+    user = make_user()
+    first = _book(db, user.id)
+    second = _book(db, user.id)
+    crud.delete_appointment(db, first, user.id)
+    db.commit()
+    queued = len(_jobs("appointment.reminder"))
+
+    # หน้าเว็บส่ง time_slot เดิมมาด้วยเสมอ: ที่นั่งแรกว่างแล้วแต่ต้องไม่ย้ายไป
+    appointment = crud.update_appointment(db, second, user.id, schemas.AppointmentUpdate(time_slot="เช้า", reason="ปวดหัว"))
+
+    assert (appointment.appointment_time, appointment.reason) == (slots.SLOT_TIMES["เช้า"][1], "ปวดหัว")
+    db.commit()
+    assert _jobs("appointment.rescheduled") == []
+    assert len(_jobs("appointment.reminder")) == queued
+
+def test_deleting_user_notifies_cancelled_appointments(db, make_user, notifier):
+    user = make_user()
+    first = _book(db, user.id)
+    second = _book(db, user.id)
+    run_once(db)
+    notifier.sent.clear()
+
+    crud.delete_user(db, user.id)
+
+    assert sorted(json.loads(job.payload)["appointment_id"] for job in _jobs("appointment.cancelled")) == [first, second]
+    assert run_once(db) == 2
+    assert sorted(kind for _, kind, _ in notifier.sent) == ["cancelled", "cancelled"]
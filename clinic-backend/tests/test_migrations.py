@@ -0,0 +1,85 @@
+# tests/test_migrations.py
+# init-db กับตาราง appointments แบบเดิม (ก่อนมีหมอ / ที่นั่ง): ขั้น migration ใน manage.py
+from datetime import date, datetime
+from sqlalchemy import Column, Date, DateTime, Integer, MetaData, String, Table, Time, UniqueConstraint, inspect, text
+from app import crud, database, manage, models, schedules, schemas, slots
+
+DAY = date(2031, 3, 3)
+FIRST = slots.SLOT_TIMES["เช้า"][0]
+
+def _legacy_appointments(unique_date_time=True):
+    """ตาราง appointments ก่อนมี doctor_id / seat (มี unique (date, time) ตามที่เคยให้เพิ่มเอง)"""
+    constraints = [UniqueConstraint("appointment_date", "appointment_time", name="uq_appointments_date_time")] if unique_date_time else []
+    return Table(
+        "appointments", MetaData(),
+        Column("id", Integer, primary_key=True),
+        Column("user_id", Integer),
+        Column("doctor_name", String),
+        Column("appointment_date", Date),
+        Column("appointment_time", Time),
+        Column("time_slot", String),
+        Column("reason", String),
+        Column("status", String),
+        Column("created_at", DateTime),
+        Column("updated_at", DateTime),
+        *constraints,
+    )
+
+def _replace_appointments(legacy, rows):
+    now = datetime.utcnow()
+    with database.engine.begin() as conn:
+        conn.execute(text("DROP TABLE appointments"))
+        legacy.create(conn)
+        conn.execute(legacy.insert(), [
+            {"user_id": 1, "time_slot": "เช้า", "status": "รอการยืนยัน", "created_at": now, "updated_at": now, **row}
+            for row in rows
+        ])
+
+def _appointments():
+    with database.SessionLocal() as check:
+        return {a.id: a for a in check.query(models.Appointment)}
+
+def test_init_db_migrates_legacy_appointments(db, make_user):
+    user = make_user()
+    _replace_appointments(_legacy_appointments(), [
+        {"doctor_name": "หมอสมชาย", "appointment_date": DAY, "appointment_time": FIRST},
+        {"doctor_name": "หมอที่ลาออกแล้ว", "appointment_date": DAY, "appointment_time": slots.SLOT_TIMES["เช้า"][1]},
+        {"doctor_name": None, "appointment_date": DAY, "appointment_time": slots.SLOT_TIMES["เช้า"][2]},
+    ])
+
+    manage.init_db()
+    manage.init_db()  # รันซ้ำได้
+
+    columns = {c["name"]: c for c in inspect(database.engine).get_columns("appointments")}
+    uniques = {c["name"] for c in inspect(database.engine).get_unique_constraints("appointments")}
+    assert columns["doctor_id"]["nullable"] is False
+    assert "uq_appointments_date_time" not in uniques
+    assert "uq_appointments_doctor_date_time_seat" in uniques
+
+    with database.SessionLocal() as check:
+        doctors = {d.name: d for d in check.query(models.Doctor)}
+    assert doctors["หมอที่ลาออกแล้ว"].active is False
+    assert doctors[schedules.UNKNOWN_DOCTOR].active is False
+    assert {a.doctor_name: a.doctor_id for a in _appointments().values()} == {
+        "หมอสมชาย": doctors["หมอสมชาย"].id,
+        "หมอที่ลาออกแล้ว": doctors["หมอที่ลาออกแล้ว"].id,
+        None: doctors[schedules.UNKNOWN_DOCTOR].id,
+    }
+
+    # unique (date, time) เดิมหายไปแล้ว: หมออีกคนรับเวลาเดียวกันได้
+    schedules.reload()
+    booked = crud.create_appointment(db, user.id, schemas.AppointmentCreate(
+        appointment_date=DAY, time_slot="เช้า", doctor_name="หมอสมหญิง",
+    ))
+    assert booked.appointment_time == FIRST
+
+def test_init_db_gives_duplicate_legacy_times_separate_seats(db):
+    # ฐานข้อมูลเดิมที่ไม่เคยเพิ่ม unique (date, time): หมอคนเดียวกันมีนัดเวลาเดียวกันซ้ำได้
+    _replace_appointments(_legacy_appointments(unique_date_time=False), [
+        {"doctor_name": "หมอสมชาย", "appointment_date": DAY, "appointment_time": FIRST},
+        {"doctor_name": "หมอสมชาย", "appointment_date": DAY, "appointment_time": FIRST},
+    ])
+
+    manage.init_db()
+
+    assert sorted(a.seat for a in _appointments().values()) == [0, 1]
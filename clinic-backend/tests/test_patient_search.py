@@ -0,0 +1,48 @@
+# tests/test_patient_search.py
+# NgramIndex: ลำดับผลลัพธ์, การหยุดเมื่อได้ครบหน้า, คำสะกดผิดเมื่อ trigram ส่วนใหญ่พบบ่อย, อัปเดตหลัง commit
+from app import patient_search
+
+def _row(user_id, username, first_name, last_name="srisuk", domain="gmail.com"):
+    return user_id, username, f"{username}@{domain}", first_name, last_name, f"08{user_id:08d}"
+
+def _index(rows):
+    index = patient_search.NgramIndex()
+    index.build(rows)
+    return index
+
+def test_word_start_matches_rank_before_matches_inside_words():
+    index = _index([
+        _row(1, "u1", "kasomchai"),
+        _row(2, "u2", "somchai"),
+        _row(3, "u3", "malee"),
+    ])
+    assert index.search("somchai", limit=10) == ([2, 1], False)
+
+def test_common_query_stops_after_a_page(monkeypatch):
+    monkeypatch.setattr(patient_search, "SCAN_CHUNK", 4)
+    rows = [_row(i, f"u{i}", "malee") for i in range(1, 1001)]
+    rows[499] = _row(500, "u500", "gmail")  # ตรงต้นคำ แต่อยู่หลังช่วงที่ตรวจ
+    index = _index(rows)
+
+    assert index.search("gmail", limit=5) == ([500, 1, 2, 3, 4], True)
+    monkeypatch.setattr(patient_search, "SEARCH_MAX_CANDIDATES", 10)
+    # ได้ครบหน้าจาก 12 เอกสารแรกแล้ว ไม่ตรวจต่อถึง 500
+    assert index.search("gmail", limit=5) == ([1, 2, 3, 4, 5], True)
+
+def test_typo_is_found_when_most_trigrams_are_common(monkeypatch):
+    monkeypatch.setattr(patient_search, "SEARCH_COMMON_TRIGRAM_DOCS", 5)
+    index = _index(
+        [_row(i, f"u{i}", "somchai") for i in range(1, 21)] + [_row(21, "u21", "malee"), _row(22, "u22", "somsak")]
+    )
+
+    ids, _ = index.search("somchia", limit=3)
+
+    assert ids == [1, 2, 3]
+
+def test_apply_keeps_postings_in_id_order():
+    index = _index([_row(1, "u1", "somchai"), _row(5, "u5", "somchai")])
+    index.apply({3: patient_search.document(_row(3, "u3", "somchai")[1:]), 5: None})
+    index.apply({9: patient_search.document(_row(9, "u9", "somchai")[1:])})
+
+    assert index.search("somchai", limit=10) == ([1, 3, 9], False)
+    assert list(index._postings["som"]) == [1, 3, 9]
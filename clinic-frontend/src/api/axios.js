@@ -15,16 +15,48 @@ api.interceptors.request.use(config => {
     return config;
 });
 
+// ---------- ขอ access token ใหม่ด้วย refresh token ----------
+// หลาย request ได้ 401 พร้อมกัน: ใช้ promise เดียวกัน (refresh token ใช้ได้ครั้งเดียว)
+let refreshing = null;
+
+export function clearSession() {
+    localStorage.removeItem("token");
+    localStorage.removeItem("refresh_token");
+}
+
+function refreshAccessToken() {
+    if (!refreshing) {
+        const refreshToken = localStorage.getItem("refresh_token");
+        refreshing = (refreshToken
+            ? axios.post(`${api.defaults.baseURL}/token/refresh`, { refresh_token: refreshToken })
+                .then(res => {
+                    localStorage.setItem("token", res.data.access_token);
+                    localStorage.setItem("refresh_token", res.data.refresh_token);
+                })
+            : Promise.reject(new Error("no refresh token"))
+        ).finally(() => { refreshing = null; });
+    }
+    return refreshing;
+}
+
 // ---------- ดัก response เพื่อจัดการ error ----------
 api.interceptors.response.use(
     (response) => response,
-    (error) => {
-        if (error.response) {
-            if (error.response.status === 401) {
-                localStorage.removeItem("token");
-                router.push("/login");
+    async (error) => {
+        const config = error.config;
+        if (error.response && error.response.status === 401) {
+            // ลอง refresh ครั้งเดียวต่อ request แล้วส่งใหม่ (interceptor ด้านบนแนบ token ใหม่ให้)
+            if (config && !config._retried) {
+                config._retried = true;
+                try {
+                    await refreshAccessToken();
+                    return api(config);
+                } catch (refreshError) {
+                    // refresh ไม่ผ่าน: ต้อง login ใหม่
+                }
             }
-            return Promise.reject(error);
+            clearSession();
+            router.push("/login");
         }
         return Promise.reject(error);
     }